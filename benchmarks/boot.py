@@ -0,0 +1,108 @@
+"""
+Measure how long a fresh worker takes to import the app and serve its first request.
+
+    python benchmarks/boot.py --repeat 10
+    python benchmarks/boot.py --save-baseline benchmarks/boot-baseline.json
+    python benchmarks/boot.py --compare benchmarks/boot-baseline.json
+
+Each run starts a new interpreter per APP_ROLE, the way a gunicorn worker
+boots: it imports `wsgi` (which builds the app with `create_app()`), then
+requests `/` twice, the first time building the sitemap. The medians of
+`--repeat` runs are reported with the peak RSS and the number of imported
+modules.
+
+Comparing with a baseline exits with status 1 when a role's median import
+time grows by more than `--tolerance`, or when it imports more modules.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+ROLES = ["api", "admin"]
+
+CHILD = """
+import json, resource, sys, time
+started = time.perf_counter()
+import wsgi
+imported = time.perf_counter()
+client = wsgi.application.test_client()
+client.get("/")
+first = time.perf_counter()
+client.get("/")
+second = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "first_request_ms": (first - imported) * 1000,
+    "second_request_ms": (second - first) * 1000,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "modules": len(sys.modules),
+}))
+"""
+
+
+def boot_once(role):
+    env = dict(os.environ, APP_ROLE=role, DATABASE_URL="sqlite://")
+    output = subprocess.run([sys.executable, "-c", CHILD], cwd=SRC, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure(role, repeat):
+    # one warm-up run, so every measured run reads compiled .pyc files
+    boot_once(role)
+    runs = [boot_once(role) for _ in range(repeat)]
+    return {key: round(statistics.median(run[key] for run in runs), 2) for key in runs[0]}
+
+
+def print_report(reports):
+    print(f"{'role':<8} {'import ms':>10} {'1st req ms':>11} {'2nd req ms':>11} {'rss MB':>8} {'modules':>8}")
+    for role, row in reports.items():
+        print(f"{role:<8} {row['import_ms']:>10.1f} {row['first_request_ms']:>11.2f} "
+              f"{row['second_request_ms']:>11.2f} {row['rss_mb']:>8.1f} {row['modules']:>8.0f}")
+
+
+def compare(reports, baseline, tolerance):
+    regressions = []
+    for role, row in reports.items():
+        before = baseline.get(role)
+        if before is None:
+            continue
+        if row["import_ms"] > before["import_ms"] * (1 + tolerance):
+            regressions.append(f"{role}: import {before['import_ms']} -> {row['import_ms']} ms")
+        if row["modules"] > before["modules"]:
+            regressions.append(f"{role}: modules {before['modules']:.0f} -> {row['modules']:.0f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--role", choices=ROLES, action="append",
+                        help="role to measure, repeatable (default: all)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save-baseline")
+    parser.add_argument("--compare")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    reports = {role: measure(role, args.repeat) for role in args.role or ROLES}
+    print_report(reports)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as baseline_file:
+            json.dump(reports, baseline_file, indent=2)
+        print(f"\nbaseline saved to {args.save_baseline}")
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(reports, json.load(baseline_file), args.tolerance)
+        if regressions:
+            print("\nregressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("\nno regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Throughput per worker, sync WSGI (gunicorn) vs async ASGI (uvicorn).
+
+    python benchmarks/concurrency.py --levels 1,8,32,64 --requests 2000
+    python benchmarks/concurrency.py --database-url postgresql://user:pass@db/bench
+
+Both servers run a single worker against the same seeded database and
+receive the same read-only mix at each client concurrency level. A sync
+worker serves one request at a time, so its throughput flattens at
+1 / (handler + DB round trip). The async worker keeps serving requests while
+queries are in flight. The difference only shows when the database is
+across a network: against a local SQLite file there is almost no I/O wait to
+overlap.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+import seed  # noqa: E402
+import replay  # noqa: E402
+
+SERVERS = ("gunicorn", "uvicorn")
+
+
+def read_mix(volumes, count, rng):
+    mix = replay.generate_mix(volumes, count * 2, rng)
+    return [entry for entry in mix if entry["method"] == "GET"][:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    seed.add_arguments(parser)
+    parser.add_argument("--levels", default="1,8,32,64")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--database-url", help="database to seed and serve (default: temporary SQLite)")
+    args = parser.parse_args()
+
+    url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    os.environ["DATABASE_URL"] = url
+    sys.path.insert(0, replay.SRC)
+    from app import app
+    from models import db
+    with app.app_context():
+        volumes = seed.seed_from_args(db, args)
+    mix = read_mix(volumes, args.requests, random.Random(1))
+
+    print(f"{'concurrency':>11}" + "".join(f" {server + ' req/s':>15} {'p95 ms':>8}" for server in SERVERS))
+    for level in [int(level) for level in args.levels.split(",")]:
+        line = f"{level:>11}"
+        for server in SERVERS:
+            report = replay.summarize(*replay.run_server(mix, server, 1, level))
+            p95 = max(row["p95"] for row in report["endpoints"].values())
+            line += f" {report['throughput']:>15.1f} {p95:>8.1f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
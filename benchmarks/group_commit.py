@@ -0,0 +1,109 @@
+"""
+Commits per second for favorite writes, one commit per request vs group commit.
+
+    python benchmarks/group_commit.py --threads 1,8,32 --operations 2000
+    python benchmarks/group_commit.py --window-ms 5 --max-ops 128 --synchronous NORMAL
+
+Every thread adds a planet favorite for one of its own users and then
+deletes it, through the test client, until `--operations` requests were
+made. The same load runs with FAVORITE_GROUP_COMMIT off and on, and each
+run reports requests/s, database commits (counted on the engine), commits/s,
+requests per commit, p50/p95 latency and responses with an unexpected
+status.
+
+The database is a temporary SQLite file with `PRAGMA synchronous=FULL` by
+default, so every commit pays an fsync the way a durable primary does; that
+cost is what group commit spreads over a batch.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+import seed  # noqa: E402
+
+
+def worker(app, users, planets, operations, latencies, errors):
+    client = app.test_client()
+    for index in range(operations // 2):
+        user_id = users[index % len(users)]
+        path = f"/favorite/planet/{planets[index % len(planets)]}?user_id={user_id}"
+        for method, expected in (("post", 201), ("delete", 200)):
+            started = time.perf_counter()
+            status = getattr(client, method)(path).status_code
+            latencies.append((time.perf_counter() - started) * 1000)
+            if status != expected:
+                errors.append(status)
+
+
+def run(app, engine, threads, operations, volumes):
+    from sqlalchemy import event
+
+    commits = []
+    count_commit = lambda connection: commits.append(1)  # noqa: E731
+    event.listen(engine, "commit", count_commit)
+    latencies, errors = [], []
+    # users are split between threads, so no two requests toggle the same favorite
+    user_ids = list(range(1, volumes["users"] + 1))
+    planet_ids = list(range(volumes["planets"] - 99, volumes["planets"] + 1))
+    workers = [threading.Thread(target=worker, args=(app, user_ids[n::threads], planet_ids,
+                                                    operations // threads, latencies, errors))
+               for n in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    event.remove(engine, "commit", count_commit)
+    latencies.sort()
+    return {"requests_per_s": len(latencies) / elapsed, "commits": len(commits),
+            "commits_per_s": len(commits) / elapsed, "per_commit": len(latencies) / max(len(commits), 1),
+            "p50": statistics.median(latencies), "p95": latencies[int(len(latencies) * 0.95) - 1],
+            "errors": len(errors)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    seed.add_arguments(parser)
+    # seeded favorites would turn some adds into "already a favorite"
+    parser.set_defaults(favorites=0)
+    parser.add_argument("--threads", default="1,8,32")
+    parser.add_argument("--operations", type=int, default=2000, help="requests per run")
+    parser.add_argument("--window-ms", default="2")
+    parser.add_argument("--max-ops", default="64")
+    parser.add_argument("--synchronous", default="FULL", help="SQLite PRAGMA synchronous")
+    args = parser.parse_args()
+
+    os.environ.update(DATABASE_URL=f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}",
+                      SQLITE_SYNCHRONOUS=args.synchronous, GROUP_COMMIT_WINDOW_MS=args.window_ms,
+                      GROUP_COMMIT_MAX_OPS=args.max_ops)
+    from app import app
+    from models import db
+    from groupcommit import setup_group_commit
+    with app.app_context():
+        volumes = seed.seed_from_args(db, args)
+        engine = db.engine
+
+    print(f"{'threads':>7} {'mode':<12} {'req/s':>8} {'commits':>8} {'commits/s':>10} "
+          f"{'req/commit':>10} {'p50 ms':>7} {'p95 ms':>7} {'errors':>6}")
+    for threads in [int(level) for level in args.threads.split(",")]:
+        for mode in ("per-request", "group"):
+            app.extensions.pop("group_commit", None)
+            if mode == "group":
+                os.environ["FAVORITE_GROUP_COMMIT"] = "1"
+                setup_group_commit(app)
+            row = run(app, engine, threads, args.operations, volumes)
+            print(f"{threads:>7} {mode:<12} {row['requests_per_s']:>8.1f} {row['commits']:>8} "
+                  f"{row['commits_per_s']:>10.1f} {row['per_commit']:>10.1f} {row['p50']:>7.2f} "
+                  f"{row['p95']:>7.2f} {row['errors']:>6}")
+
+
+if __name__ == "__main__":
+    main()
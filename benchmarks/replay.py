@@ -0,0 +1,291 @@
+"""
+Replay a request mix against the API and report latency per endpoint.
+
+    python benchmarks/replay.py --mode inprocess --requests 2000
+    python benchmarks/replay.py --mode gunicorn --workers 4 --concurrency 16
+    python benchmarks/replay.py --save-baseline benchmarks/baseline.json
+    python benchmarks/replay.py --compare benchmarks/baseline.json
+
+A fresh SQLite database is seeded (see seed.py for the volume options). The
+mix is read from a JSONL file, one request per line:
+
+    {"method": "GET", "path": "/people?limit=50", "name": "GET /people page", "weight": 5}
+    {"method": "POST", "path": "/planet", "json": {"name": "Hoth"}}
+
+`name` (the reporting group) and `weight` are optional. Without `--mix` a
+mix covering every endpoint is generated from the seeded ids; `--write-mix`
+saves it so it can be replayed later.
+
+`inprocess` runs the app through Flask's test client, one request at a time,
+and measures handler cost. `gunicorn` starts `gunicorn wsgi --chdir src`
+(`uvicorn` starts the ASGI app, asgi.py) and sends requests over HTTP from
+`--concurrency` threads. Queries per request
+come from the Server-Timing header.
+
+Comparing with a baseline exits with status 1 when an endpoint's p95 grows
+by more than `--tolerance`, or when it issues more queries than before (on
+average, with half a query of slack).
+"""
+import argparse
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, "..", "src")
+sys.path.insert(0, HERE)
+
+import seed  # noqa: E402
+
+QUERIES_RE = re.compile(r'desc="(\d+) queries"')
+
+
+def group_name(entry):
+    if entry.get("name"):
+        return entry["name"]
+    path, _, query = entry["path"].partition("?")
+    path = re.sub(r"/\d+", "/<id>", path)
+    keys = sorted(part.split("=")[0] for part in query.split("&") if part)
+    return f"{entry['method']} {path}" + (f"?{'&'.join(keys)}" if keys else "")
+
+
+def generate_mix(volumes, count, rng):
+    users, characters, planets = volumes["users"], volumes["characters"], volumes["planets"]
+    templates = [
+        (10, lambda: {"method": "GET", "path": f"/people/{rng.randint(1, characters)}"}),
+        (10, lambda: {"method": "GET", "path": f"/planets/{rng.randint(1, planets)}"}),
+        (5, lambda: {"method": "GET", "path": "/people?limit=50"}),
+        (5, lambda: {"method": "GET", "path": "/planets?limit=50"}),
+        (3, lambda: {"method": "GET", "path": f"/planets?limit=50&after={rng.randint(1, planets)}"}),
+        (3, lambda: {"method": "GET", "path": "/people?fields=id,name&limit=200"}),
+        (3, lambda: {"method": "GET", "path": "/users?limit=50"}),
+        (8, lambda: {"method": "GET", "path": f"/users/favorites?user_id={rng.randint(1, users)}"}),
+        (1, lambda: {"method": "GET", "path": "/planets"}),
+        (1, lambda: {"method": "GET", "path": "/people"}),
+        (2, lambda: {"method": "POST",
+                     "path": f"/favorite/planet/{rng.randint(1, planets)}?user_id={rng.randint(1, users)}"}),
+        (2, lambda: {"method": "DELETE",
+                     "path": f"/favorite/planet/{rng.randint(1, planets)}?user_id={rng.randint(1, users)}"}),
+    ]
+    weights = [weight for weight, _ in templates]
+    makers = [maker for _, maker in templates]
+    return [rng.choices(makers, weights)[0]() for _ in range(count)]
+
+
+def load_mix(path, count, rng):
+    with open(path) as mix_file:
+        entries = [json.loads(line) for line in mix_file if line.strip()]
+    if not entries:
+        raise SystemExit(f"{path} has no requests")
+    weights = [entry.get("weight", 1) for entry in entries]
+    return [rng.choices(entries, weights)[0] for _ in range(count)]
+
+
+def run_inprocess(mix):
+    from app import app
+    client = app.test_client()
+    samples = []
+    started = time.perf_counter()
+    for entry in mix:
+        request_started = time.perf_counter()
+        response = client.open(entry["path"], method=entry["method"], json=entry.get("json"))
+        response.get_data()
+        samples.append((entry, time.perf_counter() - request_started,
+                        response.status_code, response.headers.get("Server-Timing", "")))
+    return samples, time.perf_counter() - started
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit("server exited during startup")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise SystemExit("server did not start in time")
+
+
+def _http(base_url, entry):
+    data = None
+    headers = {}
+    if entry.get("json") is not None:
+        data = json.dumps(entry["json"]).encode()
+        headers["Content-Type"] = "application/json"
+    request = urllib.request.Request(
+        base_url + entry["path"], data=data, headers=headers, method=entry["method"])
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request) as response:
+            response.read()
+            status, timing = response.status, response.headers.get("Server-Timing", "")
+    except urllib.error.HTTPError as error:
+        error.read()
+        status, timing = error.code, error.headers.get("Server-Timing", "")
+    return entry, time.perf_counter() - started, status, timing
+
+
+def server_command(server, port, workers, worker_class="sync"):
+    if server == "uvicorn":
+        return ["uvicorn", "asgi:app", "--app-dir", SRC, "--host", "127.0.0.1", "--port", str(port),
+                "--workers", str(workers), "--log-level", "warning", "--no-access-log"]
+    return ["gunicorn", "wsgi", "--chdir", SRC, "--bind", f"127.0.0.1:{port}",
+            "--workers", str(workers), "--worker-class", worker_class, "--log-level", "warning"]
+
+
+def run_server(mix, server, workers, concurrency, worker_class="sync"):
+    port = _free_port()
+    process = subprocess.Popen(server_command(server, port, workers, worker_class),
+                               env=os.environ.copy())
+    try:
+        _wait_for(port, process)
+        base_url = f"http://127.0.0.1:{port}"
+        with ThreadPoolExecutor(concurrency) as pool:
+            started = time.perf_counter()
+            samples = list(pool.map(lambda entry: _http(base_url, entry), mix))
+            elapsed = time.perf_counter() - started
+    finally:
+        process.terminate()
+        process.wait()
+    return samples, elapsed
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples, elapsed):
+    groups = {}
+    for entry, latency, status, timing in samples:
+        group = groups.setdefault(group_name(entry), {"latencies": [], "queries": [], "errors": 0})
+        group["latencies"].append(latency * 1000)
+        match = QUERIES_RE.search(timing)
+        if match:
+            group["queries"].append(int(match.group(1)))
+        if status >= 500:
+            group["errors"] += 1
+
+    report = {"requests": len(samples), "seconds": round(elapsed, 3),
+              "throughput": round(len(samples) / elapsed, 1) if elapsed else 0.0, "endpoints": {}}
+    for name, group in sorted(groups.items()):
+        latencies = sorted(group["latencies"])
+        queries = group["queries"]
+        report["endpoints"][name] = {
+            "count": len(latencies),
+            "errors": group["errors"],
+            "p50": round(percentile(latencies, 0.50), 2),
+            "p95": round(percentile(latencies, 0.95), 2),
+            "p99": round(percentile(latencies, 0.99), 2),
+            "queries": round(sum(queries) / len(queries), 2) if queries else None,
+        }
+    return report
+
+
+def print_report(mode, report):
+    print(f"\n== {mode}: {report['requests']} requests in {report['seconds']}s "
+          f"({report['throughput']} req/s)")
+    print(f"{'endpoint':<48} {'count':>6} {'err':>4} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'q/req':>6}")
+    for name, row in report["endpoints"].items():
+        queries = "-" if row["queries"] is None else f"{row['queries']:.1f}"
+        print(f"{name:<48} {row['count']:>6} {row['errors']:>4} {row['p50']:>8.2f} "
+              f"{row['p95']:>8.2f} {row['p99']:>8.2f} {queries:>6}")
+
+
+def compare(reports, baseline, tolerance):
+    regressions = []
+    for mode, report in reports.items():
+        for name, row in report["endpoints"].items():
+            before = baseline.get(mode, {}).get("endpoints", {}).get(name)
+            if before is None:
+                continue
+            if before["p95"] and row["p95"] > before["p95"] * (1 + tolerance):
+                regressions.append(f"{mode} {name}: p95 {before['p95']} -> {row['p95']} ms")
+            # half a query of slack: write endpoints take a different path once a row exists
+            if before["queries"] is not None and row["queries"] is not None \
+                    and row["queries"] > before["queries"] + 0.5:
+                regressions.append(f"{mode} {name}: queries {before['queries']} -> {row['queries']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    seed.add_arguments(parser)
+    parser.add_argument("--mode", choices=["inprocess", "gunicorn", "uvicorn", "both", "all"],
+                        default="inprocess")
+    parser.add_argument("--mix", help="JSONL request mix to replay")
+    parser.add_argument("--write-mix", help="save the generated mix to this file")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--worker-class", default="sync")
+    parser.add_argument("--database", help="SQLite file to seed (default: a temporary file)")
+    parser.add_argument("--save-baseline")
+    parser.add_argument("--compare")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    database = args.database or os.path.join(tempfile.mkdtemp(), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.abspath(database)}"
+    sys.path.insert(0, SRC)
+    from app import app
+    from models import db
+    with app.app_context():
+        volumes = seed.seed_from_args(db, args)
+    print(f"seeded {database}: {volumes}")
+
+    rng = random.Random(args.seed)
+    if args.mix:
+        mix = load_mix(args.mix, args.requests, rng)
+    else:
+        mix = generate_mix(volumes, args.requests, rng)
+    if args.write_mix:
+        with open(args.write_mix, "w") as mix_file:
+            mix_file.writelines(json.dumps(entry) + "\n" for entry in mix)
+
+    reports = {}
+    if args.mode in ("inprocess", "both", "all"):
+        reports["inprocess"] = summarize(*run_inprocess(mix))
+    if args.mode in ("gunicorn", "both", "all"):
+        reports[f"gunicorn-{args.worker_class}"] = summarize(
+            *run_server(mix, "gunicorn", args.workers, args.concurrency, args.worker_class))
+    if args.mode in ("uvicorn", "all"):
+        reports["uvicorn"] = summarize(*run_server(mix, "uvicorn", args.workers, args.concurrency))
+    for mode, report in reports.items():
+        print_report(mode, report)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as baseline_file:
+            json.dump(reports, baseline_file, indent=2)
+        print(f"\nbaseline saved to {args.save_baseline}")
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(reports, json.load(baseline_file), args.tolerance)
+        if regressions:
+            print("\nregressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("\nno regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Compare indexed name search with a naive LIKE '%q%' scan.
+
+    python benchmarks/search.py [rows] [repeat]
+
+Seeds `rows` characters (default 1,000,000) into an in-memory SQLite
+database, checks that both queries return the same ranked rows, then prints
+the best time of `repeat` runs for each query.
+"""
+import os
+import random
+import sys
+import time
+
+os.environ["DATABASE_URL"] = "sqlite://"
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from sqlalchemy import insert, select  # noqa: E402
+from app import app  # noqa: E402
+from models import db, Character  # noqa: E402
+from projection import columns  # noqa: E402
+import search  # noqa: E402
+
+CHUNK = 10000
+FIRST = ["Luke", "Leia", "Han", "Anakin", "Padme", "Obi-Wan", "Mace", "Kylo", "Rey", "Finn",
+         "Poe", "Jyn", "Cassian", "Orson", "Hera", "Kanan", "Ezra", "Sabine", "Ahsoka", "Din"]
+LAST = ["Skywalker", "Organa", "Solo", "Amidala", "Kenobi", "Windu", "Ren", "Dameron", "Erso",
+        "Andor", "Krennic", "Syndulla", "Jarrus", "Bridger", "Wren", "Tano", "Djarin", "Antilles"]
+QUERIES = ["Skywalker", "sky", "Windu 4242", "ahsoka tano 99999", "no such name"]
+
+
+def seed(rows):
+    rng = random.Random(42)
+    db.create_all()
+    for start in range(0, rows, CHUNK):
+        db.session.execute(insert(Character), [
+            {"name": f"{rng.choice(FIRST)} {rng.choice(LAST)} {i}", "height": "172", "mass": "77"}
+            for i in range(start, min(start + CHUNK, rows))])
+    db.session.commit()
+
+
+def naive_statement(model, q, limit):
+    # the ranked query of search.search_statement, matched with a full-table LIKE instead
+    return (select(*columns(model))
+            .where(model.name.icontains(q, autoescape=True))
+            .order_by(*search.rank_order(model, q))
+            .limit(limit))
+
+
+def run(stmt):
+    return db.session.execute(stmt).all()
+
+
+def best_of(repeat, func, *args):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    with app.app_context():
+        started = time.perf_counter()
+        seed(rows)
+        print(f"seeded {rows} characters in {time.perf_counter() - started:.1f} s")
+        for q in QUERIES:
+            indexed = search.search_statement(Character, q, search.DEFAULT_SEARCH_LIMIT,
+                                             search.session_dialect(db.session))
+            naive = naive_statement(Character, q, search.DEFAULT_SEARCH_LIMIT)
+            assert run(indexed) == run(naive), f"{q!r}: results differ"
+
+            indexed_time = best_of(repeat, run, indexed)
+            naive_time = best_of(repeat, run, naive)
+            print(f"q={q!r:<22} trigram index {indexed_time * 1000:8.1f} ms  "
+                  f"LIKE scan {naive_time * 1000:8.1f} ms  x{naive_time / indexed_time:.1f}")
+
+
+if __name__ == "__main__":
+    main()
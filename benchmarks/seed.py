@@ -0,0 +1,91 @@
+"""
+Seed a database with synthetic users, characters, planets and favorites.
+
+Shared by the benchmark scripts; run on its own to fill a database:
+
+    DATABASE_URL=sqlite:////tmp/bench.db python benchmarks/seed.py --users 1000 --characters 10000
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+CHUNK = 5000
+
+
+def _chunks(rows):
+    for start in range(0, len(rows), CHUNK):
+        yield rows[start:start + CHUNK]
+
+
+def seed(db, users=100, characters=1000, planets=1000, favorites=10, rng_seed=42):
+    """
+    Create tables and insert the requested volumes; `favorites` is per user
+    """
+    from sqlalchemy import insert
+    from models import User, Character, Planet, Favorite
+    from numeric import numeric_values
+    from favorites import reconcile_counts
+
+    rng = random.Random(rng_seed)
+    db.create_all()
+    batches = [
+        (User, [{"email": f"user{i}@example.com", "password": "secret"}
+                for i in range(users)]),
+        (Character, [{"name": f"character {i}", "gender": rng.choice(["male", "female", "n/a"]),
+                      "skin_color": "fair", "hair_color": "brown", "height": str(rng.randint(60, 250)),
+                      "eye_color": "blue", "mass": str(rng.randint(20, 200)),
+                      "homeworld": f"planet {rng.randrange(max(planets, 1))}", "birth_year": "19BBY"}
+                     for i in range(characters)]),
+        (Planet, [{"name": f"planet {i}", "climate": rng.choice(["arid", "temperate", "frozen"]),
+                   "surface_water": str(rng.randint(0, 100)), "diameter": str(rng.randint(1000, 200000)),
+                   "rotation_period": str(rng.randint(10, 50)), "gravity": "1 standard",
+                   "orbital_period": str(rng.randint(100, 1000)), "population": rng.randint(0, 10 ** 9)}
+                  for i in range(planets)]),
+    ]
+    for model, rows in batches:
+        for chunk in _chunks(rows):
+            db.session.execute(insert(model), [numeric_values(model, row) for row in chunk])
+        db.session.commit()
+
+    favorite_rows = []
+    for user_id in range(1, users + 1):
+        for planet_id in rng.sample(range(1, planets + 1), min(favorites // 2, planets)):
+            favorite_rows.append({"name": f"planet {planet_id - 1}", "user_id": user_id,
+                                  "planet_id": planet_id})
+        for character_id in rng.sample(range(1, characters + 1), min(favorites - favorites // 2, characters)):
+            favorite_rows.append({"name": f"character {character_id - 1}", "user_id": user_id,
+                                  "character_id": character_id})
+    for chunk in _chunks(favorite_rows):
+        db.session.execute(insert(Favorite), chunk)
+    reconcile_counts(db.session)
+    db.session.commit()
+    return {"users": users, "characters": characters, "planets": planets,
+            "favorites": len(favorite_rows)}
+
+
+def add_arguments(parser):
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--characters", type=int, default=1000)
+    parser.add_argument("--planets", type=int, default=1000)
+    parser.add_argument("--favorites", type=int, default=10, help="favorites per user")
+
+
+def seed_from_args(db, args):
+    return seed(db, args.users, args.characters, args.planets, args.favorites)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    add_arguments(parser)
+    args = parser.parse_args()
+    from app import app
+    from models import db
+    with app.app_context():
+        print(seed_from_args(db, args))
+
+
+if __name__ == "__main__":
+    main()
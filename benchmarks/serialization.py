@@ -0,0 +1,79 @@
+"""
+Compare the ORM + serialize() list path with the column projection + orjson path.
+
+    python benchmarks/serialization.py [rows] [repeat]
+
+Seeds an in-memory SQLite database, checks that both paths produce the same
+bytes, then prints the best time of `repeat` runs for each.
+"""
+import os
+import sys
+import time
+
+os.environ["DATABASE_URL"] = "sqlite://"
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+from sqlalchemy import insert, select  # noqa: E402
+from app import app  # noqa: E402
+from models import db, Character, Planet  # noqa: E402
+from fastjson import FastJSONProvider  # noqa: E402
+from projection import columns, row_dict  # noqa: E402
+
+
+def seed(rows):
+    db.create_all()
+    db.session.execute(insert(Character), [
+        {"name": f"character {i}", "gender": "n/a", "skin_color": "green", "hair_color": "none",
+         "height": str(100 + i % 100), "eye_color": "black", "mass": str(50 + i % 50),
+         "homeworld": "Tatooine", "birth_year": "19BBY"}
+        for i in range(rows)])
+    db.session.execute(insert(Planet), [
+        {"name": f"planet {i}", "climate": "arid", "surface_water": "1", "diameter": "10465",
+         "rotation_period": "23", "gravity": "1 standard", "orbital_period": "304",
+         "population": 200000 + i}
+        for i in range(rows)])
+    db.session.commit()
+
+
+def orm_path(model, provider):
+    rows = db.session.scalars(select(model).order_by(model.id)).all()
+    data = provider.response([row.serialize() for row in rows]).get_data()
+    db.session.expunge_all()
+    return data
+
+
+def projection_path(model, provider):
+    rows = db.session.execute(select(*columns(model)).order_by(model.id)).all()
+    return provider.response([row_dict(row) for row in rows]).get_data()
+
+
+def best_of(repeat, func, *args):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    default, fast = DefaultJSONProvider(app), FastJSONProvider(app)
+
+    with app.test_request_context():
+        seed(rows)
+        for model in (Character, Planet):
+            old = orm_path(model, default)
+            new = projection_path(model, fast)
+            assert old == new, f"{model.__name__}: output differs"
+
+            old_time = best_of(repeat, orm_path, model, default)
+            new_time = best_of(repeat, projection_path, model, fast)
+            print(f"{model.__name__:<10} {rows} rows  orm+serialize {old_time * 1000:8.1f} ms  "
+                  f"projection+orjson {new_time * 1000:8.1f} ms  x{old_time / new_time:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""name search indexes
+
+Revision ID: 2b9d4e6a1f70
+Revises: faed60d304c6
+Create Date: 2026-10-17 16:05:41.207391
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '2b9d4e6a1f70'
+down_revision = 'faed60d304c6'
+branch_labels = None
+depends_on = None
+
+TABLES = ('character', 'planet')
+
+
+def _sqlite_upgrade(table):
+    # same DDL as src/search.py, copied so the migration doesn't depend on app code
+    fts = f'{table}_name_fts'
+    op.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"name, content='{table}', content_rowid='id', tokenize='trigram')")
+    op.execute(
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON "{table}" BEGIN '
+        f'INSERT INTO {fts}(rowid, name) VALUES (new.id, new.name); END')
+    op.execute(
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON "{table}" BEGIN '
+        f"INSERT INTO {fts}({fts}, rowid, name) VALUES ('delete', old.id, old.name); END")
+    op.execute(
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF name ON "{table}" BEGIN '
+        f"INSERT INTO {fts}({fts}, rowid, name) VALUES ('delete', old.id, old.name); "
+        f'INSERT INTO {fts}(rowid, name) VALUES (new.id, new.name); END')
+    # index the existing rows
+    op.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table in TABLES:
+        if dialect == 'sqlite':
+            _sqlite_upgrade(table)
+        elif dialect == 'postgresql':
+            op.execute(
+                f'CREATE INDEX IF NOT EXISTS ix_{table}_name_trgm '
+                f'ON "{table}" USING gin (name gin_trgm_ops)')
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    for table in TABLES:
+        if dialect == 'sqlite':
+            for suffix in ('ai', 'ad', 'au'):
+                op.execute(f'DROP TRIGGER IF EXISTS {table}_name_fts_{suffix}')
+            op.execute(f'DROP TABLE IF EXISTS {table}_name_fts')
+        elif dialect == 'postgresql':
+            op.execute(f'DROP INDEX IF EXISTS ix_{table}_name_trgm')
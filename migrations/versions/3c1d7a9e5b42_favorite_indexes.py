@@ -0,0 +1,56 @@
+"""favorite indexes and per-user uniqueness
+
+Revision ID: 3c1d7a9e5b42
+Revises: f8242b5355ec
+Create Date: 2026-10-17 10:12:04.318220
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c1d7a9e5b42'
+down_revision = 'f8242b5355ec'
+branch_labels = None
+depends_on = None
+
+# the original unique constraint on favorite.name was created unnamed; on
+# SQLite batch mode can only find it through a naming convention
+naming_convention = {"uq": "uq_%(table_name)s_%(column_0_name)s"}
+
+
+def _name_constraint():
+    for constraint in sa.inspect(op.get_bind()).get_unique_constraints('favorite'):
+        if constraint['column_names'] == ['name']:
+            return constraint['name'] or 'uq_favorite_name'
+    return None
+
+
+def upgrade():
+    # keep the oldest row of any duplicate favorite so the new constraints can be built
+    op.execute(
+        "DELETE FROM favorite WHERE id NOT IN ("
+        "SELECT id FROM (SELECT MIN(id) AS id FROM favorite "
+        "GROUP BY user_id, planet_id, character_id) AS keep)"
+    )
+
+    name_constraint = _name_constraint()
+    with op.batch_alter_table('favorite', schema=None, naming_convention=naming_convention) as batch_op:
+        if name_constraint is not None:
+            batch_op.drop_constraint(name_constraint, type_='unique')
+        batch_op.create_unique_constraint(
+            'uq_favorite_user_planet', ['user_id', 'planet_id'])
+        batch_op.create_unique_constraint(
+            'uq_favorite_user_character', ['user_id', 'character_id'])
+        batch_op.create_index('ix_favorite_planet_id', ['planet_id'], unique=False)
+        batch_op.create_index('ix_favorite_character_id', ['character_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('favorite', schema=None) as batch_op:
+        batch_op.drop_index('ix_favorite_character_id')
+        batch_op.drop_index('ix_favorite_planet_id')
+        batch_op.drop_constraint('uq_favorite_user_character', type_='unique')
+        batch_op.drop_constraint('uq_favorite_user_planet', type_='unique')
+        batch_op.create_unique_constraint('uq_favorite_name', ['name'])
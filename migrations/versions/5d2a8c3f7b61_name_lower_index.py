@@ -0,0 +1,28 @@
+"""lower(name) indexes for short search terms
+
+Revision ID: 5d2a8c3f7b61
+Revises: 02b94ab52d35
+Create Date: 2026-10-17 18:12:07.531904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d2a8c3f7b61'
+down_revision = '02b94ab52d35'
+branch_labels = None
+depends_on = None
+
+TABLES = ('character', 'planet')
+
+
+def upgrade():
+    for table in TABLES:
+        op.create_index(f'ix_{table}_name_lower', table, [sa.text('lower(name)')], unique=False)
+
+
+def downgrade():
+    for table in TABLES:
+        op.drop_index(f'ix_{table}_name_lower', table_name=table)
@@ -0,0 +1,44 @@
+"""favorite counts
+
+Revision ID: f9768df1a48a
+Revises: 2b9d4e6a1f70
+Create Date: 2026-10-17 15:48:32.390398
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f9768df1a48a'
+down_revision = '2b9d4e6a1f70'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('character', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('favorite_count', sa.Integer(), server_default='0', nullable=False))
+
+    with op.batch_alter_table('planet', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('favorite_count', sa.Integer(), server_default='0', nullable=False))
+
+    # count the existing favorites, before indexing
+    for table, column in (('character', 'character_id'), ('planet', 'planet_id')):
+        op.execute(
+            f'UPDATE "{table}" SET favorite_count = '
+            f'(SELECT COUNT(*) FROM favorite WHERE favorite.{column} = "{table}".id)')
+
+    with op.batch_alter_table('character', schema=None) as batch_op:
+        batch_op.create_index('ix_character_favorite_count', ['favorite_count', 'id'], unique=False)
+
+    with op.batch_alter_table('planet', schema=None) as batch_op:
+        batch_op.create_index('ix_planet_favorite_count', ['favorite_count', 'id'], unique=False)
+
+
+def downgrade():
+    for table in ('planet', 'character'):
+        op.drop_index(f'ix_{table}_favorite_count', table_name=table)
+        # plain ALTER TABLE: batch mode would rebuild the table on SQLite and
+        # drop the name search triggers with it
+        op.execute(f'ALTER TABLE "{table}" DROP COLUMN favorite_count')
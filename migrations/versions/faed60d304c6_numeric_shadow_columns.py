@@ -0,0 +1,102 @@
+"""numeric shadow columns
+
+Revision ID: faed60d304c6
+Revises: 7e4b2f0c9a13
+Create Date: 2026-10-17 15:43:18.185709
+
+"""
+import math
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'faed60d304c6'
+down_revision = '7e4b2f0c9a13'
+branch_labels = None
+depends_on = None
+
+SHADOWS = {
+    'character': {'height': 'height_num', 'mass': 'mass_num'},
+    'planet': {'surface_water': 'surface_water_num', 'diameter': 'diameter_num',
+               'rotation_period': 'rotation_period_num', 'orbital_period': 'orbital_period_num'},
+}
+BATCH = 1000
+
+
+def _parse_number(value):
+    # same rules as src/numeric.py, copied so the migration doesn't depend on app code
+    if value is None:
+        return None
+    try:
+        number = float(str(value).strip().replace(',', ''))
+    except ValueError:
+        return None
+    return number if math.isfinite(number) else None
+
+
+def _backfill(table_name, shadows):
+    bind = op.get_bind()
+    table = sa.table(table_name, sa.column('id'),
+                     *[sa.column(name) for pair in shadows.items() for name in pair])
+    update = table.update().where(table.c.id == sa.bindparam('_id')).values(
+        {shadow: sa.bindparam(shadow) for shadow in shadows.values()})
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(table.c.id, *[table.c[field] for field in shadows])
+            .where(table.c.id > last_id).order_by(table.c.id).limit(BATCH)).all()
+        if not rows:
+            break
+        bind.execute(update, [
+            {'_id': row.id, **{shadow: _parse_number(row._mapping[field])
+                               for field, shadow in shadows.items()}}
+            for row in rows])
+        last_id = rows[-1].id
+
+
+def upgrade():
+    with op.batch_alter_table('character', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('height_num', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('mass_num', sa.Float(), nullable=True))
+
+    with op.batch_alter_table('planet', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('surface_water_num', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('diameter_num', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('rotation_period_num', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('orbital_period_num', sa.Float(), nullable=True))
+
+    # fill before indexing, so the indexes are built once instead of updated row by row
+    for table_name, shadows in SHADOWS.items():
+        _backfill(table_name, shadows)
+
+    with op.batch_alter_table('character', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_character_height_num'), ['height_num'], unique=False)
+        batch_op.create_index(batch_op.f('ix_character_mass_num'), ['mass_num'], unique=False)
+
+    with op.batch_alter_table('planet', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_planet_diameter_num'), ['diameter_num'], unique=False)
+        batch_op.create_index(batch_op.f('ix_planet_orbital_period_num'), ['orbital_period_num'], unique=False)
+        batch_op.create_index(batch_op.f('ix_planet_population'), ['population'], unique=False)
+        batch_op.create_index(batch_op.f('ix_planet_rotation_period_num'), ['rotation_period_num'], unique=False)
+        batch_op.create_index(batch_op.f('ix_planet_surface_water_num'), ['surface_water_num'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('planet', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_planet_surface_water_num'))
+        batch_op.drop_index(batch_op.f('ix_planet_rotation_period_num'))
+        batch_op.drop_index(batch_op.f('ix_planet_population'))
+        batch_op.drop_index(batch_op.f('ix_planet_orbital_period_num'))
+        batch_op.drop_index(batch_op.f('ix_planet_diameter_num'))
+        batch_op.drop_column('orbital_period_num')
+        batch_op.drop_column('rotation_period_num')
+        batch_op.drop_column('diameter_num')
+        batch_op.drop_column('surface_water_num')
+
+    with op.batch_alter_table('character', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_character_mass_num'))
+        batch_op.drop_index(batch_op.f('ix_character_height_num'))
+        batch_op.drop_column('mass_num')
+        batch_op.drop_column('height_num')
@@ -1,19 +1,267 @@
+"""
+Admin UI views that stay cheap on large tables.
+
+- Counts: the list page shows a cached row count, recounted only after the
+  table's version counter moved (see versioning.py) and at most every
+  ADMIN_COUNT_TTL seconds. On PostgreSQL, tables above ADMIN_ESTIMATE_ROWS
+  show the planner's estimate instead of a COUNT(*). Searches and filters
+  show no total, just next/previous.
+- Paging: the first and last sort keys of the page just shown are kept in
+  the session, so "next" and "previous" seek from them instead of using
+  OFFSET. Jumping to another page number still uses OFFSET.
+- Sorting is limited to indexed columns. The numeric text columns sort by
+  their parsed shadow columns.
+- Search uses the name index of search.py for 3+ characters, and an index
+  range (prefix match) otherwise and on emails.
+- Favorites load their user, planet and character in the same query, and
+  relation pickers in the forms search over AJAX instead of listing every
+  row.
+- List pages and AJAX lookups are read-only, so they go to a replica when
+  DATABASE_REPLICA_URLS is set.
+"""
 import os
-from flask_admin import Admin
-from models import db, User, Character, Planet, Favorite
+import threading
+import time
+from flask import session as flask_session
+from flask_admin import Admin, expose
 from flask_admin.contrib.sqla import ModelView
+from flask_admin.contrib.sqla.ajax import QueryAjaxModelLoader
+from sqlalchemy import func, select, text, tuple_
+from sqlalchemy.orm import joinedload
+from models import db, User, Character, Planet, Favorite
+from replicas import read_only
+from search import SEARCHED_MODELS, name_matches, prefix_match, session_dialect
+from versioning import USERS_KEY, current_version
+
+PAGES_KEY = "admin_pages"
+AJAX_PAGE_SIZE = 10
+
+_counts = {}
+_counts_lock = threading.Lock()
+
+
+def _version_key(model):
+    # users and favorites are counted per user
+    return USERS_KEY if model in (User, Favorite) else model.__tablename__
+
+
+def _estimated_rows(session, model):
+    if session.get_bind().dialect.name != "postgresql":
+        return None
+    estimate = session.scalar(text("SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:name AS regclass)"),
+                              {"name": model.__tablename__})
+    # -1 until the table is first analyzed
+    if estimate is None or estimate < int(os.getenv("ADMIN_ESTIMATE_ROWS", 100000)):
+        return None
+    return estimate
+
+
+def admin_count(session, model):
+    """
+    Row count for the list page, cached per table and refreshed after writes
+    """
+    version = current_version(session, _version_key(model))
+    now = time.monotonic()
+    with _counts_lock:
+        cached = _counts.get(model.__tablename__)
+    if cached is not None:
+        cached_version, counted_at, count = cached
+        if cached_version == version or now - counted_at < float(os.getenv("ADMIN_COUNT_TTL", 60)):
+            return count
+    count = _estimated_rows(session, model)
+    if count is None:
+        count = session.scalar(select(func.count()).select_from(model))
+    with _counts_lock:
+        _counts[model.__tablename__] = (version, now, count)
+    return count
+
+
+def indexed_search(model, column, term):
+    """
+    WHERE clause for an admin search over `column` that an index can serve
+    """
+    term = term.strip()
+    if model in SEARCHED_MODELS and column is model.name:
+        return name_matches(model, term, session_dialect(db.session))
+    return prefix_match(column, term)
+
+
+class IndexedAjaxLoader(QueryAjaxModelLoader):
+    """
+    Relation picker that searches one indexed column and shows its value
+    """
+
+    def __init__(self, name, model, field):
+        super().__init__(name, db.session, model, fields=[field], page_size=AJAX_PAGE_SIZE)
+        self.column = getattr(model, field)
+
+    def format(self, model):
+        if not model:
+            return None
+        return model.id, getattr(model, self.column.key)
+
+    def get_list(self, term, offset=0, limit=AJAX_PAGE_SIZE):
+        return (self.get_query().filter(indexed_search(self.model, self.column, term))
+                .order_by(self.model.id).offset(offset).limit(limit).all())
+
+
+class IndexedModelView(ModelView):
+    """
+    ModelView with cached counts, keyset next/previous paging, sorting on
+    indexed columns and index-backed search over `search_column`
+    """
+    page_size = 50
+    column_default_sort = ("id", True)
+    column_sortable_list = ("id",)
+    # list column -> the indexed column it sorts by
+    column_sort_by = {}
+    search_column = None
+    # relationships loaded with the list query
+    eager_relations = ()
+
+    def get_query(self):
+        query = super().get_query()
+        if self.eager_relations:
+            query = query.options(*[joinedload(getattr(self.model, name)) for name in self.eager_relations])
+        return query
+
+    def get_sortable_columns(self):
+        columns = super().get_sortable_columns()
+        for name, column in self.column_sort_by.items():
+            columns.pop(column, None)
+            columns[name] = getattr(self.model, column)
+        return columns
+
+    def search_clause(self, search):
+        return indexed_search(self.model, getattr(self.model, self.search_column), search)
+
+    def _order_columns(self, sort_column, sort_desc):
+        if sort_column not in self._sortable_columns:
+            sort_column, sort_desc = self.column_default_sort
+        column = self._sortable_columns[sort_column]
+        if column.expression.primary_key or column.expression.unique:
+            return [column], bool(sort_desc)
+        # the id breaks ties, so pages are stable and a sort key is unique
+        return [column, self.model.id], bool(sort_desc)
+
+    def _seek_bound(self, signature, page, keyset):
+        """
+        (sort key, backwards) when `page` is next to the page shown last, else None
+        """
+        shown = flask_session.get(PAGES_KEY, {}).get(self.endpoint)
+        if not keyset or not page or shown is None or shown["signature"] != signature:
+            return None
+        if page == shown["page"] + 1:
+            return shown["last"], False
+        if page == shown["page"] - 1:
+            return shown["first"], True
+        return None
+
+    def _remember_page(self, signature, page, columns, rows):
+        key = [[getattr(row, column.key) for column in columns] for row in (rows[0], rows[-1])]
+        pages = dict(flask_session.get(PAGES_KEY, {}))
+        pages[self.endpoint] = {"signature": signature, "page": page, "first": key[0], "last": key[1]}
+        flask_session[PAGES_KEY] = pages
+
+    def get_list(self, page, sort_column, sort_desc, search, filters,
+                 execute=True, page_size=None):
+        if not execute:
+            return super().get_list(page, sort_column, sort_desc, search, filters,
+                                    execute=execute, page_size=page_size)
+        page_size = page_size or self.page_size
+        query = self.get_query()
+        if search:
+            query = query.filter(self.search_clause(search))
+        if filters and self._filters:
+            query = self._apply_filters(query, None, {}, {}, filters)[0]
+        # a filtered COUNT(*) can scan the whole table; the simple pager needs none
+        count = None if search or filters else admin_count(self.session, self.model)
+
+        columns, descending = self._order_columns(sort_column, sort_desc)
+        keyset = not any(column.expression.nullable for column in columns)
+        signature = repr((sort_column, sort_desc, search, filters))
+        bound = self._seek_bound(signature, page, keyset)
+        if bound is None:
+            query = query.order_by(*[column.desc() if descending else column for column in columns])
+            rows = query.offset(page * page_size if page else 0).limit(page_size).all()
+        else:
+            values, backwards = bound
+            key = tuple_(*columns) if len(columns) > 1 else columns[0]
+            value = tuple_(*values) if len(columns) > 1 else values[0]
+            # walking back reads the previous page in reverse order, then flips it
+            downwards = descending != backwards
+            query = query.filter(key < value if downwards else key > value)
+            query = query.order_by(*[column.desc() if downwards else column for column in columns])
+            rows = query.limit(page_size).all()
+            if backwards:
+                rows.reverse()
+        if keyset and rows:
+            self._remember_page(signature, page or 0, columns, rows)
+        return count, rows
+
+    @expose('/')
+    @read_only
+    def index_view(self):
+        return super().index_view()
+
+    @expose('/ajax/lookup/')
+    @read_only
+    def ajax_lookup(self):
+        return super().ajax_lookup()
+
+
+class UserView(IndexedModelView):
+    column_exclude_list = ("password",)
+    column_sortable_list = ("id", "email")
+    column_searchable_list = ("email",)
+    search_column = "email"
+    form_excluded_columns = ("favorites",)
+
+
+class ShadowColumnsView(IndexedModelView):
+    """
+    Planets and characters. Hides the derived columns from the forms: the
+    parsed numbers are filled on save and favorite_count is kept by the
+    favorite endpoints
+    """
+    column_searchable_list = ("name",)
+    search_column = "name"
+
+    def __init__(self, model, session, **kwargs):
+        shadows = {field: shadow for field, shadow in model.numeric_fields.items() if field != shadow}
+        self.form_excluded_columns = list(shadows.values()) + ["favorite_count", "favorites"]
+        self.column_exclude_list = list(shadows.values())
+        self.column_sortable_list = ["id", "name", "favorite_count", *model.numeric_fields.values()]
+        self.column_sort_by = shadows
+        super().__init__(model, session, **kwargs)
+
+
+class FavoriteView(IndexedModelView):
+    column_list = ("id", "name", "user.email", "planet.name", "character.name")
+    column_labels = {"user.email": "User", "planet.name": "Planet", "character.name": "Character"}
+    column_filters = ("user_id", "planet_id", "character_id")
+    eager_relations = ("user", "planet", "character")
+
+    def __init__(self, model, session, **kwargs):
+        self.form_ajax_refs = {
+            "user": IndexedAjaxLoader("user", User, "email"),
+            "planet": IndexedAjaxLoader("planet", Planet, "name"),
+            "character": IndexedAjaxLoader("character", Character, "name"),
+        }
+        super().__init__(model, session, **kwargs)
+
 
 def setup_admin(app):
     app.secret_key = os.environ.get('FLASK_APP_KEY', 'sample key')
     app.config['FLASK_ADMIN_SWATCH'] = 'cerulean'
     admin = Admin(app, name='4Geeks Admin', template_mode='bootstrap3')
 
-    
-    admin.add_view(ModelView(User, db.session))
-    admin.add_view(ModelView(Planet, db.session))
-    admin.add_view(ModelView(Character, db.session))
-    admin.add_view(ModelView(Favorite, db.session))
+
+    admin.add_view(UserView(User, db.session))
+    admin.add_view(ShadowColumnsView(Planet, db.session))
+    admin.add_view(ShadowColumnsView(Character, db.session))
+    admin.add_view(FavoriteView(Favorite, db.session))
 
 
     # You can duplicate that line to add mew models
-    # admin.add_view(ModelView(YourModelName, db.session))
\ No newline at end of file
+    # admin.add_view(ModelView(YourModelName, db.session))
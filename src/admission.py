@@ -0,0 +1,303 @@
+"""
+Admission control: rate limits and in-flight caps per endpoint group.
+
+Views are put in a group with `@admitted("lists")`. Each group can have:
+
+    ADMISSION_<GROUP>_RATE         requests/s for the whole group (token bucket)
+    ADMISSION_<GROUP>_BURST        bucket size (default: one second of RATE)
+    ADMISSION_<GROUP>_CLIENT_RATE  requests/s per client
+    ADMISSION_<GROUP>_CLIENT_BURST
+    ADMISSION_<GROUP>_IN_FLIGHT    requests of the group being served at once
+
+Every route can have the same five settings for itself, named after its
+endpoint (the view function, e.g. `people` or `handle_user`):
+
+    ADMISSION_ROUTE_<ENDPOINT>_RATE, _BURST, _CLIENT_RATE, _CLIENT_BURST, _IN_FLIGHT
+
+so a burst on /people can be stopped before it drains the `lists` bucket
+that /users shares. A request must pass both its group and its route.
+
+0 or unset means no limit. Over a rate limit the request gets 429, over the
+in-flight cap 503, both at once and with `Retry-After`, so a burst of
+full-table lists can't take every worker from the cheap lookups.
+
+Clients are told apart by their address, or by the ADMISSION_CLIENT_HEADER
+request header (e.g. X-Forwarded-For behind a proxy, or an API key).
+
+State is per process by default. Set ADMISSION_STORE_URL=redis://... to
+share buckets and in-flight counts between workers and hosts (needs the
+`redis` package). Admitted and rejected counts are per process, at
+/stats/admission.
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, g, make_response, request
+from utils import APIException
+
+GROUPS = ("lists", "lookups", "writes", "bulk")
+# an in-flight slot left by a crashed process frees itself after this long (redis store)
+IN_FLIGHT_TTL = 300
+
+
+class AdmissionStore:
+    """
+    Interface for admission state backends
+    """
+
+    def take(self, key, rate, burst):
+        """
+        Take a token from bucket `key`; 0 when taken, else seconds until one is available
+        """
+        raise NotImplementedError
+
+    def enter(self, key, limit):
+        """
+        Count one more request in flight under `key`; False when `limit` is reached
+        """
+        raise NotImplementedError
+
+    def leave(self, key):
+        raise NotImplementedError
+
+
+class MemoryStore(AdmissionStore):
+    def __init__(self, max_buckets=10000):
+        self.max_buckets = max_buckets
+        self.buckets = OrderedDict()
+        self.in_flight = {}
+        self.lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            self.buckets[key] = (tokens, now)
+            # least recently used client buckets go first; a dropped bucket starts full again
+            while len(self.buckets) > self.max_buckets:
+                self.buckets.popitem(last=False)
+        return wait
+
+    def enter(self, key, limit):
+        with self.lock:
+            if self.in_flight.get(key, 0) >= limit:
+                return False
+            self.in_flight[key] = self.in_flight.get(key, 0) + 1
+            return True
+
+    def leave(self, key):
+        with self.lock:
+            self.in_flight[key] -= 1
+
+
+TAKE_SCRIPT = """
+local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+ENTER_SCRIPT = """
+local count = redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+if count > tonumber(ARGV[1]) then
+    redis.call('DECR', KEYS[1])
+    return 0
+end
+return 1
+"""
+
+
+class RedisStore(AdmissionStore):
+    def __init__(self, url, prefix="admission:"):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._take = self.client.register_script(TAKE_SCRIPT)
+        self._enter = self.client.register_script(ENTER_SCRIPT)
+
+    def take(self, key, rate, burst):
+        return float(self._take(keys=[self.prefix + key], args=[rate, burst, time.time()]))
+
+    def enter(self, key, limit):
+        return bool(self._enter(keys=[self.prefix + key], args=[limit, IN_FLIGHT_TTL]))
+
+    def leave(self, key):
+        self.client.decr(self.prefix + key)
+
+
+class Limits:
+    def __init__(self, prefix):
+        def setting(name, default=0.0):
+            return float(os.getenv(f"{prefix}_{name}", default))
+
+        self.rate = setting("RATE")
+        self.burst = setting("BURST", max(self.rate, 1))
+        self.client_rate = setting("CLIENT_RATE")
+        self.client_burst = setting("CLIENT_BURST", max(self.client_rate, 1))
+        self.in_flight = int(setting("IN_FLIGHT"))
+
+    def __bool__(self):
+        return bool(self.rate or self.client_rate or self.in_flight)
+
+    def to_dict(self):
+        return {"rate": self.rate, "burst": self.burst, "client_rate": self.client_rate,
+                "client_burst": self.client_burst, "in_flight": self.in_flight}
+
+
+def _new_counts():
+    return {"admitted": 0, "rate_limited": 0, "client_rate_limited": 0,
+            "over_in_flight": 0, "in_flight": 0}
+
+
+class AdmissionControl:
+    def __init__(self, store):
+        self.store = store
+        self.limits = {group: Limits(f"ADMISSION_{group.upper()}") for group in GROUPS}
+        # read on a route's first request; only routes with a limit are kept and counted
+        self.route_limits = {}
+        self.lock = threading.Lock()
+        self.counts = {group: _new_counts() for group in GROUPS}
+        self.route_counts = {}
+
+    def _route(self, route):
+        """
+        `route`'s key in the counts and store when it has limits, else None
+        """
+        if route is None:
+            return None
+        limits = self.route_limits.get(route)
+        if limits is None:
+            limits = Limits(f"ADMISSION_ROUTE_{route.upper()}")
+            with self.lock:
+                self.route_limits[route] = limits
+                if limits:
+                    self.route_counts.setdefault(route, _new_counts())
+        return f"route:{route}" if limits else None
+
+    def _counts(self, key):
+        if key.startswith("route:"):
+            return self.route_counts[key[len("route:"):]]
+        return self.counts[key]
+
+    def _limits(self, key):
+        if key.startswith("route:"):
+            return self.route_limits[key[len("route:"):]]
+        return self.limits[key]
+
+    def _count(self, keys, outcome, in_flight=0):
+        with self.lock:
+            for key in keys:
+                self._counts(key)[outcome] += 1
+                self._counts(key)["in_flight"] += in_flight
+
+    def _reject(self, key, outcome, status_code, retry_after, message):
+        self._count([key], outcome)
+        raise APIException(message, status_code=status_code,
+                           headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+    def admit(self, group, client, route=None):
+        """
+        Let a request of `group` (and `route`, its endpoint) in, or raise
+        429/503; call `release` with the returned keys when admitted
+        """
+        keys = [group]
+        route_key = self._route(route)
+        if route_key:
+            keys.append(route_key)
+        for key in keys:
+            limits = self._limits(key)
+            if limits.rate:
+                wait = self.store.take(f"rate:{key}", limits.rate, limits.burst)
+                if wait:
+                    self._reject(key, "rate_limited", 429, wait, "Too many requests, slow down")
+            if limits.client_rate:
+                wait = self.store.take(f"rate:{key}:{client}", limits.client_rate, limits.client_burst)
+                if wait:
+                    self._reject(key, "client_rate_limited", 429, wait, "Too many requests, slow down")
+        entered = []
+        for key in keys:
+            limits = self._limits(key)
+            if limits.in_flight and not self.store.enter(f"in_flight:{key}", limits.in_flight):
+                for held in entered:
+                    self.store.leave(f"in_flight:{held}")
+                self._reject(key, "over_in_flight", 503, 1, "Server busy, try again shortly")
+            entered.append(key)
+        self._count(keys, "admitted", in_flight=1)
+        return keys
+
+    def release(self, keys):
+        for key in keys:
+            if self._limits(key).in_flight:
+                self.store.leave(f"in_flight:{key}")
+        with self.lock:
+            for key in keys:
+                self._counts(key)["in_flight"] -= 1
+
+    def stats(self):
+        with self.lock:
+            stats = {group: {**self.counts[group], "limits": self.limits[group].to_dict()}
+                     for group in GROUPS}
+            stats["routes"] = {route: {**counts, "limits": self.route_limits[route].to_dict()}
+                               for route, counts in self.route_counts.items()}
+            return stats
+
+
+def client_key():
+    header = os.getenv("ADMISSION_CLIENT_HEADER")
+    if header and request.headers.get(header):
+        return request.headers[header].split(",")[0].strip()
+    return request.remote_addr or "unknown"
+
+
+def admitted(group):
+    """
+    Put a view in an admission group. The in-flight slot is released at
+    request teardown, or for a streamed response when the server closes
+    it, since the body is produced after teardown.
+    """
+    if group not in GROUPS:
+        raise ValueError(f"unknown admission group {group!r}")
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            control = current_app.extensions.get("admission")
+            if control is None:
+                return view(*args, **kwargs)
+            keys = control.admit(group, client_key(), request.endpoint.rpartition(".")[2])
+            g.admitted_keys = keys
+            response = make_response(view(*args, **kwargs))
+            if response.is_streamed:
+                del g.admitted_keys
+                response.call_on_close(lambda: control.release(keys))
+            return response
+        return wrapper
+    return decorator
+
+
+def _release(error=None):
+    keys = g.pop("admitted_keys", None)
+    if keys is not None:
+        current_app.extensions["admission"].release(keys)
+
+
+def setup_admission(app):
+    url = os.getenv("ADMISSION_STORE_URL")
+    app.extensions["admission"] = AdmissionControl(RedisStore(url) if url else MemoryStore())
+    app.teardown_request(_release)
@@ -1,283 +1,343 @@
 """
 This module takes care of starting the API Server, Loading the DB and Adding the endpoints
+
+`create_app()` builds the app for a role, from APP_ROLE:
+
+    admin (default)  the API and the admin UI at /admin/
+    api              the API only, for web workers that should boot fast
+
+Alembic (`flask db ...`) is only loaded when the app is created by the flask
+CLI, see commands.py.
 """
 import os
-from flask import Flask, request, jsonify, url_for
-from flask_migrate import Migrate
-from flask_swagger import swagger
+from flask import Blueprint, Flask, Response, current_app, request, jsonify, stream_with_context
 from flask_cors import CORS
 from utils import APIException, generate_sitemap
-from admin import setup_admin
-from models import db, User, Character, Favorite, Planet
+from commands import setup_commands
+from instrumentation import setup_instrumentation
+from models import db, User, Character, Planet
+from dbconfig import database_url, engine_options, pool_stats
+from replicas import read_only, setup_replicas
+from admission import admitted, setup_admission
+from pagination import flag_arg, list_response
+from projection import attach_favorites, requested_fields
+from fastjson import setup_json
+from favorites import apply_batch, favorites_version_keys, list_favorites, top_favorites
+from groupcommit import setup_group_commit, write_favorite
+from bulk import bulk_create, request_rows
+import entities
+from cache import entity_cache, get_serialized
+from search import search
+from changes import read_changes
+from export import FORMATS, export_chunks, export_filename, export_format, export_model
+from versioning import COUNTS_KEY, USERS_KEY, versioned
+from passwords import pool as password_pool
 # from models import Person
 
-app = Flask(__name__)
-app.url_map.strict_slashes = False
-
-db_url = os.getenv("DATABASE_URL")
-if db_url is not None:
-    app.config['SQLALCHEMY_DATABASE_URI'] = db_url.replace(
-        "postgres://", "postgresql://")
-else:
-    app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+APP_ROLES = ("admin", "api")
 
-MIGRATE = Migrate(app, db)
-db.init_app(app)
-CORS(app)
-setup_admin(app)
+api = Blueprint("api", __name__)
 
 # Handle/serialize errors like a JSON object
 
 
-@app.errorhandler(APIException)
+@api.app_errorhandler(APIException)
 def handle_invalid_usage(error):
-    return jsonify(error.to_dict()), error.status_code
+    return jsonify(error.to_dict()), error.status_code, error.headers
 
 # generate sitemap with all your endpoints
 
 
-@app.route('/')
+@api.route('/')
 def sitemap():
-    return generate_sitemap(app)
-
-# To create new users, characters, and planets in the table for testing (SQLAlchemy 2.0 DOES NOT SUPPORT flask_admin)
-# To create new users, characters, and planets in the table for testing (SQLAlchemy 2.0 DOES NOT SUPPORT flask_admin)
-# To create new users, characters, and planets in the table for testing (SQLAlchemy 2.0 DOES NOT SUPPORT flask_admin)
-
-
-@app.route('/user', methods=['POST'])
+    # the routes don't change once the app serves requests, so the page is built once
+    html = current_app.extensions.get("sitemap")
+    if html is None:
+        html = current_app.extensions["sitemap"] = generate_sitemap(current_app)
+    return html
+
+@api.route('/user', methods=['POST'])
+@admitted("writes")
 def create_user():
     """
     Create a new user
     """
-    request_body = request.get_json()
+    return jsonify(entities.create_user(db.session, request.get_json())), 201
 
-    # Check if required fields are provided
-    if not request_body.get("email") or not request_body.get("password"):
-        return jsonify({"message": "Email and password are required"}), 400
 
-    # Check if user with same email already exists
-    existing_user = User.query.filter_by(email=request_body["email"]).first()
-    if existing_user:
-        return jsonify({"message": "User with this email already exists"}), 400
-
-    # Create new user
-    new_user = User(
-        email=request_body["email"],
-        password=request_body["password"]
-    )
-
-    db.session.add(new_user)
-    db.session.commit()
-
-    return jsonify(new_user.serialize()), 201
+@api.route('/login', methods=['POST'])
+@admitted("writes")
+def login():
+    """
+    Check a user's email and password
+    """
+    return jsonify(entities.login(db.session, request.get_json())), 200
 
 
-@app.route('/character', methods=['POST'])
+@api.route('/character', methods=['POST'])
+@admitted("writes")
 def create_character():
     """
     Create a new character
     """
-    request_body = request.get_json()
-
-    # Check if required fields are provided
-    if not request_body.get("name"):
-        return jsonify({"message": "Character name is required"}), 400
-
-    # Check if character with same name already exists
-    existing_character = Character.query.filter_by(
-        name=request_body["name"]).first()
-    if existing_character:
-        return jsonify({"message": "Character with this name already exists"}), 400
-
-    # Create new character
-    new_character = Character(
-        name=request_body["name"],
-        gender=request_body.get("gender"),
-        skin_color=request_body.get("skin_color"),
-        hair_color=request_body.get("hair_color"),
-        height=request_body.get("height"),
-        eye_color=request_body.get("eye_color"),
-        mass=request_body.get("mass"),
-        homeworld=request_body.get("homeworld"),
-        birth_year=request_body.get("birth_year")
-    )
-
-    db.session.add(new_character)
-    db.session.commit()
+    return jsonify(entities.create_named(
+        db.session, Character, "Character", request.get_json())), 201
 
-    return jsonify(new_character.serialize()), 201
 
-
-@app.route('/planet', methods=['POST'])
+@api.route('/planet', methods=['POST'])
+@admitted("writes")
 def create_planet():
     """
     Create a new planet
     """
-    request_body = request.get_json()
-
-    # Check if required fields are provided
-    if not request_body.get("name"):
-        return jsonify({"message": "Planet name is required"}), 400
-
-    # Check if planet with same name already exists
-    existing_planet = Planet.query.filter_by(name=request_body["name"]).first()
-    if existing_planet:
-        return jsonify({"message": "Planet with this name already exists"}), 400
-
-    # Create new planet
-    new_planet = Planet(
-        name=request_body["name"],
-        climate=request_body.get("climate"),
-        surface_water=request_body.get("surface_water"),
-        diameter=request_body.get("diameter"),
-        rotation_period=request_body.get("rotation_period"),
-        gravity=request_body.get("gravity"),
-        orbital_period=request_body.get("orbital_period"),
-        population=request_body.get("population")
-    )
-
-    db.session.add(new_planet)
-    db.session.commit()
+    return jsonify(entities.create_named(
+        db.session, Planet, "Planet", request.get_json())), 201
 
-    return jsonify(new_planet.serialize()), 201
+
+@api.route('/characters/bulk', methods=['POST'])
+@admitted("bulk")
+def create_characters_bulk():
+    """
+    Create many characters from a JSON array or an NDJSON stream
+    """
+    report = bulk_create(db.session, Character, request_rows())
+    return jsonify(report.to_dict()), 200
+
+
+@api.route('/planets/bulk', methods=['POST'])
+@admitted("bulk")
+def create_planets_bulk():
+    """
+    Create many planets from a JSON array or an NDJSON stream
+    """
+    report = bulk_create(db.session, Planet, request_rows())
+    return jsonify(report.to_dict()), 200
 
 # End of POST routes to add new user, character, and planet for testing purposes
 # End of POST routes to add new user, character, and planet for testing purposes
 # End of POST routes to add new user, character, and planet for testing purposes
 
 
-@app.route('/users', methods=['GET'])
+@api.route('/users', methods=['GET'])
+@admitted("lists")
+@read_only
+@versioned(lambda: USERS_KEY)
 def handle_user():
-    users = User.query.all()
-    serialized_users = [user.serialize() for user in users]
-    return jsonify(serialized_users), 200
+    # favorites for every user in the batch in one extra SELECT ... IN, instead of one per user
+    return list_response(User, projected=True, enrich=attach_favorites)
 
 
-@app.route('/users/favorites', methods=['GET'])
+@api.route('/users/favorites', methods=['GET'])
+@admitted("lists")
+@read_only
+@versioned(lambda: favorites_version_keys(
+    request.args.get("user_id", type=int), flag_arg(request.args, "expand")))
 def handle_favorites():
-    user_id = request.args.get("user_id")
-    user = User.query.get(user_id)
-    if user is None:
-        raise APIException("User Does not exist", status_code=404)
+    user_id = request.args.get("user_id", type=int)
+    expand = flag_arg(request.args, "expand")
+    return jsonify(list_favorites(db.session, user_id, expand)), 200
 
-    favorites = Favorite.query.filter_by(user_id=user_id).all()
-    serialized_favorites = [favorite.serialize() for favorite in favorites]
 
-    return jsonify(serialized_favorites), 200
+@api.route('/users/favorites/batch', methods=['POST'])
+@admitted("writes")
+def favorites_batch():
+    """
+    Add and remove many planet/character favorites of a user in one transaction
+    """
+    user_id = request.args.get("user_id", type=int)
+    results = apply_batch(db.session, user_id, request.get_json(silent=True))
+    db.session.commit()
+    return jsonify(results), 200
 
 
-@app.route('/favorite/planet/<int:planet_id>', methods=['POST'])
+@api.route('/favorite/planet/<int:planet_id>', methods=['POST'])
+@admitted("writes")
 def favorite_planet(planet_id):
-    user_id = request.args.get("user_id")
-    user = User.query.get(user_id)
-    if user is None:
-        raise APIException("User Does not exist", status_code=404)
-
-    planet = Planet.query.get(planet_id)
-    if planet is None:
-        raise APIException("Planet Does not exist", status_code=404)
-
-    favorite = Favorite(name=planet.name, user_id=user_id, planet_id=planet_id)
-    db.session.add(favorite)
-    db.session.commit()
+    user_id = request.args.get("user_id", type=int)
+    created = write_favorite(db.session, "add", user_id, "planet", planet_id)
 
+    if not created:
+        return jsonify({"message": "planet is already a favorite"}), 200
     return jsonify({"message": "favorite planet added succesfully"}), 201
 
 
-@app.route('/favorite/people/<int:people_id>', methods=['POST'])
+@api.route('/favorite/people/<int:people_id>', methods=['POST'])
+@admitted("writes")
 def favorite_people(people_id):
-    user_id = request.args.get("user_id")
-    user = User.query.get(user_id)
-    if user is None:
-        raise APIException("User Does not exist", status_code=404)
-
-    character = Character.query.get(people_id)
-    if character is None:
-        raise APIException("character Does not exist", status_code=404)
-
-    favorite = Favorite(name=character.name,
-                        user_id=user_id, character_id=people_id)
-    db.session.add(favorite)
-    db.session.commit()
+    user_id = request.args.get("user_id", type=int)
+    created = write_favorite(db.session, "add", user_id, "character", people_id)
 
+    if not created:
+        return jsonify({"message": "character is already a favorite"}), 200
     return jsonify({"message": "favorite character added succesfully"}), 201
 
 
-@app.route('/favorite/people/<int:people_id>', methods=['DELETE'])
+@api.route('/favorite/people/<int:people_id>', methods=['DELETE'])
+@admitted("writes")
 def favorite_delete(people_id):
-    user_id = request.args.get("user_id")
-    user = User.query.get(user_id)
-    if user is None:
-        # raise APIException("User Does not exist", status_code=404)
-        return jsonify({"message": "User does not exist"}), 404
-
-    favorite = Favorite.query.filter_by(
-        user_id=user_id, character_id=people_id).first()
-    if favorite is None:
-        # raise APIException("favorite character Does not exist", status_code=404)
-        return jsonify({"message": "Favorite character does not exist"}), 404
-
-    db.session.delete(favorite)
-    db.session.commit()
+    user_id = request.args.get("user_id", type=int)
+    deleted = write_favorite(db.session, "remove", user_id, "character", people_id)
 
+    if not deleted:
+        return jsonify({"message": "Favorite character does not exist"}), 404
     return jsonify({"message": "favorite character deleted succesfully"}), 200
 
 
-@app.route('/favorite/planet/<int:planet_id>', methods=['DELETE'])
+@api.route('/favorite/planet/<int:planet_id>', methods=['DELETE'])
+@admitted("writes")
 def favorite_planet_delete(planet_id):
-    user_id = request.args.get("user_id")
-    user = User.query.get(user_id)
-    if user is None:
-        return jsonify({"message": "User does not exist"}), 404
-        # raise APIException("User Does not exist", status_code=404)
-
-    favorite = Favorite.query.filter_by(
-        user_id=user_id, planet_id=planet_id).first()
-    if favorite is None:
-        # raise APIException(
-            # "favorite character Does not exist", status_code=404)
-        return jsonify({"message": "Favorite planet does not exist"}), 404    
-
-    db.session.delete(favorite)
-    db.session.commit()
+    user_id = request.args.get("user_id", type=int)
+    deleted = write_favorite(db.session, "remove", user_id, "planet", planet_id)
 
+    if not deleted:
+        return jsonify({"message": "Favorite planet does not exist"}), 404
     return jsonify({"message": "favorite planet deleted succesfully"}), 200
 
 
-@app.route('/people/<int:people_id>', methods=['GET'])
+@api.route('/people/<int:people_id>', methods=['GET'])
+@admitted("lookups")
+@read_only
 def handle_people_id(people_id):
-    person = Character.query.get(people_id)
+    person = get_serialized(db.session, Character, people_id, requested_fields(Character))
     if person is None:
         raise APIException("Character Does not exist", status_code=404)
 
-    return jsonify(person.serialize()), 200
+    return jsonify(person), 200
 
 
-@app.route('/planets/<int:planet_id>', methods=['GET'])
+@api.route('/planets/<int:planet_id>', methods=['GET'])
+@admitted("lookups")
+@read_only
 def handle_planet_id(planet_id):
-    planet = Planet.query.get(planet_id)
+    planet = get_serialized(db.session, Planet, planet_id, requested_fields(Planet))
     if planet is None:
         raise APIException("Planet Does not exist", status_code=404)
 
-    return jsonify(planet.serialize()), 200
+    return jsonify(planet), 200
 
 
-@app.route('/planets', methods=['GET'])
-def planets():
-    all_planets = Planet.query.all()
-    serialized_planets = [planet.serialize() for planet in all_planets]
+@api.route('/planets/top', methods=['GET'])
+@admitted("lookups")
+@read_only
+@versioned(lambda: (COUNTS_KEY, "planet"))
+def top_planets():
+    return jsonify(top_favorites(db.session, "planet", request.args)), 200
+
+
+@api.route('/people/top', methods=['GET'])
+@admitted("lookups")
+@read_only
+@versioned(lambda: (COUNTS_KEY, "character"))
+def top_people():
+    return jsonify(top_favorites(db.session, "character", request.args)), 200
 
-    return jsonify(serialized_planets), 200
+
+@api.route('/planets', methods=['GET'])
+@admitted("lists")
+@read_only
+@versioned(lambda: "planet")
+def planets():
+    return list_response(Planet, projected=True, fields=requested_fields(Planet))
 
 
-@app.route('/people', methods=['GET'])
+@api.route('/people', methods=['GET'])
+@admitted("lists")
+@read_only
+@versioned(lambda: "character")
 def people():
-    people = Character.query.all()
-    serialized_people = [person.serialize() for person in people]
+    return list_response(Character, projected=True, fields=requested_fields(Character))
+
+
+@api.route('/search', methods=['GET'])
+@admitted("lists")
+@read_only
+@versioned(lambda: ("character", "planet"))
+def handle_search():
+    """
+    Characters and planets whose name contains `q`, best matches first
+    """
+    return jsonify(search(db.session, request.args)), 200
+
 
-    return jsonify(serialized_people), 200
+@api.route('/changes', methods=['GET'])
+@admitted("lists")
+@read_only
+def handle_changes():
+    """
+    Upserts and tombstones after the `since` cursor, oldest first
+    """
+    return jsonify(read_changes(db.session, request.args)), 200
+
+
+@api.route('/export/<table>', methods=['GET'])
+@admitted("lists")
+@read_only
+def export_table(table):
+    """
+    Stream a whole table as NDJSON or CSV (`?format=csv`), gzipped with `?gzip=1`
+    """
+    model = export_model(table)
+    fmt = export_format(request.args.get("format"))
+    gzipped = flag_arg(request.args, "gzip")
+    response = Response(
+        stream_with_context(export_chunks(db.session, model, fmt, gzipped)),
+        mimetype="application/gzip" if gzipped else FORMATS[fmt])
+    response.headers["Content-Disposition"] = (
+        f'attachment; filename="{export_filename(table, fmt, gzipped)}"')
+    return response
+
+
+@api.route('/stats/cache', methods=['GET'])
+def cache_stats():
+    return jsonify(entity_cache.stats()), 200
+
+
+@api.route('/stats/admission', methods=['GET'])
+def admission_stats():
+    return jsonify(current_app.extensions["admission"].stats()), 200
+
+
+@api.route('/stats/pool', methods=['GET'])
+def handle_pool_stats():
+    stats = pool_stats(db.engine)
+    stats["password_hashing"] = password_pool.stats()
+    if "group_commit" in current_app.extensions:
+        stats["group_commit"] = current_app.extensions["group_commit"].stats()
+    if "replicas" in current_app.extensions:
+        stats["replication"] = current_app.extensions["replicas"].stats()
+    return jsonify(stats), 200
+
+
+def create_app(role=None):
+    role = role or os.environ.get("APP_ROLE", "admin")
+    if role not in APP_ROLES:
+        raise ValueError(f"APP_ROLE must be one of {', '.join(APP_ROLES)}, not {role!r}")
+
+    app = Flask(__name__)
+    app.url_map.strict_slashes = False
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url()
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(
+        app.config['SQLALCHEMY_DATABASE_URI'])
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    db.init_app(app)
+    setup_replicas(app)
+    setup_json(app)
+    setup_instrumentation(app)
+    setup_admission(app)
+    setup_group_commit(app)
+    CORS(app)
+    app.register_blueprint(api)
+    if role == "admin":
+        # flask_admin and its views are imported only by the role that serves them
+        from admin import setup_admin
+        setup_admin(app)
+    setup_commands(app)
+    return app
+
+
+app = create_app()
 
 
 # this only runs if `$ python src/app.py` is executed
@@ -0,0 +1,397 @@
+"""
+ASGI entry point: the API from app.py served on an async SQLAlchemy engine.
+
+    uvicorn asgi:app --app-dir src --workers 2
+
+Routes, validation, serialization and error payloads are shared with the
+Flask app. The DB helpers take a session as their first argument and run
+here through `AsyncSession.run_sync`, so the same code and the same session
+hooks (cache invalidation, version counters) apply. The admin UI and
+migrations stay with the Flask app.
+
+The engine URL comes from ASYNC_DATABASE_URL, or from DATABASE_URL with its
+driver swapped for an async one (asyncpg, aiosqlite); other databases need
+ASYNC_DATABASE_URL with an installed async driver.
+"""
+import json
+import os
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from starlette.applications import Starlette
+from starlette.responses import HTMLResponse, Response, StreamingResponse
+from starlette.routing import Route
+from werkzeug.http import parse_etags, quote_etag
+from utils import APIException
+from models import User, Character, Planet
+from dbconfig import database_url, engine_options, pool_stats
+from pagination import (STREAM_BATCH_SIZE, after_arg, cursor_for, filtered_statement, flag_arg,
+                        keyset_parts, page_args, serialize_batch, wants_page, wants_stream)
+from projection import attach_favorites, requested_fields, row_dict
+from fastjson import compact_dumps
+from favorites import (add_favorite, apply_batch, favorites_version_keys, list_favorites,
+                       remove_favorite, top_favorites)
+from bulk import NDJSON_TYPES, bulk_create, ndjson_rows
+from cache import entity_cache, get_serialized
+from search import search
+from changes import read_changes
+from export import (FORMATS, ExportEncoder, export_filename, export_format, export_model,
+                    export_statement)
+from versioning import COUNTS_KEY, USERS_KEY, current_etag
+from passwords import hash_password_async, pool as password_pool, verify_password_async
+import entities
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def async_database_url():
+    url = os.getenv("ASYNC_DATABASE_URL")
+    if url:
+        return url
+    scheme, _, rest = database_url().partition("://")
+    return f"{ASYNC_DRIVERS.get(scheme.split('+')[0], scheme)}://{rest}"
+
+
+engine = create_async_engine(
+    async_database_url(), **engine_options(async_database_url(), is_async=True))
+Session = async_sessionmaker(engine, expire_on_commit=False)
+
+
+class APIResponse(Response):
+    """
+    JSON response with the exact bytes `jsonify` writes
+    """
+    media_type = "application/json"
+
+    def render(self, content):
+        return (compact_dumps(content) + "\n").encode()
+
+
+def _user_id(request):
+    try:
+        return int(request.query_params["user_id"])
+    except (KeyError, ValueError):
+        return None
+
+
+async def _body(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+async def handle_invalid_usage(request, error):
+    return APIResponse(error.to_dict(), status_code=error.status_code, headers=error.headers)
+
+
+async def sitemap(request):
+    links = [route.path for route in request.app.routes
+             if "GET" in route.methods and "{" not in route.path]
+    items = "".join(f"<li><a href='{link}'>{link}</a></li>" for link in links)
+    return HTMLResponse(f"<h1>API (async)</h1><ul>{items}</ul>")
+
+
+async def _conditional(request, session, version_key):
+    """
+    ETag header for `version_key`, and a 304 response if the client already has it
+    """
+    etag = await session.run_sync(current_etag, version_key)
+    headers = {"ETag": quote_etag(etag)}
+    if parse_etags(request.headers.get("if-none-match")).contains(etag):
+        return headers, Response(status_code=304, headers=headers)
+    return headers, None
+
+
+async def _list(request, model, version_key, fields=None, enrich=None):
+    args = request.query_params
+    async with Session() as session:
+        headers, not_modified = await _conditional(request, session, version_key)
+        if not_modified:
+            return not_modified
+
+        stmt, sort = filtered_statement(model, args, projected=True, fields=fields,
+                                        dialect=engine.dialect.name)
+        if wants_stream(args):
+            parts = keyset_parts(stmt, model, after_arg(args, sort), sort)
+            return StreamingResponse(_stream(parts, enrich), media_type="application/json",
+                                     headers=headers)
+
+        if not wants_page(args):
+            rows = []
+            for part in keyset_parts(stmt, model, None, sort):
+                rows += (await session.execute(part)).all()
+            items = await session.run_sync(serialize_batch, rows, row_dict, enrich)
+            return APIResponse(items, headers=headers)
+
+        limit, after = page_args(args, sort)
+        rows = []
+        for part in keyset_parts(stmt, model, after, sort):
+            rows += (await session.execute(part.limit(limit + 1 - len(rows)))).all()
+            if len(rows) > limit:
+                break
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        items = await session.run_sync(serialize_batch, rows, row_dict, enrich)
+    if has_more:
+        cursor = cursor_for(rows[-1], sort)
+        next_url = request.url.include_query_params(after=cursor, limit=limit)
+        headers["Link"] = f'<{next_url.path}?{next_url.query}>; rel="next"'
+        headers["X-Next-Cursor"] = str(cursor)
+    return APIResponse(items, headers=headers)
+
+
+async def _stream(parts, enrich):
+    async with Session() as session:
+        yield "["
+        first = True
+        for stmt in parts:
+            result = await session.stream(stmt.execution_options(yield_per=STREAM_BATCH_SIZE))
+            async for rows in result.partitions():
+                for item in await session.run_sync(serialize_batch, rows, row_dict, enrich):
+                    if not first:
+                        yield ","
+                    first = False
+                    yield compact_dumps(item)
+        yield "]"
+
+
+async def handle_user(request):
+    return await _list(request, User, USERS_KEY, enrich=attach_favorites)
+
+
+async def planets(request):
+    return await _list(request, Planet, "planet", fields=requested_fields(Planet, request.query_params))
+
+
+async def people(request):
+    return await _list(request, Character, "character",
+                       fields=requested_fields(Character, request.query_params))
+
+
+async def _top(request, kind):
+    async with Session() as session:
+        headers, not_modified = await _conditional(request, session, (COUNTS_KEY, kind))
+        if not_modified:
+            return not_modified
+        items = await session.run_sync(top_favorites, kind, request.query_params)
+    return APIResponse(items, headers=headers)
+
+
+async def top_planets(request):
+    return await _top(request, "planet")
+
+
+async def top_people(request):
+    return await _top(request, "character")
+
+
+async def _by_id(request, model, label):
+    fields = requested_fields(model, request.query_params)
+    async with Session() as session:
+        payload = await session.run_sync(
+            get_serialized, model, request.path_params["id"], fields)
+    if payload is None:
+        raise APIException(f"{label} Does not exist", status_code=404)
+    return APIResponse(payload)
+
+
+async def handle_people_id(request):
+    return await _by_id(request, Character, "Character")
+
+
+async def handle_planet_id(request):
+    return await _by_id(request, Planet, "Planet")
+
+
+async def handle_favorites(request):
+    user_id = _user_id(request)
+    expand = flag_arg(request.query_params, "expand")
+    async with Session() as session:
+        headers, not_modified = await _conditional(
+            request, session, favorites_version_keys(user_id, expand))
+        if not_modified:
+            return not_modified
+        favorites = await session.run_sync(list_favorites, user_id, expand)
+    return APIResponse(favorites, headers=headers)
+
+
+async def create_user(request):
+    body = await _body(request)
+    password = body.get("password") if isinstance(body, dict) else None
+    # hashed in the pool while the loop serves other requests; run_sync would block it
+    password_hash = await hash_password_async(password) if isinstance(password, str) and password else None
+    async with Session() as session:
+        payload = await session.run_sync(entities.create_user, body, password_hash)
+    return APIResponse(payload, status_code=201)
+
+
+async def login(request):
+    body = await _body(request)
+    async with Session() as session:
+        user_id, stored = await session.run_sync(entities.login_row, body)
+    matches, replacement = await verify_password_async(stored, body["password"]) if stored else (False, None)
+    if not matches:
+        raise APIException("Invalid email or password", status_code=401)
+    async with Session() as session:
+        payload = await session.run_sync(entities.finish_login, user_id, stored, replacement)
+    return APIResponse(payload)
+
+
+async def create_character(request):
+    body = await _body(request)
+    async with Session() as session:
+        payload = await session.run_sync(entities.create_named, Character, "Character", body)
+    return APIResponse(payload, status_code=201)
+
+
+async def create_planet(request):
+    body = await _body(request)
+    async with Session() as session:
+        payload = await session.run_sync(entities.create_named, Planet, "Planet", body)
+    return APIResponse(payload, status_code=201)
+
+
+async def _bulk(request, model):
+    body = await request.body()
+    if request.headers.get("content-type", "").split(";")[0].strip() in NDJSON_TYPES:
+        rows = ndjson_rows(body.splitlines())
+    else:
+        try:
+            rows = json.loads(body)
+        except ValueError:
+            rows = None
+        if not isinstance(rows, list):
+            raise APIException("Expected a JSON array or an NDJSON body", status_code=400)
+    async with Session() as session:
+        report = await session.run_sync(bulk_create, model, rows)
+    return APIResponse(report.to_dict())
+
+
+async def create_characters_bulk(request):
+    return await _bulk(request, Character)
+
+
+async def create_planets_bulk(request):
+    return await _bulk(request, Planet)
+
+
+async def _add_favorite(request, kind):
+    async with Session() as session:
+        created = await session.run_sync(
+            add_favorite, _user_id(request), kind, request.path_params["id"])
+        await session.commit()
+    if not created:
+        return APIResponse({"message": f"{kind} is already a favorite"})
+    return APIResponse({"message": f"favorite {kind} added succesfully"}, status_code=201)
+
+
+async def _remove_favorite(request, kind):
+    async with Session() as session:
+        deleted = await session.run_sync(
+            remove_favorite, _user_id(request), kind, request.path_params["id"])
+        await session.commit()
+    if not deleted:
+        return APIResponse({"message": f"Favorite {kind} does not exist"}, status_code=404)
+    return APIResponse({"message": f"favorite {kind} deleted succesfully"})
+
+
+async def favorites_batch(request):
+    body = await _body(request)
+    async with Session() as session:
+        results = await session.run_sync(apply_batch, _user_id(request), body)
+        await session.commit()
+    return APIResponse(results)
+
+
+async def favorite_planet(request):
+    return await _add_favorite(request, "planet")
+
+
+async def favorite_people(request):
+    return await _add_favorite(request, "character")
+
+
+async def favorite_delete(request):
+    return await _remove_favorite(request, "character")
+
+
+async def favorite_planet_delete(request):
+    return await _remove_favorite(request, "planet")
+
+
+async def handle_search(request):
+    async with Session() as session:
+        headers, not_modified = await _conditional(request, session, ("character", "planet"))
+        if not_modified:
+            return not_modified
+        results = await session.run_sync(search, request.query_params)
+    return APIResponse(results, headers=headers)
+
+
+async def handle_changes(request):
+    async with Session() as session:
+        changes = await session.run_sync(read_changes, request.query_params)
+    return APIResponse(changes)
+
+
+async def export_table(request):
+    table = request.path_params["table"]
+    model = export_model(table)
+    fmt = export_format(request.query_params.get("format"))
+    gzipped = flag_arg(request.query_params, "gzip")
+
+    async def generate():
+        encoder = ExportEncoder(model, fmt, gzipped)
+        yield encoder.start()
+        async with Session() as session:
+            result = await session.stream(export_statement(model))
+            async for rows in result.partitions():
+                yield encoder.encode(rows)
+        yield encoder.finish()
+
+    headers = {"Content-Disposition": f'attachment; filename="{export_filename(table, fmt, gzipped)}"'}
+    return StreamingResponse(generate(), headers=headers,
+                             media_type="application/gzip" if gzipped else FORMATS[fmt])
+
+
+async def cache_stats(request):
+    return APIResponse(entity_cache.stats())
+
+
+async def handle_pool_stats(request):
+    stats = pool_stats(engine.sync_engine)
+    stats["password_hashing"] = password_pool.stats()
+    return APIResponse(stats)
+
+
+routes = [
+    Route("/", sitemap),
+    Route("/user", create_user, methods=["POST"]),
+    Route("/login", login, methods=["POST"]),
+    Route("/character", create_character, methods=["POST"]),
+    Route("/planet", create_planet, methods=["POST"]),
+    Route("/characters/bulk", create_characters_bulk, methods=["POST"]),
+    Route("/planets/bulk", create_planets_bulk, methods=["POST"]),
+    Route("/users", handle_user, methods=["GET"]),
+    Route("/users/favorites", handle_favorites, methods=["GET"]),
+    Route("/users/favorites/batch", favorites_batch, methods=["POST"]),
+    Route("/favorite/planet/{id:int}", favorite_planet, methods=["POST"]),
+    Route("/favorite/people/{id:int}", favorite_people, methods=["POST"]),
+    Route("/favorite/people/{id:int}", favorite_delete, methods=["DELETE"]),
+    Route("/favorite/planet/{id:int}", favorite_planet_delete, methods=["DELETE"]),
+    Route("/people/{id:int}", handle_people_id, methods=["GET"]),
+    Route("/planets/{id:int}", handle_planet_id, methods=["GET"]),
+    Route("/planets/top", top_planets, methods=["GET"]),
+    Route("/people/top", top_people, methods=["GET"]),
+    Route("/planets", planets, methods=["GET"]),
+    Route("/people", people, methods=["GET"]),
+    Route("/search", handle_search, methods=["GET"]),
+    Route("/changes", handle_changes, methods=["GET"]),
+    Route("/export/{table}", export_table, methods=["GET"]),
+    Route("/stats/cache", cache_stats, methods=["GET"]),
+    Route("/stats/pool", handle_pool_stats, methods=["GET"]),
+]
+
+app = Starlette(routes=routes, exception_handlers={APIException: handle_invalid_usage})
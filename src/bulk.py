@@ -0,0 +1,165 @@
+"""
+Bulk ingestion of characters and planets.
+
+Rows arrive as a JSON array or as NDJSON (one object per line, read from the
+request stream) and are processed in chunks: validate, look up which names
+already exist with one `IN` query, then insert the rest with a single
+executemany and commit. A chunk never holds more than `BULK_CHUNK_SIZE` rows.
+"""
+import json
+from itertools import islice
+from flask import request
+from sqlalchemy import insert, select
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from utils import APIException
+from numeric import numeric_values
+from changes import record_changes
+
+BULK_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+NDJSON_TYPES = ("application/x-ndjson", "application/jsonl", "application/json-seq")
+
+
+class BulkReport:
+    def __init__(self):
+        self.created = 0
+        self.skipped = 0
+        self.failed = 0
+        self.errors = []
+
+    def fail(self, index, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"index": index, "message": message})
+
+    def to_dict(self):
+        return {
+            "created": self.created,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "errors": self.errors,
+        }
+
+
+def ndjson_rows(lines):
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield ValueError("invalid JSON")
+
+
+def request_rows():
+    """
+    Yield the submitted rows; unparseable NDJSON lines are yielded as ValueError
+    """
+    if request.mimetype in NDJSON_TYPES:
+        return ndjson_rows(request.stream)
+    body = request.get_json(silent=True)
+    if not isinstance(body, list):
+        raise APIException(
+            "Expected a JSON array or an NDJSON body", status_code=400)
+    return iter(body)
+
+
+def model_columns(model):
+    return {column.key: column for column in model.__table__.columns
+            if column.key in model.serialized_fields and column.key != "id"}
+
+
+def validate_row(model, row, columns):
+    if isinstance(row, Exception):
+        raise row
+    if not isinstance(row, dict):
+        raise ValueError("row must be an object")
+    name = row.get("name")
+    if not isinstance(name, str) or not name.strip():
+        raise ValueError("name is required")
+    if len(name) > columns["name"].type.length:
+        raise ValueError("name is too long")
+    values = {}
+    for key, column in columns.items():
+        value = row.get(key)
+        if value is None:
+            pass
+        elif column.type.python_type is int:
+            # int() would take True as 1 and cut 12.7 down to 12
+            if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+                raise ValueError(f"{key} must be an integer")
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"{key} must be an integer")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = str(value)
+        elif not isinstance(value, str):
+            raise ValueError(f"{key} must be a string")
+        values[key] = value
+    return numeric_values(model, values)
+
+
+def _existing_names(session, model, names):
+    return set(session.scalars(select(model.name).where(model.name.in_(names))))
+
+
+def _insert_chunk(session, model, chunk, report):
+    pending = {}
+    for index, values in chunk:
+        if values["name"] in pending:
+            report.skipped += 1
+        else:
+            pending[values["name"]] = (index, values)
+    if not pending:
+        return
+
+    for _ in range(2):
+        existing = _existing_names(session, model, list(pending))
+        rows = [values for name, (index, values) in pending.items()
+                if name not in existing]
+        try:
+            if rows:
+                session.execute(insert(model), rows)
+                created_ids = session.scalars(select(model.id).where(
+                    model.name.in_([values["name"] for values in rows]))).all()
+                record_changes(session, model.__tablename__, created_ids)
+            session.commit()
+        except IntegrityError:
+            # a concurrent writer took one of the names; look again and retry once
+            session.rollback()
+            continue
+        except DBAPIError as error:
+            # the database refused a value; earlier chunks stay committed and the report says which rows failed
+            session.rollback()
+            for index, values in pending.values():
+                report.fail(index, f"could not insert chunk: {error.orig}")
+            return
+        report.created += len(rows)
+        report.skipped += len(existing)
+        return
+
+    for index, values in pending.values():
+        report.fail(index, "could not insert chunk")
+
+
+def bulk_create(session, model, rows):
+    """
+    Insert `rows` for `model`, skipping names that already exist
+    """
+    columns = model_columns(model)
+    report = BulkReport()
+    numbered = enumerate(rows)
+    while True:
+        batch = list(islice(numbered, BULK_CHUNK_SIZE))
+        if not batch:
+            break
+        chunk = []
+        for index, row in batch:
+            try:
+                chunk.append((index, validate_row(model, row, columns)))
+            except ValueError as error:
+                report.fail(index, str(error))
+        _insert_chunk(session, model, chunk, report)
+    return report
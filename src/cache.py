@@ -0,0 +1,190 @@
+"""
+Read-through cache for serialized character and planet payloads.
+
+The default backend is an in-process LRU bounded by size and TTL; each
+gunicorn worker has its own, so the TTL bounds how stale another worker's
+copy can get. Set ENTITY_CACHE_URL=redis://... to share one cache between
+workers instead (needs the `redis` package).
+
+Entries are invalidated after any commit that inserted, updated or deleted
+a cached model through the ORM session, and refilled from the primary.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from models import Character, Planet
+from projection import columns
+
+CACHED_MODELS = (Character, Planet)
+
+
+def cache_key(model, entity_id):
+    return f"{model.__tablename__}:{entity_id}"
+
+
+class CacheBackend:
+    """
+    Interface for cache backends; values are JSON-compatible payloads
+    """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def delete(self, *keys):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self):
+        raise NotImplementedError
+
+
+class LRUCache(CacheBackend):
+    def __init__(self, max_size=10000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                    self.evictions += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        return {
+            "backend": "lru",
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class RedisCache(CacheBackend):
+    def __init__(self, url, ttl=300, prefix="entity:"):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*[self.prefix + key for key in keys])
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+    def stats(self):
+        # redis evicts on its own; see `INFO stats` on the server for evicted_keys
+        return {"backend": "redis", "ttl": self.ttl, "hits": self.hits, "misses": self.misses}
+
+
+def _backend_from_env():
+    ttl = float(os.environ.get("ENTITY_CACHE_TTL", 300))
+    url = os.environ.get("ENTITY_CACHE_URL")
+    if url:
+        return RedisCache(url, ttl=int(ttl))
+    return LRUCache(max_size=int(os.environ.get("ENTITY_CACHE_SIZE", 10000)), ttl=ttl)
+
+
+entity_cache = _backend_from_env()
+
+
+def get_serialized(session, model, entity_id, fields=None):
+    """
+    Return `model.serialize()` for the row with `entity_id`, or None if it does not exist.
+
+    With `fields`, only those keys: cut from the cached payload on a hit, or
+    read with a narrowed SELECT (and not cached) on a miss. Misses that fill
+    the cache read the primary, even in a `@read_only` view.
+    """
+    key = cache_key(model, entity_id)
+    payload = entity_cache.get(key)
+    if payload is None and fields:
+        row = session.execute(
+            select(*columns(model, fields)).where(model.id == entity_id)).first()
+        return None if row is None else row._asdict()
+    if payload is None:
+        # filled from the primary: a lagging replica would put back what a commit just invalidated
+        entity = session.get(model, entity_id, bind_arguments={"bind": session.get_bind(model)})
+        if entity is None:
+            return None
+        payload = entity.serialize()
+        entity_cache.set(key, payload)
+    if fields:
+        return {field: payload[field] for field in fields}
+    return payload
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_stale_keys(session, flush_context):
+    stale = session.info.setdefault("stale_cache_keys", set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, CACHED_MODELS):
+            stale.add(cache_key(type(obj), obj.id))
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_stale_keys(session):
+    stale = session.info.pop("stale_cache_keys", None)
+    if stale:
+        entity_cache.delete(*stale)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_stale_keys(session):
+    session.info.pop("stale_cache_keys", None)
@@ -0,0 +1,159 @@
+"""
+Change feed: an append-only log of writes to characters, planets and favorites.
+
+    GET /changes                     -> {"cursor": N}: fetch the lists, then poll from N
+    GET /changes?since=N&limit=100   -> the next changes after N
+    GET /changes?since=N&user_id=1   -> including that user's favorites
+
+Each entry is an upsert carrying the row's current payload, or a tombstone.
+ORM writes are logged by the mapper events below; the Core statements in
+favorites.py and bulk.py call `record_changes` themselves. Users are not in
+the feed.
+
+Entries are collected during the transaction and inserted when it
+commits. On PostgreSQL that insert first takes a transaction-level advisory
+lock, held until the commit, so ids are handed out in commit order: a
+transaction can't hold id 10 uncommitted while id 11 is already visible,
+which would make a poller at cursor 11 skip 10 for good. SQLite serializes
+writers by itself. The lock only spans the end of a writing transaction,
+but it does put the commits of logged writes in a single line; group
+commit (groupcommit.py) keeps that line short for favorites.
+
+`compact_changes` (flask compact-changes) keeps only the latest entry per
+row and drops tombstones older than the retention period. Cursors from
+before the newest dropped tombstone get 410, and the client refetches the
+lists.
+"""
+from datetime import datetime, timezone
+from sqlalchemy import delete, event, func, insert, or_, select
+from sqlalchemy.orm import Session, object_session
+from utils import APIException, int_arg
+from models import Change, Character, Favorite, Planet, TableVersion
+from projection import columns, row_dict
+
+DEFAULT_CHANGES_LIMIT = 100
+MAX_CHANGES_LIMIT = 1000
+# TableVersion row holding the id of the newest compacted-away tombstone
+HORIZON_KEY = "change_log:horizon"
+LOGGED_MODELS = {"character": Character, "planet": Planet, "favorite": Favorite}
+FEED_NAMES = {"character": "people", "planet": "planets", "favorite": "favorites"}
+PENDING_KEY = "pending_changes"
+# pg_advisory_xact_lock key serializing change log inserts
+CHANGE_LOG_LOCK = 0x63686C67
+
+
+def _now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def record_changes(session, table_name, row_ids, deleted=False, scope=None):
+    """
+    Log writes made with Core statements when `session` commits; `scope` is
+    the user id for favorites
+    """
+    session.info.setdefault(PENDING_KEY, []).extend(
+        {"table_name": table_name, "row_id": row_id, "deleted": deleted, "scope": scope}
+        for row_id in row_ids)
+
+
+def _log_write(deleted):
+    def listener(mapper, connection, target):
+        scope = target.user_id if isinstance(target, Favorite) else None
+        record_changes(object_session(target), mapper.local_table.name, [target.id], deleted, scope)
+    return listener
+
+
+for _model in LOGGED_MODELS.values():
+    event.listen(_model, "after_insert", _log_write(False))
+    event.listen(_model, "after_update", _log_write(False))
+    event.listen(_model, "after_delete", _log_write(True))
+
+
+@event.listens_for(Session, "before_commit")
+def _write_changes(session):
+    session.flush()
+    entries = session.info.pop(PENDING_KEY, None)
+    if not entries:
+        return
+    if session.get_bind().dialect.name == "postgresql":
+        session.execute(select(func.pg_advisory_xact_lock(CHANGE_LOG_LOCK)))
+    now = _now()
+    session.execute(insert(Change).execution_options(skip_versioning=True),
+                    [dict(entry, created_at=now) for entry in entries])
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changes(session):
+    session.info.pop(PENDING_KEY, None)
+
+
+def _horizon(session):
+    return session.scalar(select(TableVersion.version).where(TableVersion.name == HORIZON_KEY)) or 0
+
+
+def read_changes(session, args):
+    """
+    The page of changes after `?since=`, oldest first
+    """
+    since = int_arg(args, "since")
+    if since is None:
+        return {"changes": [], "cursor": session.scalar(select(func.max(Change.id))) or 0,
+                "has_more": False}
+    if since < _horizon(session):
+        raise APIException("Cursor is too old, refetch the lists", status_code=410)
+    limit = min(int_arg(args, "limit", DEFAULT_CHANGES_LIMIT, minimum=1), MAX_CHANGES_LIMIT)
+    user_id = int_arg(args, "user_id")
+
+    rows = session.execute(
+        select(Change.id, Change.table_name, Change.row_id, Change.deleted)
+        .where(Change.id > since,
+               or_(Change.table_name != "favorite", Change.scope == user_id))
+        .order_by(Change.id)
+        .limit(limit + 1)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    # current payloads of the upserted rows, one IN query per table
+    payloads = {}
+    for table_name, model in LOGGED_MODELS.items():
+        ids = {row.row_id for row in rows if row.table_name == table_name and not row.deleted}
+        if ids:
+            payloads[table_name] = {
+                item["id"]: item for item in map(row_dict, session.execute(
+                    select(*columns(model)).where(model.id.in_(ids))))}
+
+    changes = []
+    for row in rows:
+        entry = {"cursor": row.id, "table": FEED_NAMES[row.table_name], "id": row.row_id}
+        if row.deleted:
+            entry["op"] = "delete"
+        else:
+            data = payloads[row.table_name].get(row.row_id)
+            if data is None:
+                # deleted since; its tombstone comes later in the feed
+                continue
+            entry.update(op="upsert", data=data)
+        changes.append(entry)
+    return {"changes": changes, "cursor": rows[-1].id if rows else since, "has_more": has_more}
+
+
+def compact_changes(session, retention):
+    """
+    Drop superseded entries and tombstones older than `retention` (a
+    timedelta); returns the number of deleted entries. The caller commits.
+    """
+    latest = (select(func.max(Change.id).label("id"))
+              .group_by(Change.table_name, Change.row_id).subquery())
+    removed = session.execute(
+        delete(Change).where(Change.id.not_in(select(latest.c.id)))
+        .execution_options(synchronize_session=False, skip_versioning=True)).rowcount
+
+    expired = (Change.deleted.is_(True), Change.created_at < _now() - retention)
+    newest_expired = session.scalar(select(func.max(Change.id)).where(*expired))
+    if newest_expired is not None:
+        removed += session.execute(
+            delete(Change).where(*expired, Change.id <= newest_expired)
+            .execution_options(synchronize_session=False, skip_versioning=True)).rowcount
+        if newest_expired > _horizon(session):
+            session.merge(TableVersion(name=HORIZON_KEY, version=newest_expired))
+    return removed
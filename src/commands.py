@@ -0,0 +1,71 @@
+"""
+Maintenance commands for the Flask CLI:
+
+    flask reconcile-counts
+    flask export people --format csv --gzip -o people.csv.gz
+    flask compact-changes --retention-days 7
+
+Flask-Migrate (`flask db ...`) is set up here too, but only when the app is
+created by the flask CLI: importing alembic is the largest part of app
+startup and web workers never use it.
+"""
+import os
+import sys
+import time
+from datetime import timedelta
+import click
+from models import db
+from favorites import reconcile_counts
+from changes import compact_changes
+from export import EXPORT_MODELS, FORMATS, ExportEncoder, export_statement
+
+
+def setup_commands(app):
+    if click.get_current_context(silent=True) is not None:
+        from flask_migrate import Migrate
+        Migrate(app, db)
+
+    @app.cli.command("reconcile-counts")
+    def reconcile_counts_command():
+        """Rebuild favorite counts that drifted from the favorite table."""
+        fixed = reconcile_counts(db.session)
+        db.session.commit()
+        for kind, rows in fixed.items():
+            click.echo(f"{kind}: {rows} counts fixed")
+
+    @app.cli.command("compact-changes")
+    @click.option("--retention-days", type=float,
+                  default=lambda: float(os.getenv("CHANGES_RETENTION_DAYS", 7)),
+                  help="How long tombstones are kept (default: CHANGES_RETENTION_DAYS or 7).")
+    def compact_changes_command(retention_days):
+        """Keep the change log bounded: one entry per row, recent tombstones."""
+        removed = compact_changes(db.session, timedelta(days=retention_days))
+        db.session.commit()
+        click.echo(f"{removed} change log entries removed")
+
+    @app.cli.command("export")
+    @click.argument("table", type=click.Choice(list(EXPORT_MODELS)))
+    @click.option("--format", "fmt", type=click.Choice(list(FORMATS)), default="ndjson")
+    @click.option("--gzip", "gzipped", is_flag=True, help="Compress the output.")
+    @click.option("-o", "--output", type=click.Path(dir_okay=False),
+                  help="File to write (default: stdout).")
+    def export_command(table, fmt, gzipped, output):
+        """Stream a whole table as NDJSON or CSV."""
+        model = EXPORT_MODELS[table]
+        encoder = ExportEncoder(model, fmt, gzipped)
+        started = time.perf_counter()
+        if output:
+            out = open(output, "wb") if gzipped else open(output, "w", newline="")
+        else:
+            out = sys.stdout.buffer if gzipped else sys.stdout
+        try:
+            out.write(encoder.start())
+            for rows in db.session.execute(export_statement(model)).partitions():
+                out.write(encoder.encode(rows))
+            out.write(encoder.finish())
+        finally:
+            if output:
+                out.close()
+        elapsed = time.perf_counter() - started
+        click.echo(f"{table}: {encoder.rows} rows in {elapsed:.1f} s "
+                   f"({encoder.rows / elapsed:,.0f} rows/s)", err=True)
@@ -0,0 +1,153 @@
+"""
+Database URL and engine options, driven by environment variables.
+
+Pool (not used for in-memory SQLite):
+    DB_POOL_SIZE          connections kept per worker process (default 5)
+    DB_MAX_OVERFLOW       extra connections allowed under load (default 10)
+    DB_MAX_CONNECTIONS    alternative to the two above: the connection budget
+                          for the whole deployment, split evenly across
+                          WEB_CONCURRENCY worker processes with no overflow
+    DB_POOL_TIMEOUT       seconds to wait for a free connection (default 30)
+    DB_POOL_RECYCLE       seconds before a connection is replaced (default 1800)
+    DB_POOL_PRE_PING      test connections on checkout (default true)
+
+Server:
+    DB_STATEMENT_TIMEOUT_MS   per-statement timeout on PostgreSQL
+
+SQLite:
+    SQLITE_JOURNAL_MODE   default WAL, so readers don't block the writer
+    SQLITE_SYNCHRONOUS    default NORMAL (safe with WAL)
+    SQLITE_BUSY_TIMEOUT   ms to wait on a locked database (default 5000)
+"""
+import os
+import threading
+import time
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+
+def database_url():
+    db_url = os.getenv("DATABASE_URL")
+    if db_url is not None:
+        return db_url.replace("postgres://", "postgresql://")
+    return "sqlite:////tmp/test.db"
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return default if value in (None, "") else int(value)
+
+
+def _env_bool(name, default):
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+class PoolStatsMixin:
+    """
+    Records how long callers waited for a connection
+    """
+
+    def _init_stats(self):
+        self.stats_lock = threading.Lock()
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self.stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with self.stats_lock:
+                self.waits += 1
+                self.wait_time += waited
+                self.max_wait = max(self.max_wait, waited)
+
+    def stats(self):
+        return {
+            "size": self.size(),
+            "checked_out": self.checkedout(),
+            "checked_in": self.checkedin(),
+            "overflow": max(self.overflow(), 0),
+            "max_overflow": self._max_overflow,
+            "checkouts": self.waits,
+            "wait_ms_total": round(self.wait_time * 1000, 2),
+            "wait_ms_avg": round(self.wait_time * 1000 / self.waits, 3) if self.waits else 0.0,
+            "wait_ms_max": round(self.max_wait * 1000, 2),
+            "timeouts": self.timeouts,
+        }
+
+
+class StatsQueuePool(PoolStatsMixin, QueuePool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._init_stats()
+
+
+class StatsAsyncQueuePool(PoolStatsMixin, AsyncAdaptedQueuePool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._init_stats()
+
+
+def _pool_sizes():
+    budget = os.getenv("DB_MAX_CONNECTIONS")
+    if budget and not os.getenv("DB_POOL_SIZE"):
+        workers = _env_int("WEB_CONCURRENCY", 1)
+        return max(1, int(budget) // max(workers, 1)), 0
+    return _env_int("DB_POOL_SIZE", 5), _env_int("DB_MAX_OVERFLOW", 10)
+
+
+def engine_options(url, is_async=False):
+    """
+    Keyword arguments for create_engine / SQLALCHEMY_ENGINE_OPTIONS
+    """
+    options = {}
+    if url.startswith("sqlite") and (":memory:" in url or url.rstrip("/").endswith(":")):
+        return options
+
+    pool_size, max_overflow = _pool_sizes()
+    options.update(
+        poolclass=StatsAsyncQueuePool if is_async else StatsQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=_env_int("DB_POOL_TIMEOUT", 30),
+        pool_recycle=_env_int("DB_POOL_RECYCLE", 1800),
+        pool_pre_ping=_env_bool("DB_POOL_PRE_PING", True),
+    )
+
+    timeout_ms = os.getenv("DB_STATEMENT_TIMEOUT_MS")
+    if timeout_ms and url.startswith("postgresql"):
+        if "+asyncpg" in url:
+            options["connect_args"] = {"server_settings": {"statement_timeout": timeout_ms}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={timeout_ms}"}
+    return options
+
+
+def pool_stats(engine):
+    pool = engine.pool
+    if isinstance(pool, PoolStatsMixin):
+        return pool.stats()
+    return {"pool": pool.status()}
+
+
+@event.listens_for(Engine, "connect")
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    if "sqlite" not in type(dbapi_connection).__module__:
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={os.getenv('SQLITE_JOURNAL_MODE', 'WAL')}")
+    cursor.execute(f"PRAGMA synchronous={os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')}")
+    cursor.execute(f"PRAGMA busy_timeout={_env_int('SQLITE_BUSY_TIMEOUT', 5000)}")
+    cursor.close()
@@ -0,0 +1,102 @@
+"""
+Create users, characters and planets.
+
+Shared by the Flask app and the ASGI app: each function takes the session
+and the decoded request body, raises APIException on invalid input, and
+returns the serialized new row.
+"""
+from sqlalchemy import exists, select
+from utils import APIException
+from models import User
+from passwords import hash_password, verify_password
+
+
+def _taken(session, column, value):
+    return session.scalar(select(exists().where(column == value)))
+
+
+def create_user(session, request_body, password_hash=None):
+    """
+    `password_hash` is the hash of the body's password, for callers that
+    hashed it without blocking (asgi.py); otherwise it is hashed here
+    """
+    request_body = request_body or {}
+
+    # Check if required fields are provided
+    if not request_body.get("email") or not request_body.get("password"):
+        raise APIException("Email and password are required", status_code=400)
+    if not isinstance(request_body["password"], str):
+        raise APIException("Password must be a string", status_code=400)
+
+    # hash before the first query: the session holds a pool connection from then until the commit
+    password_hash = password_hash or hash_password(request_body["password"])
+
+    # Check if user with same email already exists
+    if _taken(session, User.email, request_body["email"]):
+        raise APIException("User with this email already exists", status_code=400)
+
+    new_user = User(
+        email=request_body["email"],
+        password=password_hash
+    )
+    session.add(new_user)
+    session.commit()
+
+    return new_user.serialize()
+
+
+def login_row(session, request_body):
+    """
+    `(id, stored password)` of the user logging in, or `(None, None)`.
+    Ends the transaction so no connection is held while the password is checked.
+    """
+    request_body = request_body or {}
+    if not isinstance(request_body.get("email"), str) or not isinstance(request_body.get("password"), str):
+        raise APIException("Email and password are required", status_code=400)
+    row = session.execute(select(User.id, User.password)
+                          .where(User.email == request_body["email"])).first()
+    session.rollback()
+    return tuple(row) if row else (None, None)
+
+
+def finish_login(session, user_id, stored, replacement):
+    """
+    Store `replacement` unless the password changed since it was read
+    """
+    user = session.get(User, user_id)
+    if user is None:
+        raise APIException("Invalid email or password", status_code=401)
+    if replacement and user.password == stored:
+        user.password = replacement
+        session.commit()
+    return user.serialize()
+
+
+def login(session, request_body):
+    user_id, stored = login_row(session, request_body)
+    matches, replacement = verify_password(stored, request_body["password"]) if stored else (False, None)
+    if not matches:
+        raise APIException("Invalid email or password", status_code=401)
+    return finish_login(session, user_id, stored, replacement)
+
+
+def create_named(session, model, label, request_body):
+    """
+    Create a Character or Planet; every serialized field is read from the body
+    """
+    request_body = request_body or {}
+
+    # Check if required fields are provided
+    if not request_body.get("name"):
+        raise APIException(f"{label} name is required", status_code=400)
+
+    # Check if one with the same name already exists
+    if _taken(session, model.name, request_body["name"]):
+        raise APIException(f"{label} with this name already exists", status_code=400)
+
+    new_entity = model(**{field: request_body.get(field)
+                          for field in model.serialized_fields if field != "id"})
+    session.add(new_entity)
+    session.commit()
+
+    return new_entity.serialize()
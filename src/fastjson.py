@@ -0,0 +1,59 @@
+"""
+orjson-backed JSON provider for Flask.
+
+It produces the same bytes as Flask's DefaultJSONProvider for the compact
+output `jsonify` uses outside debug mode: keys sorted, non-ASCII escaped,
+dates and decimals rendered by Flask's own `default`. Anything orjson can't
+reproduce exactly falls back to the stdlib encoder: non-ASCII text,
+pretty-printing, non-string keys, integers over 64 bits. Floats are the one
+known difference (orjson writes 1e-05 as 0.00001), and no model serializes
+a float.
+
+Enabled when `orjson` is installed, unless JSON_PROVIDER=default.
+`compact_dumps` is the same encoder without Flask, for the ASGI app.
+"""
+import json
+import os
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+COMPACT = {"separators": (",", ":")}
+ENABLED = orjson is not None and os.environ.get("JSON_PROVIDER", "fast") == "fast"
+
+if orjson is not None:
+    ORJSON_OPTIONS = (orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+                      | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_SUBCLASS)
+
+
+def compact_dumps(obj, default=DefaultJSONProvider.default, ensure_ascii=True):
+    """
+    What `jsonify` writes in production, minus the trailing newline
+    """
+    if ENABLED:
+        try:
+            data = orjson.dumps(obj, default=default, option=ORJSON_OPTIONS)
+        except TypeError:
+            pass
+        else:
+            if data.isascii() or not ensure_ascii:
+                return data.decode()
+    return json.dumps(obj, default=default, ensure_ascii=ensure_ascii,
+                      sort_keys=True, separators=(",", ":"))
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        if kwargs == COMPACT and self.sort_keys:
+            return compact_dumps(obj, self.default, self.ensure_ascii)
+        return super().dumps(obj, **kwargs)
+
+
+def setup_json(app):
+    if not ENABLED:
+        return
+    app.json_provider_class = FastJSONProvider
+    app.json = FastJSONProvider(app)
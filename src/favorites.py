@@ -0,0 +1,328 @@
+"""
+Atomic add/remove of favorites.
+
+Adding is a single INSERT ... SELECT ... ON CONFLICT DO NOTHING that copies
+the planet/character name and checks that the user exists in the same
+statement; removing is a single DELETE. Only when nothing was written do we
+run extra SELECTs, to tell the caller why. Databases without an
+insert-or-ignore get a plain INSERT of the missing rows in a SAVEPOINT,
+retried if a concurrent insert of the same favorite wins.
+
+`apply_batch` does the same for many ids at once: per entity type one
+SELECT ... IN that reports which targets exist and which are already
+favorites, then one INSERT ... SELECT and one DELETE ... IN.
+
+Planet/Character.favorite_count is adjusted by the same transaction: an
+increment or decrement of the rows that changed, or a recount from the
+favorite table when a concurrent writer got there first. `reconcile_counts`
+rebuilds every counter that drifted (e.g. after rows were written outside
+these functions). Written and deleted favorite ids go to the change log
+(changes.py), read back with RETURNING where the database supports it.
+"""
+from sqlalchemy import and_, delete, exists, func, insert, literal, select, update
+from sqlalchemy.exc import IntegrityError
+from utils import APIException, int_arg
+from models import User, Character, Favorite, Planet
+from versioning import ANY_USER_KEY, COUNTS_KEY, mark_changed, user_key
+from projection import columns, row_dict
+from changes import record_changes
+
+# target kind -> (model, Favorite foreign key column, label used in messages)
+TARGETS = {
+    "planet": (Planet, Favorite.planet_id, "Planet"),
+    "character": (Character, Favorite.character_id, "character"),
+}
+
+# batch body key -> target kind
+BATCH_KEYS = {"planets": "planet", "characters": "character"}
+MAX_BATCH_ITEMS = 1000
+DEFAULT_TOP_LIMIT = 10
+MAX_TOP_LIMIT = 100
+INSERT_ATTEMPTS = 3
+
+
+def _insert_ignore(session):
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert(Favorite).on_conflict_do_nothing()
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        return sqlite_insert(Favorite).on_conflict_do_nothing()
+    if dialect in ("mysql", "mariadb"):
+        return insert(Favorite).prefix_with("IGNORE")
+    # no insert-or-ignore: see _insert_favorites
+    return None
+
+
+def _run_insert(session, stmt, user_id, column, target_ids):
+    if session.get_bind().dialect.insert_returning:
+        return list(session.scalars(stmt.returning(Favorite.id)))
+    if session.execute(stmt).rowcount:
+        return list(session.scalars(select(Favorite.id).where(
+            Favorite.user_id == user_id, column.in_(target_ids))))
+    return []
+
+
+def _insert_favorites(session, user_id, kind, source, target_ids):
+    """
+    INSERT ... SELECT the favorites in `source`, skipping existing ones; returns the new ids
+    """
+    model, column, _ = TARGETS[kind]
+    into = [Favorite.name, Favorite.user_id, column]
+    ignore = _insert_ignore(session)
+    if ignore is not None:
+        # the callers mark user_key(user_id)
+        stmt = ignore.from_select(into, source).execution_options(skip_versioning=True)
+        ids = _run_insert(session, stmt, user_id, column, target_ids)
+    else:
+        # leave existing favorites out of the SELECT; a concurrent insert of the
+        # same favorite still conflicts, so retry it in a SAVEPOINT
+        source = source.where(~exists().where(Favorite.user_id == user_id, column == model.id))
+        stmt = insert(Favorite).from_select(into, source).execution_options(skip_versioning=True)
+        for attempt in range(INSERT_ATTEMPTS):
+            try:
+                with session.begin_nested():
+                    ids = _run_insert(session, stmt, user_id, column, target_ids)
+                break
+            except IntegrityError:
+                if attempt == INSERT_ATTEMPTS - 1:
+                    raise APIException("Favorites were changed concurrently, try again", status_code=409)
+    record_changes(session, "favorite", ids, scope=user_id)
+    return ids
+
+
+def _delete_favorites(session, user_id, kind, target_ids):
+    """
+    DELETE the user's favorites of `target_ids`; returns the deleted ids
+    """
+    conditions = (Favorite.user_id == user_id, TARGETS[kind][1].in_(target_ids))
+    # the callers mark user_key(user_id)
+    stmt = delete(Favorite).execution_options(skip_versioning=True)
+    if session.get_bind().dialect.delete_returning:
+        ids = list(session.scalars(stmt.where(*conditions).returning(Favorite.id)))
+    else:
+        ids = list(session.scalars(select(Favorite.id).where(*conditions)))
+        if ids:
+            session.execute(stmt.where(Favorite.id.in_(ids)))
+    record_changes(session, "favorite", ids, deleted=True, scope=user_id)
+    return ids
+
+
+def _count_statement(model, column):
+    return select(func.count(Favorite.id)).where(column == model.id).scalar_subquery()
+
+
+def _adjust_counts(session, kind, target_ids, delta, changed):
+    """
+    Add `delta` to the favorite_count of `target_ids` if all `changed` rows
+    were written, otherwise recount them
+    """
+    model, column, _ = TARGETS[kind]
+    if changed == len(target_ids):
+        values = {"favorite_count": model.favorite_count + delta}
+    else:
+        values = {"favorite_count": _count_statement(model, column)}
+    session.execute(
+        update(model).where(model.id.in_(target_ids)).values(values)
+        .execution_options(synchronize_session=False, skip_versioning=True))
+    mark_changed(session, COUNTS_KEY)
+
+
+def user_exists(session, user_id):
+    return session.scalar(select(exists().where(User.id == user_id)))
+
+
+def add_favorite(session, user_id, kind, target_id):
+    """
+    Add a planet or character to a user's favorites.
+
+    Returns True if a row was inserted, False if it was already a favorite.
+    Raises APIException(404) if the user or the target does not exist.
+    The caller commits.
+    """
+    model, _, label = TARGETS[kind]
+    if user_id is None:
+        raise APIException("User Does not exist", status_code=404)
+    source = select(
+        model.name, literal(user_id), model.id
+    ).where(
+        model.id == target_id,
+        exists().where(User.id == user_id),
+    )
+    if _insert_favorites(session, user_id, kind, source, [target_id]):
+        _adjust_counts(session, kind, [target_id], 1, 1)
+        mark_changed(session, user_key(user_id))
+        return True
+
+    if not user_exists(session, user_id):
+        raise APIException("User Does not exist", status_code=404)
+    if session.get(model, target_id) is None:
+        raise APIException(f"{label} Does not exist", status_code=404)
+    return False
+
+
+def remove_favorite(session, user_id, kind, target_id):
+    """
+    Remove a planet or character from a user's favorites.
+
+    Returns True if a row was deleted, False if it was not a favorite.
+    Raises APIException(404) if the user does not exist. The caller commits.
+    """
+    if user_id is None:
+        raise APIException("User does not exist", status_code=404)
+    if _delete_favorites(session, user_id, kind, [target_id]):
+        _adjust_counts(session, kind, [target_id], -1, 1)
+        mark_changed(session, user_key(user_id))
+        return True
+
+    if not user_exists(session, user_id):
+        raise APIException("User does not exist", status_code=404)
+    return False
+
+
+def favorites_version_keys(user_id, expand=False):
+    """
+    Version keys of `list_favorites`: expanded payloads also change with planets and characters
+    """
+    if expand:
+        return (user_key(user_id), ANY_USER_KEY, "planet", "character")
+    return (user_key(user_id), ANY_USER_KEY)
+
+
+def list_favorites(session, user_id, expand=False):
+    """
+    Serialized favorites of a user, oldest first. Raises APIException(404) for unknown users.
+
+    With `expand`, each favorite also carries the full `planet` and
+    `character` payloads (None for the other kind), read with one
+    outer-joined query.
+    """
+    if user_id is None or not user_exists(session, user_id):
+        raise APIException("User Does not exist", status_code=404)
+    if not expand:
+        favorites = session.execute(
+            select(*columns(Favorite))
+            .where(Favorite.user_id == user_id)
+            .order_by(Favorite.id))
+        return [row_dict(favorite) for favorite in favorites]
+
+    joined = {kind: columns(model) for kind, (model, _, _) in TARGETS.items()}
+    rows = session.execute(
+        select(*columns(Favorite), *(
+            column.label(f"{kind}.{column.key}")
+            for kind, kind_columns in joined.items() for column in kind_columns))
+        .outerjoin(Planet, Planet.id == Favorite.planet_id)
+        .outerjoin(Character, Character.id == Favorite.character_id)
+        .where(Favorite.user_id == user_id)
+        .order_by(Favorite.id))
+    favorites = []
+    for row in rows.mappings():
+        favorite = {field: row[field] for field in Favorite.serialized_fields}
+        for kind, kind_columns in joined.items():
+            target = {column.key: row[f"{kind}.{column.key}"] for column in kind_columns}
+            favorite[kind] = target if target["id"] is not None else None
+        favorites.append(favorite)
+    return favorites
+
+
+def _batch_ids(body, action):
+    section = body.get(action) or {}
+    if not isinstance(section, dict):
+        raise APIException(f"'{action}' must be an object", status_code=400)
+    ids = {}
+    for key, kind in BATCH_KEYS.items():
+        values = section.get(key) or []
+        if not isinstance(values, list) or not all(
+                isinstance(value, int) and not isinstance(value, bool) for value in values):
+            raise APIException(f"'{action}.{key}' must be a list of ids", status_code=400)
+        ids[kind] = list(dict.fromkeys(values))
+    return ids
+
+
+def apply_batch(session, user_id, body):
+    """
+    Add and remove many favorites of a user at once.
+
+    `body` is {"add": {"planets": [...], "characters": [...]}, "remove": {...}}.
+    Returns {"planets": [...], "characters": [...]} with one
+    {"id", "action", "status"} per requested id, where status is "added",
+    "already_favorite", "removed", "not_favorite" or "not_found".
+    Raises APIException(400) for a malformed body and (404) for unknown
+    users. The caller commits.
+    """
+    if not isinstance(body, dict):
+        raise APIException("Expected a JSON object with 'add' and/or 'remove'", status_code=400)
+    adds, removes = _batch_ids(body, "add"), _batch_ids(body, "remove")
+    if sum(len(ids) for ids in (*adds.values(), *removes.values())) > MAX_BATCH_ITEMS:
+        raise APIException(f"At most {MAX_BATCH_ITEMS} ids per batch", status_code=400)
+    if user_id is None or not user_exists(session, user_id):
+        raise APIException("User Does not exist", status_code=404)
+
+    results = {}
+    changed = False
+    for key, kind in BATCH_KEYS.items():
+        model, column, label = TARGETS[kind]
+        add_ids, remove_ids = adds[kind], removes[kind]
+        results[key] = []
+        if set(add_ids) & set(remove_ids):
+            raise APIException(f"{label} ids can't be both added and removed", status_code=400)
+        if not add_ids and not remove_ids:
+            continue
+
+        # target id -> already a favorite of this user
+        state = dict(session.execute(
+            select(model.id, Favorite.id.is_not(None))
+            .outerjoin(Favorite, and_(column == model.id, Favorite.user_id == user_id))
+            .where(model.id.in_(add_ids + remove_ids))).all())
+
+        to_add = [target_id for target_id in add_ids if state.get(target_id) is False]
+        to_remove = [target_id for target_id in remove_ids if state.get(target_id)]
+        if to_add:
+            source = select(model.name, literal(user_id), model.id).where(model.id.in_(to_add))
+            added = _insert_favorites(session, user_id, kind, source, to_add)
+            _adjust_counts(session, kind, to_add, 1, len(added))
+        if to_remove:
+            removed = _delete_favorites(session, user_id, kind, to_remove)
+            _adjust_counts(session, kind, to_remove, -1, len(removed))
+        changed = changed or bool(to_add or to_remove)
+
+        for target_id in add_ids:
+            status = "not_found" if target_id not in state else "already_favorite" if state[target_id] else "added"
+            results[key].append({"id": target_id, "action": "add", "status": status})
+        for target_id in remove_ids:
+            status = "removed" if state.get(target_id) else "not_favorite"
+            results[key].append({"id": target_id, "action": "remove", "status": status})
+
+    if changed:
+        mark_changed(session, user_key(user_id))
+    return results
+
+
+def top_favorites(session, kind, args):
+    """
+    The `?limit=` most favorited planets or characters, with their favorite_count
+    """
+    model = TARGETS[kind][0]
+    limit = min(int_arg(args, "limit", DEFAULT_TOP_LIMIT, minimum=1), MAX_TOP_LIMIT)
+    rows = session.execute(
+        select(*columns(model), model.favorite_count)
+        .order_by(model.favorite_count.desc(), model.id.desc())
+        .limit(limit))
+    return [row_dict(row) for row in rows]
+
+
+def reconcile_counts(session):
+    """
+    Recount favorite_count from the favorite table where it drifted; returns
+    the number of fixed rows per kind. The caller commits.
+    """
+    fixed = {}
+    for kind, (model, column, _) in TARGETS.items():
+        count = _count_statement(model, column)
+        fixed[kind] = session.execute(
+            update(model).where(model.favorite_count != count).values(favorite_count=count)
+            .execution_options(synchronize_session=False, skip_versioning=True)).rowcount
+    if any(fixed.values()):
+        mark_changed(session, COUNTS_KEY)
+    return fixed
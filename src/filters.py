@@ -0,0 +1,69 @@
+"""
+Range filters and sorting for the list endpoints, evaluated in SQL.
+
+    /planets?min_population=1000000&max_diameter=20000&sort=-diameter
+    /people?min_height=180&sort=mass
+
+`min_<field>` / `max_<field>` work on the model's `numeric_fields` and
+compare the parsed shadow columns (see numeric.py), which are indexed.
+`sort` takes one of those fields, `id` or `name`, with a leading `-` for
+descending order; ties are broken by id. Rows where the field is NULL
+(for a numeric field: not a number) come last, in either direction.
+"""
+import math
+from utils import APIException
+
+
+def _numeric_fields(model):
+    return getattr(model, "numeric_fields", {})
+
+
+def sort_fields(model):
+    fields = ["id"]
+    if hasattr(model, "name"):
+        fields.append("name")
+    return fields + list(_numeric_fields(model))
+
+
+def _column(model, field):
+    return getattr(model, _numeric_fields(model).get(field, field))
+
+
+def range_filters(model, args):
+    """
+    WHERE clauses for the `min_*` / `max_*` query arguments
+    """
+    conditions = []
+    for key in args:
+        bound, _, field = key.partition("_")
+        if bound not in ("min", "max") or not field:
+            continue
+        if field not in _numeric_fields(model):
+            raise APIException(
+                f"Unknown filter '{key}'", status_code=400,
+                payload={"numeric_fields": list(_numeric_fields(model))})
+        try:
+            value = float(args.get(key))
+        except ValueError:
+            value = math.nan
+        if not math.isfinite(value):
+            raise APIException(f"'{key}' must be a number", status_code=400)
+        column = _column(model, field)
+        conditions.append(column >= value if bound == "min" else column <= value)
+    return conditions
+
+
+def sort_arg(model, args):
+    """
+    Read `sort=field` / `sort=-field`: (column, descending), or None for the default id order
+    """
+    raw = args.get("sort")
+    if not raw or raw == "id":
+        return None
+    descending = raw.startswith("-")
+    field = raw.lstrip("-")
+    if field not in sort_fields(model):
+        raise APIException(
+            f"Unknown sort field '{field}'", status_code=400,
+            payload={"sort_fields": sort_fields(model)})
+    return _column(model, field), descending
@@ -0,0 +1,164 @@
+"""
+Group commit for favorite writes.
+
+With FAVORITE_GROUP_COMMIT=1, favorite adds and removes are not committed
+by the request that made them. They are queued, and a background thread
+per process applies everything that arrived within GROUP_COMMIT_WINDOW_MS
+(default 2), or GROUP_COMMIT_MAX_OPS operations (default 64), in one
+transaction. That is one commit, one fsync, per batch instead of per
+request. With GROUP_COMMIT_WINDOW_MS=0 nothing waits: a batch is whatever
+queued up while the previous one was committing.
+
+Each request still blocks until the transaction holding its write has
+committed, so a 2xx means the write is durable, as before. Errors go back
+to the request that caused them. A 404 from add_favorite/remove_favorite
+is raised before the operation writes anything, so the rest of the batch
+commits. If the transaction itself fails, the batch is replayed one
+operation per transaction, so only the failing operation gets the error.
+
+Anything else that goes wrong around a batch (a rollback on a dead
+connection, a failing app context teardown) fails that batch's requests
+and the thread carries on; a thread that died anyway is restarted by the
+next write. A request waits at most GROUP_COMMIT_TIMEOUT seconds (default
+10) for its commit, then gets 503; its write may still be applied.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from flask import current_app, g
+from models import db
+from favorites import add_favorite, remove_favorite
+from utils import APIException, after_fork
+
+logger = logging.getLogger("api.group_commit")
+
+ACTIONS = {"add": add_favorite, "remove": remove_favorite}
+
+
+class GroupCommitter:
+    def __init__(self, app, window, max_ops, timeout):
+        self.app = app
+        self.window = window
+        self.max_ops = max_ops
+        self.timeout = timeout
+        self.batches = 0
+        self.operations = 0
+        self.replays = 0
+        self.failed_batches = 0
+        self.timeouts = 0
+        self._reset()
+        after_fork(self._reset)
+
+    def _reset(self):
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        # started on first use
+        self.thread = None
+
+    def submit(self, action, user_id, kind, target_id):
+        """
+        Queue one favorite write and wait until it is committed; returns what
+        add_favorite/remove_favorite returned, or raises what they raised
+        """
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+                self.thread.start()
+        future = Future()
+        self.queue.put((future, ACTIONS[action], (user_id, kind, target_id)))
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            self.timeouts += 1
+            raise APIException(
+                "Timed out waiting for the favorite write to commit, it may still be applied",
+                status_code=503, headers={"Retry-After": "1"})
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_ops:
+            remaining = deadline - time.monotonic()
+            try:
+                # past the window, still take whatever queued up while the last batch committed
+                batch.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            outcomes = None
+            try:
+                with self.app.app_context():
+                    outcomes = self._apply(db.session, batch)
+            except Exception as error:
+                logger.exception("group commit batch of %d operations failed", len(batch))
+                self.failed_batches += 1
+                if outcomes is None:
+                    outcomes = [(False, error)] * len(batch)
+            self.batches += 1
+            self.operations += len(batch)
+            for (future, _, _), (ok, value) in zip(batch, outcomes):
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    def _apply(self, session, batch):
+        outcomes = []
+        try:
+            for _, write, args in batch:
+                try:
+                    outcomes.append((True, write(session, *args)))
+                except APIException as error:
+                    outcomes.append((False, error))
+            session.commit()
+            return outcomes
+        except Exception:
+            session.rollback()
+        # the shared transaction failed: one operation per transaction, so only the culprit fails
+        self.replays += 1
+        outcomes = []
+        for _, write, args in batch:
+            try:
+                result = write(session, *args)
+                session.commit()
+                outcomes.append((True, result))
+            except Exception as error:
+                session.rollback()
+                outcomes.append((False, error))
+        return outcomes
+
+    def stats(self):
+        return {"window_ms": self.window * 1000, "max_ops": self.max_ops, "batches": self.batches,
+                "operations": self.operations, "replays": self.replays,
+                "failed_batches": self.failed_batches, "timeouts": self.timeouts,
+                "queued": self.queue.qsize()}
+
+
+def write_favorite(session, action, user_id, kind, target_id):
+    """
+    add_favorite/remove_favorite and commit, through the group committer when enabled
+    """
+    committer = current_app.extensions.get("group_commit")
+    if committer is None:
+        result = ACTIONS[action](session, user_id, kind, target_id)
+        session.commit()
+        return result
+    # the write happens on another thread; keep read-your-writes routing to the primary (replicas.py)
+    g.db_wrote = True
+    return committer.submit(action, user_id, kind, target_id)
+
+
+def setup_group_commit(app):
+    if os.getenv("FAVORITE_GROUP_COMMIT", "").lower() not in ("1", "true", "yes"):
+        return
+    app.extensions["group_commit"] = GroupCommitter(
+        app, float(os.getenv("GROUP_COMMIT_WINDOW_MS", 2)) / 1000,
+        int(os.getenv("GROUP_COMMIT_MAX_OPS", 64)),
+        float(os.getenv("GROUP_COMMIT_TIMEOUT", 10)))
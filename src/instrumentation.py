@@ -0,0 +1,139 @@
+"""
+Per-request SQL and timing instrumentation.
+
+Every request gets a `RequestTimings` on `flask.g`; SQLAlchemy engine events
+add to it and `after_request` turns it into a `Server-Timing` header and a
+structured log line.
+
+The line goes to the `api.timing` logger: at INFO, or at WARNING with the
+request's SQL once it takes SLOW_REQUEST_MS (default 500). TIMING_LOG_LEVEL
+(default INFO) sets the logger's level; set it to WARNING to log only slow
+requests. Unless logging is already configured, the lines go to stderr.
+"""
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger("api.timing")
+
+MAX_LOGGED_STATEMENTS = 50
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.query_count = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.statements = []
+
+    def add_query(self, statement, elapsed):
+        self.query_count += 1
+        self.db_time += elapsed
+        if len(self.statements) < MAX_LOGGED_STATEMENTS:
+            self.statements.append((round(elapsed * 1000, 2), statement))
+
+    def total_time(self):
+        return time.perf_counter() - self.started
+
+
+def current_timings():
+    if not has_app_context():
+        return None
+    return g.get("request_timings")
+
+
+@contextmanager
+def timed_serialization():
+    """
+    Count the enclosed block as serialization time for the current request
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = current_timings()
+        if timings is not None:
+            timings.serialize_time += time.perf_counter() - started
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    timings = current_timings()
+    if timings is not None:
+        timings.add_query(statement, time.perf_counter() - started)
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context):
+    # a failed statement never reaches after_cursor_execute; drop its start time
+    conn = context.connection
+    if conn is not None and conn.info.get("query_started"):
+        started = conn.info["query_started"].pop()
+        timings = current_timings()
+        if timings is not None:
+            timings.add_query(context.statement, time.perf_counter() - started)
+
+
+def _before_request():
+    g.request_timings = RequestTimings()
+
+
+def _after_request(response):
+    timings = current_timings()
+    if timings is None:
+        return response
+
+    total_ms = timings.total_time() * 1000
+    db_ms = timings.db_time * 1000
+    serialize_ms = timings.serialize_time * 1000
+    response.headers["Server-Timing"] = ", ".join([
+        f'db;dur={db_ms:.2f};desc="{timings.query_count} queries"',
+        f"serialize;dur={serialize_ms:.2f}",
+        f"total;dur={total_ms:.2f}",
+    ])
+
+    line = {
+        "method": request.method,
+        "path": request.full_path.rstrip("?"),
+        "endpoint": request.endpoint,
+        "status": response.status_code,
+        "queries": timings.query_count,
+        "db_ms": round(db_ms, 2),
+        "serialize_ms": round(serialize_ms, 2),
+        "total_ms": round(total_ms, 2),
+    }
+    if total_ms >= current_app.config["SLOW_REQUEST_MS"]:
+        line["slow"] = True
+        line["sql"] = timings.statements
+        logger.warning(json.dumps(line))
+    else:
+        logger.info(json.dumps(line))
+    return response
+
+
+def setup_logging():
+    logger.setLevel(os.environ.get("TIMING_LOG_LEVEL", "INFO").upper())
+    if not logger.hasHandlers():
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+
+
+def setup_instrumentation(app):
+    app.config.setdefault(
+        "SLOW_REQUEST_MS", float(os.environ.get("SLOW_REQUEST_MS", 500)))
+    setup_logging()
+    app.before_request(_before_request)
+    app.after_request(_after_request)
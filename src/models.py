@@ -1,8 +1,11 @@
+from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import String, Boolean, Integer, ForeignKey
+from sqlalchemy import String, Boolean, Integer, Float, ForeignKey, Index, UniqueConstraint, event, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
+from replicas import RoutingSession
+from numeric import sync_numeric
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 
 class User(db.Model):
@@ -13,6 +16,9 @@ class User(db.Model):
 
     favorites: Mapped[list["Favorite"]] = relationship(back_populates="user")
 
+    # columns in serialize(), for queries that skip the ORM (see projection.py)
+    serialized_fields = ("id", "email")
+
     def serialize(self):
         return {
             "id": self.id,
@@ -23,6 +29,9 @@ class User(db.Model):
 
 
 class Character(db.Model):
+    # serves /people/top: favorite_count DESC, id DESC is a backward scan
+    __table_args__ = (Index("ix_character_favorite_count", "favorite_count", "id"),)
+
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(
         String(80), unique=True)
@@ -34,8 +43,17 @@ class Character(db.Model):
     mass: Mapped[str] = mapped_column(nullable=True)
     homeworld: Mapped[str] = mapped_column(nullable=True)
     birth_year: Mapped[str] = mapped_column(nullable=True)
+    # parsed height/mass for range filters and sorting (see numeric.py)
+    height_num: Mapped[float] = mapped_column(Float, nullable=True, index=True)
+    mass_num: Mapped[float] = mapped_column(Float, nullable=True, index=True)
+    # number of users with this character as a favorite, kept by favorites.py
+    favorite_count: Mapped[int] = mapped_column(nullable=False, default=0, server_default="0")
     favorites: Mapped[list["Favorite"]] = relationship(back_populates="character")
 
+    serialized_fields = ("id", "name", "gender", "skin_color", "hair_color", "height",
+                         "eye_color", "mass", "homeworld", "birth_year")
+    numeric_fields = {"height": "height_num", "mass": "mass_num"}
+
     def serialize(self):
         return {
             "id": self.id,
@@ -55,6 +73,9 @@ class Character(db.Model):
 
 
 class Planet(db.Model):
+    # serves /planets/top: favorite_count DESC, id DESC is a backward scan
+    __table_args__ = (Index("ix_planet_favorite_count", "favorite_count", "id"),)
+
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(
         String(80), unique=True, nullable=False)
@@ -65,9 +86,22 @@ class Planet(db.Model):
     rotation_period: Mapped[str] = mapped_column(nullable=True)
     gravity: Mapped[str] = mapped_column(nullable=True)
     orbital_period: Mapped[str] = mapped_column(nullable=True)
-    population: Mapped[int] = mapped_column(nullable=True)
+    population: Mapped[int] = mapped_column(nullable=True, index=True)
+    # parsed copies of the numeric string columns (see numeric.py)
+    surface_water_num: Mapped[float] = mapped_column(Float, nullable=True, index=True)
+    diameter_num: Mapped[float] = mapped_column(Float, nullable=True, index=True)
+    rotation_period_num: Mapped[float] = mapped_column(Float, nullable=True, index=True)
+    orbital_period_num: Mapped[float] = mapped_column(Float, nullable=True, index=True)
+    # number of users with this planet as a favorite, kept by favorites.py
+    favorite_count: Mapped[int] = mapped_column(nullable=False, default=0, server_default="0")
     favorites: Mapped[list["Favorite"]] = relationship(back_populates="planet")
 
+    serialized_fields = ("id", "name", "climate", "surface_water", "diameter",
+                         "rotation_period", "gravity", "orbital_period", "population")
+    numeric_fields = {"surface_water": "surface_water_num", "diameter": "diameter_num",
+                      "rotation_period": "rotation_period_num",
+                      "orbital_period": "orbital_period_num", "population": "population"}
+
     def serialize(self):
         return {
             "id": self.id,
@@ -83,9 +117,18 @@ class Planet(db.Model):
         }
 
 class Favorite(db.Model):
+    # the unique constraints lead with user_id, so they also serve "favorites of user X"
+    __table_args__ = (
+        UniqueConstraint("user_id", "planet_id",
+                         name="uq_favorite_user_planet"),
+        UniqueConstraint("user_id", "character_id",
+                         name="uq_favorite_user_character"),
+        Index("ix_favorite_planet_id", "planet_id"),
+        Index("ix_favorite_character_id", "character_id"),
+    )
+
     id: Mapped[int] = mapped_column(primary_key=True)
-    name: Mapped[str] = mapped_column(
-        String(80), unique=True, nullable=False)
+    name: Mapped[str] = mapped_column(String(80), nullable=False)
     user_id: Mapped[int] = mapped_column(ForeignKey("user.id"), nullable=False)
     planet_id: Mapped[int] = mapped_column(ForeignKey("planet.id"), nullable=True)
     character_id: Mapped[int] = mapped_column(ForeignKey("character.id"), nullable=True)
@@ -94,6 +137,8 @@ class Favorite(db.Model):
     planet: Mapped["Planet | None"] = relationship(back_populates="favorites")
     character: Mapped["Character | None"] = relationship(back_populates="favorites")
 
+    serialized_fields = ("id", "name", "user_id", "planet_id", "character_id")
+
     def serialize(self):
         return {
             "id": self.id,
@@ -105,6 +150,36 @@ class Favorite(db.Model):
         }
 
 
+for _model in (Character, Planet):
+    event.listen(_model, "before_insert", sync_numeric)
+    event.listen(_model, "before_update", sync_numeric)
+    # short search terms are matched as a prefix of lower(name) (see search.py)
+    Index(f"ix_{_model.__tablename__}_name_lower", func.lower(_model.name))
+
 
+class TableVersion(db.Model):
+    """
+    Write counter per table (and per user for favorites), used for ETags
+    """
+    __tablename__ = "table_version"
 
+    name: Mapped[str] = mapped_column(String(120), primary_key=True)
+    version: Mapped[int] = mapped_column(nullable=False, default=0)
 
+
+class Change(db.Model):
+    """
+    Append-only log of writes to characters, planets and favorites (see changes.py)
+    """
+    __tablename__ = "change_log"
+    # AUTOINCREMENT: ids are the feed cursors, SQLite must never reuse them after compaction
+    __table_args__ = (Index("ix_change_log_row", "table_name", "row_id"),
+                      {"sqlite_autoincrement": True})
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    table_name: Mapped[str] = mapped_column(String(40), nullable=False)
+    row_id: Mapped[int] = mapped_column(nullable=False)
+    deleted: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+    # user id of a favorite, so tombstones can still be filtered per user
+    scope: Mapped[int] = mapped_column(nullable=True)
+    created_at: Mapped[datetime] = mapped_column(nullable=False)
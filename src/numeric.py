@@ -0,0 +1,42 @@
+"""
+Parsed numeric copies of the free-form string columns.
+
+Values like "1,358", "172", "unknown" or "n/a" are stored as strings (that is
+what clients send and what the API returns). Each model's `numeric_fields`
+maps a field to the Float "shadow" column holding its parsed value, or None
+when it isn't a number. Range filters and sorting run on the shadow columns
+(see filters.py), so they can use an index.
+
+ORM writes fill the shadow columns in a mapper event (models.py); Core
+inserts that bypass the ORM (bulk loading, seeding) go through `numeric_values`.
+"""
+import math
+
+
+def parse_number(value):
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        number = float(value)
+    else:
+        try:
+            number = float(str(value).strip().replace(",", ""))
+        except ValueError:
+            return None
+    return number if math.isfinite(number) else None
+
+
+def numeric_values(model, values):
+    """
+    `values` (a dict of column values) with the model's shadow columns filled in
+    """
+    for field, shadow in getattr(model, "numeric_fields", {}).items():
+        if field != shadow:
+            values[shadow] = parse_number(values.get(field))
+    return values
+
+
+def sync_numeric(mapper, connection, target):
+    for field, shadow in type(target).numeric_fields.items():
+        if field != shadow:
+            setattr(target, shadow, parse_number(getattr(target, field)))
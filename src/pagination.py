@@ -0,0 +1,276 @@
+"""
+Keyset (cursor) pagination and streamed JSON for the list endpoints.
+
+The argument parsing and statement helpers take a plain mapping of query
+arguments so the ASGI app (asgi.py) shares them; `list_response` is the
+Flask renderer.
+"""
+import base64
+import json
+from flask import Response, current_app, jsonify, request, stream_with_context, url_for
+from utils import APIException, int_arg
+from instrumentation import timed_serialization
+from sqlalchemy import and_, or_, select
+from models import db
+from projection import SORT_KEY, columns, row_dict
+from filters import range_filters, sort_arg
+from search import search_filters, session_dialect
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500
+
+
+def flag_arg(args, name):
+    return args.get(name, "").lower() in ("1", "true", "yes")
+
+
+def wants_stream(args):
+    return flag_arg(args, "stream")
+
+
+def wants_page(args):
+    return "limit" in args or "after" in args
+
+
+def page_args(args, sort=None):
+    """
+    Read `limit` and `after` from the query string
+    """
+    limit = min(int_arg(args, "limit", DEFAULT_PAGE_SIZE, minimum=1), MAX_PAGE_SIZE)
+    return limit, after_arg(args, sort)
+
+
+def after_arg(args, sort=None):
+    """
+    Read the `after` cursor: an id, or with a sort the (value, id) pair from `decode_cursor`
+    """
+    if sort is None:
+        return int_arg(args, "after")
+    raw = args.get("after")
+    if not raw:
+        return None
+    return decode_cursor(raw)
+
+
+def encode_cursor(value, row_id):
+    """
+    Opaque cursor for a sorted list: the last row's sort value and id
+    """
+    raw = json.dumps([value, row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    try:
+        value, row_id = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except (ValueError, TypeError):
+        raise APIException("'after' is not a valid cursor", status_code=400)
+    if not isinstance(row_id, int) or not isinstance(value, (str, int, float, type(None))):
+        raise APIException("'after' is not a valid cursor", status_code=400)
+    return value, row_id
+
+
+def cursor_for(row, sort=None):
+    """
+    The cursor pointing after `row`, a projected row or a model instance
+    """
+    if sort is None:
+        return row.id
+    if SORT_KEY in getattr(row, "_fields", ()):
+        return encode_cursor(getattr(row, SORT_KEY), row.id)
+    return encode_cursor(getattr(row, sort[0].key), row.id)
+
+
+def ids_arg(args):
+    """
+    Read `ids=1,2,3` from the query string; None when absent
+    """
+    raw = args.get("ids")
+    if raw is None:
+        return None
+    try:
+        ids = list(dict.fromkeys(int(value) for value in raw.split(",") if value.strip()))
+    except ValueError:
+        raise APIException("'ids' must be a comma-separated list of integers", status_code=400)
+    if len(ids) > MAX_PAGE_SIZE:
+        raise APIException(f"At most {MAX_PAGE_SIZE} ids per request", status_code=400)
+    return ids
+
+
+def list_statement(model, stmt=None, projected=False, fields=None, sort=None):
+    """
+    Ordered by id, or by `sort` = (column, descending) from `filters.sort_arg` with id as tie-breaker.
+
+    A projected statement with a sort also selects the sort column as
+    `SORT_KEY`, for the cursor; `row_dict` leaves it out.
+    """
+    if stmt is None:
+        stmt = select(*columns(model, fields)) if projected else db.select(model)
+    if sort is None:
+        return stmt.order_by(model.id)
+    column, descending = sort
+    if projected:
+        stmt = stmt.add_columns(column.label(SORT_KEY))
+    if descending:
+        return stmt.order_by(column.desc(), model.id.desc())
+    return stmt.order_by(column, model.id)
+
+
+def filtered_statement(model, args, stmt=None, projected=False, fields=None, dialect=None):
+    """
+    `list_statement` with the `ids`, `q`, `min_*`/`max_*` and `sort` query
+    arguments applied; returns (statement, sort). `dialect` defaults to the
+    one of the Flask session's bind.
+    """
+    sort = sort_arg(model, args)
+    stmt = list_statement(model, stmt, projected, fields, sort)
+    stmt = with_ids(stmt, model, ids_arg(args))
+    dialect = dialect or session_dialect(db.session)
+    return stmt.where(*search_filters(model, args, dialect), *range_filters(model, args)), sort
+
+
+def with_ids(stmt, model, ids):
+    if ids is None:
+        return stmt
+    return stmt.where(model.id.in_(ids))
+
+
+def keyset_parts(stmt, model, after, sort=None):
+    """
+    Statements returning the rows after the cursor `after`; run them in
+    order and concatenate the results.
+
+    With a sort column, rows whose value is NULL come last in both
+    directions, in id order. They are read by a second statement instead
+    of an `OR column IS NULL`, so each statement is a range over the sort
+    column's index.
+    """
+    if sort is None:
+        return [stmt if after is None else stmt.where(model.id > after)]
+    column, descending = sort
+    if after is None:
+        return [stmt.where(column.is_not(None)), stmt.where(column.is_(None))]
+    value, row_id = after
+    past_id = model.id < row_id if descending else model.id > row_id
+    if value is None:
+        return [stmt.where(column.is_(None), past_id)]
+    if descending:
+        past = and_(column <= value, or_(column < value, past_id))
+    else:
+        past = and_(column >= value, or_(column > value, past_id))
+    return [stmt.where(past), stmt.where(column.is_(None))]
+
+
+def next_link(after, limit):
+    args = request.args.to_dict()
+    args.update(after=after, limit=limit)
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+
+def _serialize(obj):
+    return obj.serialize()
+
+
+def _fetch(stmt, projected):
+    if projected:
+        return db.session.execute(stmt)
+    return db.session.scalars(stmt)
+
+
+def _fetch_all(parts, projected):
+    return [row for stmt in parts for row in _fetch(stmt, projected).all()]
+
+
+def _fetch_page(parts, projected, limit):
+    """
+    Up to `limit + 1` rows from `keyset_parts`, so the caller can tell whether there is a next page
+    """
+    rows = []
+    for stmt in parts:
+        rows += _fetch(stmt.limit(limit + 1 - len(rows)), projected).all()
+        if len(rows) > limit:
+            break
+    return rows
+
+
+def serialize_batch(session, rows, serialize, enrich=None):
+    items = [serialize(row) for row in rows]
+    if enrich is not None:
+        enrich(session, items)
+    return items
+
+
+def stream_json(parts, serialize, projected=False, enrich=None):
+    """
+    Write a JSON array one batch at a time so the whole payload is never held in memory.
+
+    `parts` are statements from `keyset_parts`, streamed one after the other.
+    They run inside the generator: the request's session is torn
+    down when the view returns, before the body is consumed.
+    """
+    dumps = current_app.json.dumps
+
+    def generate():
+        yield "["
+        first = True
+        for stmt in parts:
+            result = _fetch(
+                stmt.execution_options(yield_per=STREAM_BATCH_SIZE), projected)
+            for rows in result.partitions():
+                for item in serialize_batch(db.session, rows, serialize, enrich):
+                    if not first:
+                        yield ","
+                    first = False
+                    yield dumps(item, separators=(",", ":"))
+        yield "]"
+
+    return Response(stream_with_context(generate()), mimetype="application/json")
+
+
+def list_response(model, stmt=None, serialize=None, projected=False, enrich=None, fields=None):
+    """
+    Render a list endpoint for `model`.
+
+    - no paging arguments: the full list, as before
+    - `?limit=&after=`: one page ordered by id, with a `Link: rel="next"` header
+      (with `sort`, the cursor is an opaque token from `encode_cursor`)
+    - `?stream=1`: every row, fetched from a server-side cursor and written incrementally
+
+    `?ids=1,2,3` restricts any of these to the given ids, with one IN query;
+    unknown ids are left out of the result. `min_*`/`max_*` and `sort` are
+    described in filters.py, `q` in search.py.
+
+    With `projected=True` the statement selects plain columns (by default
+    `projection.columns(model, fields)`) and rows are serialized with
+    `row._asdict()`, skipping ORM hydration. `enrich(session, items)` is called
+    with each batch of serialized dicts to attach related data in one query
+    per batch.
+    """
+    if serialize is None:
+        serialize = row_dict if projected else _serialize
+    args = request.args
+    stmt, sort = filtered_statement(model, args, stmt, projected, fields)
+
+    if wants_stream(args):
+        parts = keyset_parts(stmt, model, after_arg(args, sort), sort)
+        return stream_json(parts, serialize, projected, enrich)
+
+    if not wants_page(args):
+        rows = _fetch_all(keyset_parts(stmt, model, None, sort), projected)
+        with timed_serialization():
+            response = jsonify(serialize_batch(db.session, rows, serialize, enrich))
+        return response, 200
+
+    limit, after = page_args(args, sort)
+    rows = _fetch_page(keyset_parts(stmt, model, after, sort), projected, limit)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    with timed_serialization():
+        response = jsonify(serialize_batch(db.session, rows, serialize, enrich))
+    if has_more:
+        cursor = cursor_for(rows[-1], sort)
+        response.headers["Link"] = f'<{next_link(cursor, limit)}>; rel="next"'
+        response.headers["X-Next-Cursor"] = str(cursor)
+    return response, 200
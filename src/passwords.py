@@ -0,0 +1,124 @@
+"""
+Password hashing off the request thread.
+
+Hashes are scrypt (werkzeug's `scrypt:N:r:p$salt$hash` format), a
+memory-hard KDF that takes ~100-200 ms of CPU per call at the default cost.
+The calls run in a bounded thread pool (hashlib.scrypt releases the GIL):
+
+    PASSWORD_HASH_WORKERS  threads hashing at once per process (default: CPUs, max 4)
+    PASSWORD_HASH_QUEUE    hashes running or waiting per process (default 32)
+    PASSWORD_HASH_COST     log2 of scrypt's N (default 15)
+
+Once PASSWORD_HASH_QUEUE hashes are in flight, new ones are refused at
+once with 503, so a signup burst can't pile up minutes of queued work and
+memory while every request times out.
+
+Rows written before hashing hold the plaintext password. `verify_password`
+accepts those and returns a hash to replace them with on the first
+successful check (POST /login); hashes made with an older cost are upgraded
+the same way.
+"""
+import asyncio
+import hmac
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import check_password_hash, generate_password_hash
+from utils import APIException, after_fork
+
+
+def hash_method():
+    return f"scrypt:{2 ** int(os.getenv('PASSWORD_HASH_COST', 15))}:8:1"
+
+
+def is_hashed(stored):
+    # werkzeug hashes are "method$salt$hash"; plaintext rows are anything else
+    return stored.count("$") == 2 and stored.split("$", 1)[0].startswith(("scrypt:", "pbkdf2:"))
+
+
+class HashingPool:
+    """
+    Thread pool that refuses work once `queue_depth` calls are in flight
+    """
+
+    def __init__(self, workers, queue_depth):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.rejected = 0
+        self._reset()
+        after_fork(self._reset)
+
+    def _reset(self):
+        self.lock = threading.Lock()
+        # created on first use
+        self.executor = None
+        self.in_flight = 0
+
+    def submit(self, fn, *args):
+        with self.lock:
+            if self.in_flight >= self.queue_depth:
+                self.rejected += 1
+                raise APIException("Too many password operations in progress, try again shortly",
+                                   status_code=503, headers={"Retry-After": "1"})
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="password-hash")
+            self.in_flight += 1
+            executor = self.executor
+        future = executor.submit(fn, *args)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self.lock:
+            self.in_flight -= 1
+
+    def stats(self):
+        return {"workers": self.workers, "queue_depth": self.queue_depth,
+                "in_flight": self.in_flight, "rejected": self.rejected}
+
+
+pool = HashingPool(int(os.getenv("PASSWORD_HASH_WORKERS", min(os.cpu_count() or 1, 4))),
+                   int(os.getenv("PASSWORD_HASH_QUEUE", 32)))
+
+
+def hash_password(password):
+    """
+    Hash `password` in the pool; blocks the calling thread, not the CPU
+    """
+    return pool.submit(generate_password_hash, password, hash_method()).result()
+
+
+async def hash_password_async(password):
+    """
+    `hash_password` for the ASGI app: the event loop keeps serving while it runs
+    """
+    return await asyncio.wrap_future(pool.submit(generate_password_hash, password, hash_method()))
+
+
+def _check(stored, password):
+    if is_hashed(stored):
+        return check_password_hash(stored, password)
+    return hmac.compare_digest(stored.encode(), password.encode())
+
+
+def verify_password(stored, password):
+    """
+    `(matches, replacement)`: `replacement` is a current hash of `password`
+    when it matches a plaintext or outdated `stored` value, else None
+    """
+    if not pool.submit(_check, stored, password).result():
+        return False, None
+    if stored.startswith(hash_method() + "$"):
+        return True, None
+    return True, hash_password(password)
+
+
+async def verify_password_async(stored, password):
+    """
+    `verify_password` for the ASGI app
+    """
+    if not await asyncio.wrap_future(pool.submit(_check, stored, password)):
+        return False, None
+    if stored.startswith(hash_method() + "$"):
+        return True, None
+    return True, await hash_password_async(password)
@@ -0,0 +1,65 @@
+"""
+Column-projection queries: fetch plain row tuples instead of ORM objects.
+
+`columns(Model)` selects exactly the columns `Model.serialize()` returns, so
+`row._asdict()` gives the same dict without identity-map bookkeeping or
+attribute instrumentation. `?fields=` narrows that to a subset of columns.
+"""
+from flask import request
+from sqlalchemy import select
+from utils import APIException
+from models import Favorite
+
+# label of the sort column a sorted list selects for its cursor (pagination.list_statement)
+SORT_KEY = "sort_key"
+
+
+def columns(model, fields=None):
+    return [getattr(model, field) for field in fields or model.serialized_fields]
+
+
+def requested_fields(model, args=None):
+    """
+    Parse `?fields=name,climate` against `model.serialized_fields`.
+
+    Returns None when the parameter is absent. `id` is always included, it is
+    the pagination cursor.
+    """
+    raw = (request.args if args is None else args).get("fields")
+    if not raw:
+        return None
+    fields = ["id"]
+    for field in raw.split(","):
+        field = field.strip()
+        if not field or field in fields:
+            continue
+        if field not in model.serialized_fields:
+            raise APIException(
+                f"Unknown field '{field}'", status_code=400,
+                payload={"allowed_fields": list(model.serialized_fields)})
+        fields.append(field)
+    return fields
+
+
+def row_dict(row):
+    item = row._asdict()
+    item.pop(SORT_KEY, None)
+    return item
+
+
+def attach_favorites(session, users):
+    """
+    Add the `favorites` list to serialized users with one query for the whole batch
+    """
+    by_user = {user["id"]: user for user in users}
+    for user in users:
+        user["favorites"] = []
+    if not by_user:
+        return users
+    rows = session.execute(
+        select(*columns(Favorite))
+        .where(Favorite.user_id.in_(list(by_user)))
+        .order_by(Favorite.id))
+    for row in rows:
+        by_user[row.user_id]["favorites"].append(row._asdict())
+    return users
@@ -0,0 +1,174 @@
+"""
+Read-replica routing for the Flask app.
+
+Set DATABASE_REPLICA_URLS to a comma-separated list of replica URLs. Views
+decorated with `@read_only` then send their SELECTs to a replica (one per
+request, round-robin). Everything else goes to the primary: writes, flushes,
+SELECT ... FOR UPDATE, and every statement of a request that is not
+read-only.
+
+The entity cache (cache.py) is filled from the primary, so a replica's lag
+can't outlive the invalidation of a cached payload.
+
+Read-your-writes: a request that wrote sets the `read_primary_until`
+cookie, and reads carrying it go to the primary for REPLICA_STICKY_SECONDS.
+Clients that don't keep cookies can send `X-Read-Primary: 1` instead.
+
+Health: a replica is probed with SELECT 1 at most every
+REPLICA_HEALTH_INTERVAL seconds. After a failed probe or a disconnect it
+is skipped for REPLICA_RETRY_SECONDS. With no healthy replica, reads fall
+back to the primary.
+"""
+import itertools
+import logging
+import os
+import threading
+import time
+from functools import wraps
+from flask import current_app, g, has_app_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, text
+from dbconfig import engine_options
+
+logger = logging.getLogger("api.replicas")
+
+STICKY_COOKIE = "read_primary_until"
+
+
+class Replica:
+    def __init__(self, url):
+        self.engine = create_engine(url, **engine_options(url))
+        self.url = self.engine.url.render_as_string(hide_password=True)
+        self.healthy = True
+        self.checked_at = 0.0
+        self.down_until = 0.0
+        event.listen(self.engine, "handle_error", self._on_error)
+
+    def _on_error(self, context):
+        if context.is_disconnect or context.connection is None:
+            self.mark_down()
+
+    def mark_down(self):
+        if self.healthy:
+            logger.warning("replica %s marked down", self.url)
+        self.healthy = False
+        self.down_until = time.monotonic() + float(os.getenv("REPLICA_RETRY_SECONDS", 30))
+
+    def probe(self):
+        self.checked_at = time.monotonic()
+        try:
+            with self.engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+        except Exception:
+            self.mark_down()
+            return False
+        if not self.healthy:
+            logger.info("replica %s is back", self.url)
+        self.healthy = True
+        return True
+
+    def available(self, health_interval):
+        now = time.monotonic()
+        if not self.healthy and now < self.down_until:
+            return False
+        if not self.healthy or now - self.checked_at >= health_interval:
+            return self.probe()
+        return True
+
+    def stats(self):
+        pool = self.engine.pool
+        return {"url": self.url, "healthy": self.healthy,
+                "pool": pool.stats() if hasattr(pool, "stats") else pool.status()}
+
+
+class ReplicaSet:
+    def __init__(self, urls):
+        self.replicas = [Replica(url) for url in urls]
+        self.health_interval = float(os.getenv("REPLICA_HEALTH_INTERVAL", 10))
+        self.cycle = itertools.cycle(self.replicas)
+        self.lock = threading.Lock()
+        self.replica_reads = 0
+        self.primary_fallbacks = 0
+
+    def pick(self):
+        """
+        Next healthy replica engine, or None to use the primary
+        """
+        for _ in range(len(self.replicas)):
+            with self.lock:
+                replica = next(self.cycle)
+            if replica.available(self.health_interval):
+                self.replica_reads += 1
+                return replica.engine
+        self.primary_fallbacks += 1
+        return None
+
+    def stats(self):
+        return {"replica_requests": self.replica_reads, "primary_fallbacks": self.primary_fallbacks,
+                "replicas": [replica.stats() for replica in self.replicas]}
+
+
+def _is_plain_select(clause):
+    return (clause is not None and getattr(clause, "is_select", False)
+            and getattr(clause, "_for_update_arg", None) is None)
+
+
+def _replica_for_request():
+    if not has_app_context() or not g.get("read_only"):
+        return None
+    if "replica_engine" not in g:
+        replicas = current_app.extensions.get("replicas")
+        g.replica_engine = replicas.pick() if replicas and not _sticky() else None
+    return g.replica_engine
+
+
+def _sticky():
+    if request.headers.get("X-Read-Primary") == "1":
+        return True
+    try:
+        return float(request.cookies.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+class RoutingSession(Session):
+    """
+    Flask-SQLAlchemy session that sends read-only requests' SELECTs to a replica
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and _is_plain_select(clause):
+            engine = _replica_for_request()
+            if engine is not None:
+                return engine
+        elif has_app_context() and (self._flushing or getattr(clause, "is_dml", False)):
+            g.db_wrote = True
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_only(view):
+    """
+    Allow this view's SELECTs to be served by a replica
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def _set_sticky_cookie(response):
+    if g.get("db_wrote") and current_app.extensions.get("replicas"):
+        seconds = float(os.getenv("REPLICA_STICKY_SECONDS", 5))
+        response.set_cookie(STICKY_COOKIE, f"{time.time() + seconds:.3f}",
+                            max_age=int(seconds) + 1, httponly=True, samesite="Lax")
+    return response
+
+
+def setup_replicas(app):
+    urls = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+    if not urls:
+        return
+    app.extensions["replicas"] = ReplicaSet(
+        [url.replace("postgres://", "postgresql://") for url in urls])
+    app.after_request(_set_sticky_cookie)
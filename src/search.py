@@ -0,0 +1,162 @@
+"""
+Name search over characters and planets.
+
+    /search?q=sky            ranked matches from both tables
+    /people?q=sky            the list endpoint, filtered (still ordered by id)
+
+Matching is case-insensitive substring matching, which covers prefixes,
+from 3 characters on (the trigram size). Each dialect gets an index:
+
+- SQLite: an FTS5 table with the trigram tokenizer per model
+  (`character_name_fts`, `planet_name_fts`), external-content over the
+  model table and kept in sync by triggers, so Core bulk inserts are
+  indexed too.
+- PostgreSQL: a GIN `pg_trgm` index on `name`, which serves `ILIKE '%q%'`.
+- Anything else falls back to an unindexed LIKE scan.
+
+Shorter terms, the first keystrokes of a typeahead, match names that start
+with them, also ignoring case: a range over `lower(name)`, served by the
+`ix_<table>_name_lower` expression index.
+
+The dialect is the one of the session's bind, not of DATABASE_URL, so the
+ASGI engine, replicas and tests get the SQL of the database they run on.
+
+The tables, triggers and indexes are created by the migrations, and by
+`db.create_all()` through the `after_create` hooks below.
+
+/search ranks an exact name first, then prefixes, then other substrings,
+shorter names first.
+"""
+from sqlalchemy import and_, case, column, event, func, select, table
+from utils import APIException, int_arg
+from models import Character, Planet
+from projection import columns
+
+SEARCHED_MODELS = (Character, Planet)
+MIN_QUERY_LENGTH = 3
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+
+def fts_table(model):
+    return f"{model.__tablename__}_name_fts"
+
+
+def index_ddl(table_name, dialect):
+    """
+    Statements that create the name search index of `table_name`
+    """
+    fts = f"{table_name}_name_fts"
+    if dialect == "sqlite":
+        return [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+            f"name, content='{table_name}', content_rowid='id', tokenize='trigram')",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON \"{table_name}\" BEGIN "
+            f"INSERT INTO {fts}(rowid, name) VALUES (new.id, new.name); END",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON \"{table_name}\" BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, name) VALUES ('delete', old.id, old.name); END",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF name ON \"{table_name}\" BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, name) VALUES ('delete', old.id, old.name); "
+            f"INSERT INTO {fts}(rowid, name) VALUES (new.id, new.name); END",
+        ]
+    if dialect == "postgresql":
+        return [
+            "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+            f"CREATE INDEX IF NOT EXISTS ix_{table_name}_name_trgm "
+            f"ON \"{table_name}\" USING gin (name gin_trgm_ops)",
+        ]
+    return []
+
+
+def _create_index(target, connection, **kw):
+    for statement in index_ddl(target.name, connection.dialect.name):
+        connection.exec_driver_sql(statement)
+
+
+def _drop_index(target, connection, **kw):
+    if connection.dialect.name == "sqlite":
+        connection.exec_driver_sql(f"DROP TABLE IF EXISTS {target.name}_name_fts")
+
+
+for _model in SEARCHED_MODELS:
+    event.listen(_model.__table__, "after_create", _create_index)
+    event.listen(_model.__table__, "before_drop", _drop_index)
+
+
+def session_dialect(session):
+    return session.get_bind().dialect.name
+
+
+def query_arg(args):
+    """
+    Read `q` from the query string; None when absent
+    """
+    q = args.get("q")
+    if q is None:
+        return None
+    q = q.strip()
+    if not q:
+        raise APIException("'q' must not be empty", status_code=400)
+    return q
+
+
+def prefix_match(column, term):
+    # a range instead of LIKE 'term%', so the column's index serves it on every dialect
+    return and_(column >= term, column < term + "\uffff")
+
+
+def name_matches(model, q, dialect):
+    """
+    WHERE clause: `model.name` contains `q`, ignoring case, through the
+    index of `dialect`; starts with `q` when it is shorter than the trigram size
+    """
+    if len(q) < MIN_QUERY_LENGTH:
+        return prefix_match(func.lower(model.name), q.lower())
+    if dialect == "sqlite":
+        fts = table(fts_table(model), column("rowid"), column("name"))
+        phrase = '"' + q.replace('"', '""') + '"'
+        return model.id.in_(select(fts.c.rowid).where(fts.c.name.match(phrase)))
+    return model.name.icontains(q, autoescape=True)
+
+
+def search_filters(model, args, dialect):
+    q = query_arg(args)
+    if q is None:
+        return []
+    if model not in SEARCHED_MODELS:
+        raise APIException("'q' is not supported on this endpoint", status_code=400)
+    return [name_matches(model, q, dialect)]
+
+
+def rank_order(model, q):
+    """
+    ORDER BY clauses: exact name, then prefix, then substring; shorter names first
+    """
+    lowered = q.lower()
+    name = func.lower(model.name)
+    rank = case((name == lowered, 0),
+                (func.substr(name, 1, len(lowered)) == lowered, 1),
+                else_=2)
+    return rank, func.length(model.name), model.id
+
+
+def search_statement(model, q, limit, dialect, fields=None):
+    return (select(*columns(model, fields))
+            .where(name_matches(model, q, dialect))
+            .order_by(*rank_order(model, q))
+            .limit(limit))
+
+
+def search(session, args):
+    """
+    {"people": [...], "planets": [...]}, each ranked and cut to `limit`
+    """
+    q = query_arg(args)
+    if q is None:
+        raise APIException("'q' is required", status_code=400)
+    limit = min(int_arg(args, "limit", DEFAULT_SEARCH_LIMIT, minimum=1), MAX_SEARCH_LIMIT)
+    dialect = session_dialect(session)
+    return {
+        key: [row._asdict() for row in session.execute(search_statement(model, q, limit, dialect))]
+        for key, model in (("people", Character), ("planets", Planet))
+    }
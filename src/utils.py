@@ -1,27 +1,51 @@
+import os
 from flask import jsonify, url_for
 
 class APIException(Exception):
     status_code = 400
 
-    def __init__(self, message, status_code=None, payload=None):
+    def __init__(self, message, status_code=None, payload=None, headers=None):
         Exception.__init__(self)
         self.message = message
         if status_code is not None:
             self.status_code = status_code
         self.payload = payload
+        self.headers = headers
 
     def to_dict(self):
         rv = dict(self.payload or ())
         rv['message'] = self.message
         return rv
 
+def int_arg(args, name, default=None, minimum=0):
+    value = args.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise APIException(f"'{name}' must be an integer", status_code=400)
+    if value < minimum:
+        raise APIException(f"'{name}' must be >= {minimum}", status_code=400)
+    return value
+
+def after_fork(reset):
+    """
+    Call `reset()` in the child process after a fork. Threads don't survive
+    fork, and a lock held by one of them at that moment would stay locked,
+    so objects owning threads rebuild their state there.
+    """
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=reset)
+
 def has_no_empty_params(rule):
     defaults = rule.defaults if rule.defaults is not None else ()
     arguments = rule.arguments if rule.arguments is not None else ()
     return len(defaults) >= len(arguments)
 
 def generate_sitemap(app):
-    links = ['/admin/']
+    # only the admin role registers the admin UI
+    links = ['/admin/'] if 'admin' in app.blueprints else []
     for rule in app.url_map.iter_rules():
         # Filter out rules we can't navigate to in a browser
         # and rules that require parameters
@@ -0,0 +1,169 @@
+"""
+Per-table version counters and conditional GET.
+
+Every commit that writes to a table bumps its row in `table_version` inside
+the same transaction, so all workers see the same numbers. List endpoints
+wrapped in `@versioned(...)` derive a strong ETag from that counter and
+answer a matching `If-None-Match` with 304 after one primary-key lookup,
+without reading or serializing any rows.
+
+Users and their favorites are counted per user (`user:<id>`), so favorite
+writes of different users don't queue on one counter row. The user list
+uses the sum of those counters (`USERS_KEY`), read with one index range scan.
+"""
+from functools import wraps
+from flask import make_response, request
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+from models import db, User, Character, Favorite, Planet, TableVersion
+
+PENDING_KEY = "pending_versions"
+
+
+# bumped whenever Planet/Character.favorite_count change
+COUNTS_KEY = "favorite_counts"
+
+
+# bumped by bulk favorite statements that don't say which users they wrote
+ANY_USER_KEY = "user:any"
+
+# the sum of every `user:...` counter: changes with any user or favorite
+USERS_KEY = "user:*"
+
+
+def user_key(user_id):
+    return f"user:{user_id}"
+
+
+def mark_changed(session, *keys):
+    """
+    Bump the version of `keys` when `session` commits
+    """
+    session.info.setdefault(PENDING_KEY, set()).update(keys)
+
+
+def _keys_for(obj):
+    if isinstance(obj, Favorite):
+        # users are serialized with their favorites
+        return (user_key(obj.user_id),)
+    if isinstance(obj, User):
+        return (user_key(obj.id),)
+    if isinstance(obj, (Character, Planet)):
+        return (obj.__tablename__,)
+    return ()
+
+
+def _increment_statement(session):
+    dialect = session.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(TableVersion)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[TableVersion.name],
+            set_={"version": TableVersion.version + 1})
+    elif dialect in ("mysql", "mariadb"):
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+        stmt = dialect_insert(TableVersion).on_duplicate_key_update(
+            version=TableVersion.version + 1)
+    else:
+        raise NotImplementedError(f"version counters are not supported on {dialect}")
+    return stmt
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_flushed(session, flush_context):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        keys = _keys_for(obj)
+        if keys:
+            mark_changed(session, *keys)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_executed(orm_execute_state):
+    # bulk INSERT/UPDATE/DELETE statements bypass the flush
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or mapper.class_ is TableVersion:
+        return
+    if orm_execute_state.execution_options.get("skip_versioning"):
+        # columns no versioned payload contains, e.g. favorite counters; the caller marks its own keys
+        return
+    if mapper.class_ is Favorite:
+        # callers that know the users mark them and pass skip_versioning
+        mark_changed(orm_execute_state.session, ANY_USER_KEY)
+    else:
+        mark_changed(orm_execute_state.session, mapper.local_table.name)
+
+
+@event.listens_for(Session, "before_commit")
+def _write_versions(session):
+    session.flush()
+    keys = session.info.pop(PENDING_KEY, None)
+    if keys:
+        # sorted, so concurrent commits lock the counter rows in the same order
+        rows = [{"name": key, "version": 1} for key in sorted(keys)]
+        session.execute(_increment_statement(session), rows)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_versions(session):
+    session.info.pop(PENDING_KEY, None)
+
+
+def _sum_statement(key):
+    # "user:*" -> every name from "user:" up to, not including, "user;"
+    prefix = key[:-1]
+    return select(func.sum(TableVersion.version)).where(
+        TableVersion.name >= prefix, TableVersion.name < prefix[:-1] + chr(ord(prefix[-1]) + 1))
+
+
+def current_version(session, key):
+    if key.endswith("*"):
+        return session.scalar(_sum_statement(key)) or 0
+    version = session.scalar(
+        select(TableVersion.version).where(TableVersion.name == key))
+    return version or 0
+
+
+def version_etag(key, version):
+    return f"{key.replace(':', '-')}-{version}"
+
+
+def current_etag(session, keys):
+    """
+    ETag for one version key, or for a tuple of keys read with one query
+    """
+    if isinstance(keys, str):
+        return version_etag(keys, current_version(session, keys))
+    versions = dict(session.execute(
+        select(TableVersion.name, TableVersion.version).where(TableVersion.name.in_(keys))).all())
+    for key in keys:
+        if key.endswith("*"):
+            versions[key] = current_version(session, key)
+    return "_".join(version_etag(key, versions.get(key, 0)) for key in keys)
+
+
+def versioned(key_func):
+    """
+    Add a strong ETag derived from the version of `key_func()` (a key or a
+    tuple of keys) and short-circuit matching `If-None-Match` requests with 304
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = current_etag(db.session, key_func())
+            if etag in request.if_none_match:
+                response = make_response("", 304)
+                response.set_etag(etag)
+                return response
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag)
+            return response
+        return wrapper
+    return decorator
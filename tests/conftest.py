@@ -0,0 +1,58 @@
+"""
+Fixtures: the API (APP_ROLE=api) on a fresh SQLite file per test.
+
+    pipenv run pytest
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+os.environ["APP_ROLE"] = "api"
+# app.py builds a module-level app on import; keep it off the developer's database
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'import.db')}"
+
+import pytest  # noqa: E402
+from app import create_app  # noqa: E402
+from models import db  # noqa: E402
+from cache import entity_cache  # noqa: E402
+
+
+@pytest.fixture
+def make_app(tmp_path, monkeypatch):
+    """
+    Build an app on `tmp_path/<name>.db` with extra environment variables, tables created
+    """
+    def make(name="primary", **env):
+        monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / name}.db")
+        for key, value in env.items():
+            monkeypatch.setenv(key, value)
+        app = create_app("api")
+        with app.app_context():
+            db.create_all()
+        return app
+
+    entity_cache.clear()
+    yield make
+    entity_cache.clear()
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def query_count(response):
+    """
+    Number of SQL statements the request ran, from its Server-Timing header
+    """
+    for metric in response.headers["Server-Timing"].split(","):
+        name, _, rest = metric.strip().partition(";")
+        if name == "db":
+            return int(rest.split('desc="')[1].split(" ")[0])
+    raise AssertionError("no db metric in Server-Timing")
@@ -0,0 +1,52 @@
+def test_over_a_group_rate_gets_429(make_app):
+    client = make_app(ADMISSION_LOOKUPS_RATE="1").test_client()
+    assert client.get("/planets/top").status_code == 200
+    response = client.get("/people/top")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_route_buckets_are_separate_from_their_group(make_app):
+    client = make_app(ADMISSION_ROUTE_PEOPLE_RATE="1").test_client()
+    assert client.get("/people").status_code == 200
+    assert client.get("/people").status_code == 429
+    # same `lists` group, other route
+    assert client.get("/planets").status_code == 200
+
+
+def test_client_buckets(make_app):
+    client = make_app(ADMISSION_LISTS_CLIENT_RATE="1", ADMISSION_CLIENT_HEADER="X-Api-Key").test_client()
+    assert client.get("/people", headers={"X-Api-Key": "a"}).status_code == 200
+    assert client.get("/people", headers={"X-Api-Key": "a"}).status_code == 429
+    assert client.get("/people", headers={"X-Api-Key": "b"}).status_code == 200
+
+
+def test_in_flight_cap_and_streamed_export(make_app):
+    app = make_app(ADMISSION_LISTS_IN_FLIGHT="1")
+    client = app.test_client()
+    client.post("/character", json={"name": "Luke"})
+    export = client.get("/export/people", buffered=False)
+    assert export.status_code == 200
+
+    # the export holds the only slot until its body is closed
+    busy = client.get("/people")
+    assert busy.status_code == 503
+    assert busy.headers["Retry-After"] == "1"
+    assert b"Luke" in b"".join(export.response)
+    export.close()
+    assert client.get("/people").status_code == 200
+    assert app.extensions["admission"].stats()["lists"]["in_flight"] == 0
+
+
+def test_stats_counts(make_app):
+    client = make_app(ADMISSION_ROUTE_PEOPLE_RATE="1", ADMISSION_LISTS_IN_FLIGHT="5").test_client()
+    client.get("/people")
+    client.get("/people")
+    client.get("/planets")
+    stats = client.get("/stats/admission").json
+    assert stats["lists"]["admitted"] == 2
+    assert stats["lists"]["in_flight"] == 0
+    assert stats["lists"]["limits"]["in_flight"] == 5
+    assert stats["routes"]["people"]["admitted"] == 1
+    assert stats["routes"]["people"]["rate_limited"] == 1
+    assert list(stats["routes"]) == ["people"]
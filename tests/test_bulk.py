@@ -0,0 +1,52 @@
+def test_non_scalar_values_fail_their_row(client):
+    response = client.post("/planets/bulk", json=[
+        {"name": "b"}, {"name": "a", "climate": {"x": 1}}, {"name": "c", "diameter": 12500},
+        {"name": "d", "gravity": ["1"]}, {"name": "e", "population": {"x": 1}}])
+    assert response.status_code == 200
+    assert response.json == {"created": 2, "skipped": 0, "failed": 3, "errors": [
+        {"index": 1, "message": "climate must be a string"},
+        {"index": 3, "message": "gravity must be a string"},
+        {"index": 4, "message": "population must be an integer"}]}
+    planets = {planet["name"]: planet for planet in client.get("/planets").json}
+    assert sorted(planets) == ["b", "c"]
+    assert planets["c"]["diameter"] == "12500"
+
+
+def test_existing_names_are_skipped(client):
+    client.post("/characters/bulk", json=[{"name": "Luke"}])
+    response = client.post("/characters/bulk", json=[{"name": "Luke"}, {"name": "Leia"}, {"name": "Leia"}])
+    assert response.json == {"created": 1, "skipped": 2, "failed": 0, "errors": []}
+
+
+def test_database_errors_fail_their_chunk(client, monkeypatch):
+    import bulk
+    from sqlalchemy.exc import OperationalError
+    from replicas import RoutingSession
+
+    execute = RoutingSession.execute
+
+    def failing_execute(self, statement, *args, **kwargs):
+        if getattr(statement, "is_insert", False) and statement.table.name == "planet":
+            params = args[0] if args else kwargs.get("params") or []
+            if any(row["name"] == "bad" for row in params):
+                raise OperationalError("INSERT", {}, Exception("disk I/O error"))
+        return execute(self, statement, *args, **kwargs)
+
+    monkeypatch.setattr(bulk, "BULK_CHUNK_SIZE", 2)
+    monkeypatch.setattr(RoutingSession, "execute", failing_execute)
+    response = client.post("/planets/bulk", json=[
+        {"name": "a"}, {"name": "b"}, {"name": "bad"}, {"name": "c"}, {"name": "d"}])
+    assert response.status_code == 200
+    assert response.json["created"] == 3
+    assert response.json["failed"] == 2
+    assert [error["index"] for error in response.json["errors"]] == [2, 3]
+
+
+def test_integer_columns_take_whole_numbers_only(client):
+    response = client.post("/planets/bulk", json=[
+        {"name": "a", "population": 12.7}, {"name": "b", "population": True},
+        {"name": "c", "population": 12.0}, {"name": "d", "population": "30"}])
+    assert response.json == {"created": 2, "skipped": 0, "failed": 2, "errors": [
+        {"index": 0, "message": "population must be an integer"},
+        {"index": 1, "message": "population must be an integer"}]}
+    assert sorted(planet["population"] for planet in client.get("/planets").json) == [12, 30]
@@ -0,0 +1,30 @@
+from models import db, Change, Planet, User
+from changes import record_changes
+
+
+def test_writes_are_logged_when_they_commit(app, client):
+    with app.app_context():
+        db.session.add(User(email="luke@example.com", password="secret"))
+        db.session.commit()
+    cursor = client.get("/changes").json["cursor"]
+    client.post("/planet", json={"name": "Hoth"})
+    client.post("/character", json={"name": "Luke"})
+    client.post("/favorite/planet/1?user_id=1")
+    client.delete("/favorite/planet/1?user_id=1")
+    feed = client.get(f"/changes?since={cursor}&user_id=1").json
+    assert [(change["table"], change["op"]) for change in feed["changes"]] == [
+        ("planets", "upsert"), ("people", "upsert"), ("favorites", "delete")]
+    assert feed["changes"][0]["data"]["name"] == "Hoth"
+    assert client.get(f"/changes?since={feed['cursor']}").json["changes"] == []
+
+
+def test_rolled_back_writes_are_not_logged(app):
+    with app.app_context():
+        db.session.add(Planet(name="Hoth"))
+        db.session.flush()
+        record_changes(db.session, "planet", [1])
+        db.session.rollback()
+        db.session.add(Planet(name="Dagobah"))
+        db.session.commit()
+        assert [(change.table_name, change.row_id) for change in db.session.scalars(
+            db.select(Change).order_by(Change.id))] == [("planet", 1)]
@@ -0,0 +1,70 @@
+import threading
+import time
+import pytest
+from groupcommit import GroupCommitter
+from models import db, Planet, User
+
+
+@pytest.fixture
+def committed(make_app):
+    app = make_app(FAVORITE_GROUP_COMMIT="1", GROUP_COMMIT_WINDOW_MS="0")
+    with app.app_context():
+        db.session.add_all([User(email="luke@example.com", password="secret"),
+                            Planet(name="Hoth"), Planet(name="Dagobah")])
+        db.session.commit()
+    return app
+
+
+def test_favorites_are_committed_in_batches(committed):
+    client = committed.test_client()
+    assert client.post("/favorite/planet/1?user_id=1").status_code == 201
+    assert client.post("/favorite/planet/1?user_id=1").status_code == 200
+    assert client.post("/favorite/planet/9?user_id=1").status_code == 404
+    assert committed.extensions["group_commit"].stats()["operations"] == 3
+
+
+def test_a_failing_batch_does_not_stop_the_thread(committed, monkeypatch):
+    committer = committed.extensions["group_commit"]
+    apply = GroupCommitter._apply
+    calls = []
+
+    def apply_once_broken(self, session, batch):
+        calls.append(len(batch))
+        if len(calls) == 1:
+            raise RuntimeError("connection lost during rollback")
+        return apply(self, session, batch)
+
+    monkeypatch.setattr(GroupCommitter, "_apply", apply_once_broken)
+    client = committed.test_client()
+    assert client.post("/favorite/planet/1?user_id=1").status_code == 500
+    assert client.post("/favorite/planet/2?user_id=1").status_code == 201
+    assert committer.thread.is_alive()
+    assert committer.stats()["failed_batches"] == 1
+
+
+def test_a_dead_thread_is_restarted(committed):
+    committer = committed.extensions["group_commit"]
+    client = committed.test_client()
+    assert client.post("/favorite/planet/1?user_id=1").status_code == 201
+    dead = threading.Thread(target=lambda: None)
+    dead.start()
+    dead.join()
+    committer.thread = dead
+    assert client.post("/favorite/planet/2?user_id=1").status_code == 201
+    assert committer.thread is not dead
+
+
+def test_waiting_for_a_commit_times_out_with_503(committed, monkeypatch):
+    committer = committed.extensions["group_commit"]
+    apply = GroupCommitter._apply
+
+    def slow_apply(self, session, batch):
+        time.sleep(0.3)
+        return apply(self, session, batch)
+
+    monkeypatch.setattr(GroupCommitter, "_apply", slow_apply)
+    monkeypatch.setattr(committer, "timeout", 0.05)
+    response = committed.test_client().post("/favorite/planet/1?user_id=1")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert committer.stats()["timeouts"] == 1
@@ -0,0 +1,44 @@
+import json
+import logging
+import pytest
+from sqlalchemy.exc import OperationalError
+from conftest import query_count
+from models import db
+
+
+def test_server_timing_header(client):
+    response = client.get("/people")
+    assert response.status_code == 200
+    names = [part.split(";")[0] for part in response.headers["Server-Timing"].split(", ")]
+    assert names == ["db", "serialize", "total"]
+    assert query_count(response) >= 1
+
+
+def test_slow_requests_log_their_sql(make_app, caplog):
+    client = make_app(SLOW_REQUEST_MS="0").test_client()
+    with caplog.at_level(logging.INFO, logger="api.timing"):
+        client.get("/people")
+    (record,) = [r for r in caplog.records if r.name == "api.timing"]
+    assert record.levelno == logging.WARNING
+    line = json.loads(record.getMessage())
+    assert line["endpoint"] == "api.people"
+    assert line["status"] == 200
+    assert line["slow"] is True
+    assert any("FROM character" in sql for _, sql in line["sql"])
+
+
+def test_timing_log_level(make_app, caplog):
+    client = make_app(TIMING_LOG_LEVEL="warning").test_client()
+    assert logging.getLogger("api.timing").level == logging.WARNING
+    client.get("/people")
+    assert not [r for r in caplog.records if r.name == "api.timing"]
+
+
+def test_failed_statements_leave_no_start_time(app):
+    with app.app_context():
+        with pytest.raises(OperationalError):
+            db.session.execute(db.text("SELECT * FROM missing"))
+        db.session.rollback()
+        connection = db.session.connection()
+        connection.execute(db.text("SELECT 1"))
+        assert connection.info["query_started"] == []
@@ -0,0 +1,30 @@
+import os
+from flask_migrate import Migrate, upgrade
+from app import create_app
+from models import db
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "migrations")
+
+
+def test_favorite_uniqueness_keeps_the_oldest_duplicate(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'migrated'}.db")
+    app = create_app("api")
+    Migrate(app, db, directory=MIGRATIONS)
+    with app.app_context():
+        upgrade(revision="f8242b5355ec")
+        db.session.execute(db.text(
+            "INSERT INTO user (id, email, password) VALUES (1, 'a@example.com', 'x'), (2, 'b@example.com', 'x')"))
+        db.session.execute(db.text("INSERT INTO planet (id, name) VALUES (1, 'Tatooine')"))
+        db.session.execute(db.text("INSERT INTO character (id, name) VALUES (1, 'Luke')"))
+        db.session.execute(db.text(
+            "INSERT INTO favorite (id, name, user_id, planet_id, character_id) VALUES "
+            "(1, 'a', 1, 1, NULL), (2, 'b', 1, 1, NULL), (3, 'c', 2, 1, NULL), "
+            "(4, 'd', 1, NULL, 1), (5, 'e', 1, NULL, 1)"))
+        db.session.commit()
+
+        upgrade(revision="3c1d7a9e5b42")
+        ids = db.session.scalars(db.text("SELECT id FROM favorite ORDER BY id")).all()
+        assert ids == [1, 3, 4]
+        # names no longer have to be unique
+        db.session.execute(db.text("INSERT INTO favorite (name, user_id, character_id) VALUES ('a', 2, 1)"))
+        db.session.commit()
@@ -0,0 +1,97 @@
+from models import db, Character, Planet
+
+DIAMETERS = ["10", "unknown", "30", "20", None, "30", "40"]
+
+
+def seed_planets(app):
+    with app.app_context():
+        for index, diameter in enumerate(DIAMETERS):
+            db.session.add(Planet(name=f"planet{index}", diameter=diameter))
+        db.session.commit()
+
+
+def walk(client, path):
+    """
+    Follow the next links of `path`; every row, one page after another
+    """
+    rows = []
+    while path:
+        response = client.get(path)
+        assert response.status_code == 200
+        rows += response.json
+        link = response.headers.get("Link")
+        path = link[1:link.index(">")] if link else None
+    return rows
+
+
+def test_sort_keeps_rows_without_a_value(app, client):
+    seed_planets(app)
+    ascending = [row["diameter"] for row in walk(client, "/planets?sort=diameter&limit=2")]
+    assert ascending == ["10", "20", "30", "30", "40", "unknown", None]
+    descending = [row["id"] for row in walk(client, "/planets?sort=-diameter&limit=2")]
+    assert descending == [7, 6, 3, 4, 1, 5, 2]
+    assert [row["id"] for row in client.get("/planets?sort=-diameter").json] == descending
+    assert [row["id"] for row in walk(client, "/planets?sort=-diameter&stream=1")] == descending
+
+
+def test_sort_keeps_characters_without_a_value(app, client):
+    with app.app_context():
+        db.session.add_all([Character(name="Luke", mass="77"), Character(name="Yoda"),
+                            Character(name="Han", mass="80")])
+        db.session.commit()
+    assert [row["name"] for row in walk(client, "/people?sort=-mass&limit=1")] == ["Han", "Luke", "Yoda"]
+
+
+def test_sorted_cursor_survives_deleting_its_row(app, client):
+    seed_planets(app)
+    first = client.get("/planets?sort=diameter&limit=3")
+    assert [row["id"] for row in first.json] == [1, 4, 3]
+    with app.app_context():
+        db.session.delete(db.session.get(Planet, 3))
+        db.session.commit()
+    cursor = first.headers["X-Next-Cursor"]
+    rest = client.get(f"/planets?sort=diameter&limit=10&after={cursor}")
+    assert [row["id"] for row in rest.json] == [6, 7, 2, 5]
+
+
+def test_sorted_cursor_is_not_moved_by_updating_its_row(app, client):
+    seed_planets(app)
+    first = client.get("/planets?sort=diameter&limit=3")
+    with app.app_context():
+        db.session.get(Planet, 3).diameter = "5"
+        db.session.commit()
+    rest = client.get(f"/planets?sort=diameter&limit=10&after={first.headers['X-Next-Cursor']}")
+    assert [row["id"] for row in rest.json] == [6, 7, 2, 5]
+
+
+def test_sort_key_is_not_in_the_payload(app, client):
+    seed_planets(app)
+    row = client.get("/planets?sort=diameter&fields=name&limit=1").json[0]
+    assert set(row) == {"id", "name"}
+
+
+def test_invalid_sorted_cursor(app, client):
+    assert client.get("/planets?sort=diameter&after=12").status_code == 400
+    assert client.get("/planets?sort=diameter&after=%%%").status_code == 400
+
+
+def test_ids_leave_unknown_ids_out(app, client):
+    seed_planets(app)
+    response = client.get("/planets?ids=3,99,1,3")
+    assert response.status_code == 200
+    assert sorted(planet["id"] for planet in response.json) == [1, 3]
+
+
+def test_ids_are_capped(app, client):
+    ids = ",".join(str(index) for index in range(1, 1002))
+    assert client.get(f"/planets?ids={ids}").status_code == 400
+    assert client.get(f"/planets?ids={ids.rpartition(',')[0]}").status_code == 200
+    assert client.get("/planets?ids=1,x").status_code == 400
+
+
+def test_range_filters_take_finite_numbers(app, client):
+    seed_planets(app)
+    response = client.get("/planets?min_diameter=15&max_diameter=30")
+    assert sorted(planet["diameter"] for planet in response.json) == ["20", "30", "30"]
+    for value in ("nan", "inf", "-inf", "big"):
+        assert client.get(f"/planets?min_diameter={value}").status_code == 400
@@ -0,0 +1,64 @@
+import threading
+import passwords
+from models import db
+
+
+def test_create_user_hashes_before_checking_out_a_connection(app, client, monkeypatch):
+    hash_password = passwords.hash_password
+    checked_out = []
+
+    def spy(password):
+        checked_out.append(db.engine.pool.checkedout())
+        return hash_password(password)
+
+    monkeypatch.setenv("PASSWORD_HASH_COST", "10")
+    monkeypatch.setattr("entities.hash_password", spy)
+    response = client.post("/user", json={"email": "luke@example.com", "password": "secret"})
+    assert response.status_code == 201
+    assert checked_out == [0]
+    with app.app_context():
+        stored = db.session.scalar(db.text("SELECT password FROM user"))
+    assert stored.startswith("scrypt:1024:8:1$")
+    assert client.post("/user", json={"email": "luke@example.com", "password": "x"}).status_code == 400
+
+
+def test_login_upgrades_plaintext_and_lower_cost_hashes(app, client, monkeypatch):
+    monkeypatch.setenv("PASSWORD_HASH_COST", "10")
+    with app.app_context():
+        db.session.execute(db.text(
+            "INSERT INTO user (email, password) VALUES ('leia@example.com', 'alderaan')"))
+        db.session.commit()
+
+    assert client.post("/login", json={"email": "leia@example.com", "password": "wrong"}).status_code == 401
+    assert client.post("/login", json={"email": "han@example.com", "password": "alderaan"}).status_code == 401
+    response = client.post("/login", json={"email": "leia@example.com", "password": "alderaan"})
+    assert response.status_code == 200
+    assert response.json["email"] == "leia@example.com"
+    with app.app_context():
+        stored = db.session.scalar(db.text("SELECT password FROM user"))
+    assert stored.startswith("scrypt:1024:8:1$")
+
+    monkeypatch.setenv("PASSWORD_HASH_COST", "11")
+    assert client.post("/login", json={"email": "leia@example.com", "password": "alderaan"}).status_code == 200
+    with app.app_context():
+        upgraded = db.session.scalar(db.text("SELECT password FROM user"))
+    assert upgraded.startswith("scrypt:2048:8:1$")
+    assert client.post("/login", json={"email": "leia@example.com", "password": "alderaan"}).status_code == 200
+    with app.app_context():
+        assert db.session.scalar(db.text("SELECT password FROM user")) == upgraded
+
+
+def test_full_hashing_queue_gets_503(client, monkeypatch):
+    pool = passwords.HashingPool(1, 1)
+    monkeypatch.setattr(passwords, "pool", pool)
+    started, release = threading.Event(), threading.Event()
+    busy = pool.submit(lambda: started.set() or release.wait())
+    started.wait()
+
+    response = client.post("/user", json={"email": "luke@example.com", "password": "secret"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert pool.stats()["rejected"] == 1
+    release.set()
+    busy.result()
+    assert pool.stats()["in_flight"] == 0
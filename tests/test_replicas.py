@@ -0,0 +1,92 @@
+"""
+Read replica routing, with two SQLite files standing in for the primary and a replica
+"""
+import pytest
+from models import db, Planet, User
+
+
+@pytest.fixture
+def replicated(make_app, tmp_path):
+    """
+    An app whose replica has tables but different rows: "Hoth" on the
+    primary, "Replica" on the replica, so a response tells who served it
+    """
+    app = make_app(DATABASE_REPLICA_URLS=f"sqlite:///{tmp_path / 'replica'}.db")
+    replica = app.extensions["replicas"].replicas[0].engine
+    db.metadata.create_all(replica)
+    with replica.begin() as connection:
+        connection.execute(db.insert(Planet), [{"name": "Replica"}])
+        connection.execute(db.insert(User), [{"email": "luke@example.com", "password": "secret"}])
+    with app.app_context():
+        db.session.add_all([User(email="luke@example.com", password="secret"), Planet(name="Hoth")])
+        db.session.commit()
+    return app
+
+
+def planet_names(response):
+    assert response.status_code == 200
+    return [planet["name"] for planet in response.json]
+
+
+def test_read_only_views_read_the_replica(replicated):
+    client = replicated.test_client()
+    assert planet_names(client.get("/planets")) == ["Replica"]
+    assert client.get("/planets/1?fields=name").json["name"] == "Replica"
+    assert replicated.extensions["replicas"].stats()["replica_requests"] == 2
+
+
+def test_entity_cache_is_filled_from_the_primary(replicated):
+    client = replicated.test_client()
+    assert client.get("/planets/1").json["name"] == "Hoth"
+    with replicated.app_context():
+        db.session.get(Planet, 1).name = "Hoth II"
+        db.session.commit()
+    # the replica hasn't seen the rename; the invalidated entry is refilled from the primary
+    assert client.get("/planets/1").json["name"] == "Hoth II"
+    assert client.get("/planets/1").json["name"] == "Hoth II"
+
+
+def test_writes_go_to_the_primary(replicated):
+    client = replicated.test_client()
+    assert client.post("/planet", json={"name": "Dagobah"}).status_code == 201
+    with replicated.app_context():
+        assert db.session.scalars(db.select(Planet.name).order_by(Planet.id)).all() == ["Hoth", "Dagobah"]
+
+
+def test_reads_stick_to_the_primary_after_favorite_planet(replicated):
+    client = replicated.test_client()
+    assert client.get("/users/favorites?user_id=1").json == []
+    assert client.post("/favorite/planet/1?user_id=1").status_code == 201
+    assert client.get_cookie("read_primary_until") is not None
+
+    favorites = client.get("/users/favorites?user_id=1").json
+    assert [favorite["planet_id"] for favorite in favorites] == [1]
+    assert planet_names(client.get("/planets")) == ["Hoth"]
+    # another client without the cookie still reads the replica
+    assert planet_names(replicated.test_client().get("/planets")) == ["Replica"]
+
+
+def test_sticky_cookie_expires(replicated, monkeypatch):
+    monkeypatch.setenv("REPLICA_STICKY_SECONDS", "0")
+    client = replicated.test_client()
+    client.post("/favorite/planet/1?user_id=1")
+    assert planet_names(client.get("/planets")) == ["Replica"]
+
+
+def test_x_read_primary_header(replicated):
+    client = replicated.test_client()
+    assert planet_names(client.get("/planets", headers={"X-Read-Primary": "1"})) == ["Hoth"]
+    assert planet_names(client.get("/planets")) == ["Replica"]
+
+
+def test_falls_back_to_the_primary_when_the_replica_is_down(make_app, tmp_path):
+    app = make_app(DATABASE_REPLICA_URLS=f"sqlite:///{tmp_path / 'missing' / 'replica'}.db")
+    with app.app_context():
+        db.session.add(Planet(name="Hoth"))
+        db.session.commit()
+    client = app.test_client()
+    assert planet_names(client.get("/planets")) == ["Hoth"]
+    assert planet_names(client.get("/planets")) == ["Hoth"]
+    stats = app.extensions["replicas"].stats()
+    assert stats["primary_fallbacks"] == 2
+    assert stats["replicas"][0]["healthy"] is False
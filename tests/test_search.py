@@ -0,0 +1,39 @@
+import pytest
+
+
+@pytest.fixture
+def named(client):
+    for name in ("Luke Skywalker", "Lumiya", "Anakin Skywalker", "Leia", "luminara"):
+        client.post("/character", json={"name": name})
+    client.post("/planet", json={"name": "Lutrillia"})
+    return client
+
+
+def names(rows):
+    return [row["name"] for row in rows]
+
+
+def test_substring_search(named):
+    result = named.get("/search?q=sky").json
+    assert names(result["people"]) == ["Luke Skywalker", "Anakin Skywalker"]
+    assert result["planets"] == []
+
+
+def test_short_terms_match_prefixes(named):
+    result = named.get("/search?q=Lu").json
+    assert names(result["people"]) == ["Lumiya", "luminara", "Luke Skywalker"]
+    assert names(result["planets"]) == ["Lutrillia"]
+    assert names(named.get("/people?q=L&limit=2").json) == ["Luke Skywalker", "Lumiya"]
+
+
+def test_matching_ignores_case_at_every_length(named):
+    # each keystroke narrows the results, whatever the case
+    for q, expected in (("l", {"Luke Skywalker", "Lumiya", "Leia", "luminara"}),
+                        ("lU", {"Luke Skywalker", "Lumiya", "luminara"}),
+                        ("LuK", {"Luke Skywalker"})):
+        assert set(names(named.get(f"/search?q={q}").json["people"])) == expected
+        assert set(names(named.get(f"/people?q={q}").json)) == expected
+
+
+def test_empty_term_is_rejected(named):
+    assert named.get("/search?q=%20").status_code == 400
@@ -0,0 +1,207 @@
+from conftest import query_count
+from favorites import add_favorite, remove_favorite
+from models import db, Character, Favorite, Planet, User
+
+
+def seed_users(app, count):
+    with app.app_context():
+        planet = Planet(name="Tatooine")
+        db.session.add(planet)
+        db.session.flush()
+        for index in range(count):
+            user = User(email=f"user{index}@example.com", password="secret")
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(Favorite(name="Tatooine", user_id=user.id, planet_id=planet.id))
+        db.session.commit()
+
+
+def users_queries(make_app, name, count):
+    app = make_app(name)
+    seed_users(app, count)
+    response = app.test_client().get("/users")
+    assert response.status_code == 200
+    assert len(response.json) == count
+    assert all(len(user["favorites"]) == 1 for user in response.json)
+    return query_count(response)
+
+
+def test_users_statement_count_does_not_grow_with_users(make_app):
+    assert users_queries(make_app, "few", 3) == users_queries(make_app, "many", 60)
+
+
+def test_users_page_statement_count_does_not_grow_with_page_size(make_app):
+    app = make_app()
+    seed_users(app, 60)
+    client = app.test_client()
+    small = client.get("/users?limit=5")
+    large = client.get("/users?limit=50")
+    assert len(small.json) == 5 and len(large.json) == 50
+    assert query_count(small) == query_count(large)
+
+
+def test_favorites_etag_changes_only_with_that_user(app, client):
+    seed_users(app, 2)
+    first = client.get("/users/favorites?user_id=1")
+    etag = first.headers["ETag"]
+    users_etag = client.get("/users").headers["ETag"]
+    assert client.get("/users/favorites?user_id=1", headers={"If-None-Match": etag}).status_code == 304
+
+    assert client.delete("/favorite/planet/1?user_id=2").status_code == 200
+    assert client.get("/users/favorites?user_id=1", headers={"If-None-Match": etag}).status_code == 304
+    changed = client.get("/users", headers={"If-None-Match": users_etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != users_etag
+
+    assert client.delete("/favorite/planet/1?user_id=1").status_code == 200
+    after = client.get("/users/favorites?user_id=1", headers={"If-None-Match": etag})
+    assert after.status_code == 200
+    assert after.json == []
+    assert after.headers["ETag"] != etag
+
+
+def test_duplicate_favorite_is_not_added_twice(app, client):
+    seed_users(app, 1)
+    client.post("/planet", json={"name": "Hoth"})
+    assert client.post("/favorite/planet/2?user_id=1").status_code == 201
+    response = client.post("/favorite/planet/2?user_id=1")
+    assert response.status_code == 200
+    assert response.json == {"message": "planet is already a favorite"}
+    assert len(client.get("/users/favorites?user_id=1").json) == 2
+    top = client.get("/planets/top").json[0]
+    assert (top["name"], top["favorite_count"]) == ("Hoth", 1)
+
+
+def test_removing_a_missing_favorite(app, client):
+    seed_users(app, 1)
+    client.post("/character", json={"name": "Luke"})
+    assert client.delete("/favorite/people/1?user_id=1").status_code == 404
+    assert client.delete("/favorite/planet/1?user_id=9").status_code == 404
+    assert client.delete("/favorite/planet/1?user_id=1").status_code == 200
+    assert client.delete("/favorite/planet/1?user_id=1").status_code == 404
+
+
+def test_insert_without_insert_or_ignore(app, client, monkeypatch):
+    monkeypatch.setattr("favorites._insert_ignore", lambda session: None)
+    seed_users(app, 1)
+    client.post("/planet", json={"name": "Hoth"})
+    assert client.post("/favorite/planet/1?user_id=1").status_code == 200
+    assert client.post("/favorite/planet/2?user_id=1").status_code == 201
+    assert client.post("/favorite/planet/2?user_id=1").status_code == 200
+    assert [favorite["planet_id"] for favorite in client.get("/users/favorites?user_id=1").json] == [1, 2]
+
+
+def test_favorites_batch_statuses(app, client):
+    seed_users(app, 1)
+    client.post("/planet", json={"name": "Hoth"})
+    client.post("/character", json={"name": "Luke"})
+    response = client.post("/users/favorites/batch?user_id=1", json={
+        "add": {"planets": [1, 2, 9], "characters": [1]},
+        "remove": {"characters": [7]},
+    })
+    assert response.status_code == 200
+    assert response.json == {
+        "planets": [
+            {"id": 1, "action": "add", "status": "already_favorite"},
+            {"id": 2, "action": "add", "status": "added"},
+            {"id": 9, "action": "add", "status": "not_found"},
+        ],
+        "characters": [
+            {"id": 1, "action": "add", "status": "added"},
+            {"id": 7, "action": "remove", "status": "not_favorite"},
+        ],
+    }
+
+    response = client.post("/users/favorites/batch?user_id=1", json={"remove": {"planets": [1, 2]}})
+    assert [entry["status"] for entry in response.json["planets"]] == ["removed", "removed"]
+    favorites = client.get("/users/favorites?user_id=1").json
+    assert [(favorite["planet_id"], favorite["character_id"]) for favorite in favorites] == [(None, 1)]
+
+
+def test_favorites_batch_rejects_bad_batches(app, client):
+    seed_users(app, 1)
+    conflict = client.post("/users/favorites/batch?user_id=1",
+                           json={"add": {"planets": [1]}, "remove": {"planets": [1]}})
+    assert conflict.status_code == 400
+    too_many = client.post("/users/favorites/batch?user_id=1",
+                           json={"add": {"planets": list(range(1, 1001)), "characters": [1]}})
+    assert too_many.status_code == 400
+    assert client.post("/users/favorites/batch?user_id=9", json={"add": {"planets": [1]}}).status_code == 404
+    # nothing was written
+    assert len(client.get("/users/favorites?user_id=1").json) == 1
+
+
+def expanded_favorites(app, client, planets):
+    with app.app_context():
+        user = User(email="leia@example.com", password="secret")
+        db.session.add_all([user, Character(name="Luke")])
+        db.session.flush()
+        for index in range(planets):
+            planet = Planet(name=f"planet{index}")
+            db.session.add(planet)
+            db.session.flush()
+            db.session.add(Favorite(name=planet.name, user_id=user.id, planet_id=planet.id))
+        db.session.add(Favorite(name="Luke", user_id=user.id, character_id=1))
+        db.session.commit()
+    response = client.get("/users/favorites?user_id=1&expand=1")
+    assert response.status_code == 200
+    return response
+
+
+def test_expanded_favorites_use_one_query(make_app):
+    few, many = make_app("few"), make_app("many")
+    small = expanded_favorites(few, few.test_client(), 1)
+    large = expanded_favorites(many, many.test_client(), 30)
+    # the version lookup, the user check and one joined SELECT
+    assert query_count(small) == query_count(large) == 3
+    assert len(large.json) == 31
+    assert large.json[0]["planet"]["name"] == "planet0" and large.json[0]["character"] is None
+    assert large.json[-1]["character"]["name"] == "Luke" and large.json[-1]["planet"] is None
+
+
+def planet_counts(app):
+    with app.app_context():
+        return dict(db.session.execute(db.select(Planet.name, Planet.favorite_count)).all())
+
+
+def test_favorite_counts_change_with_the_favorite(app, client):
+    seed_users(app, 1)
+    client.post("/planet", json={"name": "Hoth"})
+    with app.app_context():
+        add_favorite(db.session, 1, "planet", 2)
+        db.session.rollback()
+    assert planet_counts(app)["Hoth"] == 0
+    assert len(client.get("/users/favorites?user_id=1").json) == 1
+
+    assert client.post("/favorite/planet/2?user_id=1").status_code == 201
+    assert planet_counts(app)["Hoth"] == 1
+    with app.app_context():
+        remove_favorite(db.session, 1, "planet", 2)
+        db.session.rollback()
+    assert planet_counts(app)["Hoth"] == 1
+    assert client.delete("/favorite/planet/2?user_id=1").status_code == 200
+    assert planet_counts(app)["Hoth"] == 0
+
+
+def test_top_planets_break_ties_by_newest(app, client):
+    seed_users(app, 2)
+    for name in ("Hoth", "Naboo", "Endor"):
+        client.post("/planet", json={"name": name})
+    for planet_id, user_id in ((2, 1), (3, 1), (3, 2), (4, 1)):
+        client.post(f"/favorite/planet/{planet_id}?user_id={user_id}")
+    top = client.get("/planets/top?limit=3").json
+    assert [(planet["name"], planet["favorite_count"]) for planet in top] == [
+        ("Naboo", 2), ("Endor", 1), ("Hoth", 1)]
+
+
+def test_reconcile_counts_repairs_drift(app, client):
+    # seed_users writes favorites without their counts
+    seed_users(app, 3)
+    client.post("/planet", json={"name": "Hoth"})
+    with app.app_context():
+        db.session.execute(db.update(Planet).where(Planet.name == "Hoth").values(favorite_count=5))
+        db.session.commit()
+    result = app.test_cli_runner().invoke(args=["reconcile-counts"])
+    assert result.exit_code == 0
+    assert "planet: 2 counts fixed" in result.output
+    assert planet_counts(app) == {"Tatooine": 3, "Hoth": 0}